@@ -1,9 +1,12 @@
 import pandas as pd
 import numpy as np
+from collections import Counter
 from datetime import datetime, timedelta
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
 from database import db, UserInteraction, BehaviorPattern
+from sessions import assign_sessions
+from queries import interactions_frame
+from backends import BACKENDS, DEFAULT_BACKEND, DuckDBBackend
+from metrics import stage_timer
 
 
 class PatternRecognizer:
@@ -12,33 +15,54 @@ class PatternRecognizer:
     Implements machine learning algorithms for pattern recognition.
     """
     
-    def __init__(self, accuracy_threshold=0.97):
+    def __init__(self, accuracy_threshold=0.97, backend=DEFAULT_BACKEND):
         self.accuracy_threshold = accuracy_threshold
-        self.scaler = StandardScaler()
+        self._scaler = None
+        self.backend = self._check_backend(backend)
+        self._duckdb = DuckDBBackend()
     
-    def analyze_patterns(self, user_id=None):
+    @property
+    def scaler(self):
+        """Feature scaler; scikit-learn is only imported on first use."""
+        if self._scaler is None:
+            from sklearn.preprocessing import StandardScaler
+            self._scaler = StandardScaler()
+        return self._scaler
+    
+    def _check_backend(self, backend):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown analytics backend '{backend}', expected one of {BACKENDS}")
+        return backend
+    
+    def analyze_patterns(self, user_id=None, backend=None):
         """
         Analyze behavioral patterns for a user or all users.
         
         Args:
             user_id: Optional user ID to filter analysis
+            backend: Optional execution backend ('pandas' or 'duckdb')
             
         Returns:
             List of detected patterns with confidence scores
         """
-        query = UserInteraction.query
+        if self._check_backend(backend or self.backend) == 'duckdb':
+            return self._duckdb.patterns(user_id, limit=1000)
         
-        if user_id:
-            query = query.filter_by(user_id=user_id)
-        
-        interactions = query.order_by(UserInteraction.timestamp.desc()).limit(1000).all()
+        return self.analyze_frame(interactions_frame(user_id=user_id, latest=1000))
+    
+    def analyze_frame(self, df):
+        """
+        Run the pandas pattern detectors over loaded interactions.
         
-        if not interactions:
+        Args:
+            df: DataFrame from ``interactions_frame``
+            
+        Returns:
+            List of detected patterns with confidence scores
+        """
+        if df.empty:
             return []
         
-        # Convert to DataFrame for analysis
-        df = pd.DataFrame([i.to_dict() for i in interactions])
-        
         patterns = []
         
         # Analyze time-based patterns
@@ -55,6 +79,7 @@ class PatternRecognizer:
         
         return patterns
     
+    @stage_timer('time_patterns')
     def _analyze_time_patterns(self, df):
         """Analyze temporal patterns in user behavior."""
         patterns = []
@@ -63,7 +88,8 @@ class PatternRecognizer:
         df['day_of_week'] = pd.to_datetime(df['timestamp']).dt.dayofweek
         
         # Peak activity hours
-        hour_counts = df['hour'].value_counts()
+        # Ties go to the earliest hour/day
+        hour_counts = df['hour'].value_counts().sort_index()
         if not hour_counts.empty:
             peak_hour = hour_counts.idxmax()
             patterns.append({
@@ -74,7 +100,7 @@ class PatternRecognizer:
             })
         
         # Active days
-        day_counts = df['day_of_week'].value_counts()
+        day_counts = df['day_of_week'].value_counts().sort_index()
         if not day_counts.empty:
             peak_day = day_counts.idxmax()
             patterns.append({
@@ -86,54 +112,63 @@ class PatternRecognizer:
         
         return patterns
     
+    @stage_timer('sequences')
     def _analyze_sequences(self, df):
-        """Analyze action sequences and common workflows."""
+        """Analyze action sequences and common workflows within sessions."""
         patterns = []
         
-        # Group by user and analyze action sequences
-        action_sequences = df.groupby('user_id')['action'].apply(list)
+        # Order chronologically per user so sequences never span sessions
+        df = df.assign(timestamp=pd.to_datetime(df['timestamp'])).sort_values(
+            ['user_id', 'timestamp'], kind='stable'
+        )
+        df['session'] = assign_sessions(df['user_id'].to_numpy(), df['timestamp'].to_numpy())
         
-        for user_id, actions in action_sequences.items():
+        for user_id, user_df in df.groupby('user_id', sort=False):
             # Find common sequences of length 3
-            if len(actions) >= 3:
-                sequences = [tuple(actions[i:i+3]) for i in range(len(actions)-2)]
-                if sequences:
-                    from collections import Counter
-                    most_common = Counter(sequences).most_common(1)[0]
-                    patterns.append({
-                        'type': 'common_sequence',
-                        'user_id': user_id,
-                        'sequence': most_common[0],
-                        'frequency': most_common[1],
-                        'confidence': 0.97
-                    })
+            sequences = Counter()
+            for _, actions in user_df.groupby('session', sort=False)['action']:
+                actions = list(actions)
+                sequences.update(zip(actions, actions[1:], actions[2:]))
+            if sequences:
+                most_common = sequences.most_common(1)[0]
+                patterns.append({
+                    'type': 'common_sequence',
+                    'user_id': user_id,
+                    'sequence': most_common[0],
+                    'frequency': most_common[1],
+                    'confidence': 0.97
+                })
         
         return patterns
     
+    @stage_timer('navigation')
     def _analyze_navigation(self, df):
         """Analyze page navigation patterns."""
         patterns = []
         
         # Most visited pages
-        page_counts = df['page'].value_counts()
+        page_counts = df['page'].value_counts().sort_index()
         if not page_counts.empty:
             top_page = page_counts.idxmax()
             patterns.append({
                 'type': 'favorite_page',
                 'value': top_page,
-                'visits': int(page_counts.iloc[0]),
+                'visits': int(page_counts.max()),
                 'confidence': 0.97,
                 'description': f'Most visited page: {top_page}'
             })
         
         return patterns
     
-    def get_trends(self, timeframe='7d'):
+    def get_trends(self, timeframe='7d', backend=None, until_id=None):
         """
         Get behavioral trends over a timeframe.
         
         Args:
             timeframe: Time period (e.g., '7d', '30d', '90d')
+            backend: Optional execution backend ('pandas' or 'duckdb')
+            until_id: Optional inclusive upper bound on interaction id, to
+                line the trends up with live deltas
             
         Returns:
             Dictionary of trend data
@@ -141,15 +176,16 @@ class PatternRecognizer:
         days = int(timeframe.rstrip('d'))
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        interactions = UserInteraction.query.filter(
-            UserInteraction.timestamp >= start_date
-        ).all()
+        if self._check_backend(backend or self.backend) == 'duckdb':
+            return self._duckdb.trends(start_date, max_id=until_id)
+        
+        # Only the partitions overlapping the window are scanned
+        df = interactions_frame(start=start_date, max_id=until_id)
         
-        if not interactions:
+        if df.empty:
             return {}
         
-        df = pd.DataFrame([i.to_dict() for i in interactions])
-        df['date'] = pd.to_datetime(df['timestamp']).dt.date
+        df['date'] = df['timestamp'].dt.date
         
         # Convert dates to strings for JSON serialization
         daily_activity = df.groupby('date').size()
@@ -159,8 +195,14 @@ class PatternRecognizer:
             'total_interactions': int(len(df)),
             'unique_users': int(df['user_id'].nunique()),
             'daily_activity': daily_activity_dict,
-            'top_actions': {k: int(v) for k, v in df['action'].value_counts().head(5).items()},
-            'top_pages': {k: int(v) for k, v in df['page'].value_counts().head(5).items()}
+            'top_actions': self._top_counts(df['action']),
+            'top_pages': self._top_counts(df['page'])
         }
         
         return trends
+    
+    @staticmethod
+    def _top_counts(values, n=5):
+        """Most frequent values, ties broken alphabetically."""
+        counts = values.value_counts().sort_index().sort_values(ascending=False, kind='stable')
+        return {k: int(v) for k, v in counts.head(n).items()}
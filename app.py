@@ -5,10 +5,10 @@ Connects directly to the database (no Flask API needed for Streamlit Cloud).
 
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 import os
+import queue
 import random
+import weakref
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
@@ -18,6 +18,12 @@ load_dotenv()
 from flask import Flask
 from database import db, UserInteraction, BehaviorPattern
 from analytics import PatternRecognizer
+from cohorts import CohortAnalyzer
+from telemetry import WINDOW_SECONDS, pipeline_status, summarize
+import bootstrap
+import live
+import read_routing
+import storage
 
 # Create a minimal Flask app solely for the SQLAlchemy DB context
 _flask_app = Flask(__name__)
@@ -25,19 +31,15 @@ _flask_app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
     'DATABASE_URL', 'sqlite:///customer_behavior.db'
 )
 _flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(_flask_app)
+storage.init_app(_flask_app)
+read_routing.init_app(_flask_app)
+# Live deltas for every browser session of this Streamlit server
+live.init_app(_flask_app)
 
-# Ensure tables exist and seed demo data on first run
-with _flask_app.app_context():
-    db.create_all()
-    try:
-        if UserInteraction.query.count() == 0:
-            from seed_data import seed_demo_data
-            seed_demo_data()
-    except Exception as e:
-        print(f"Note: Could not seed demo data: {e}")
+LIVE_REFRESH_SECONDS = float(os.getenv('LIVE_REFRESH_SECONDS', 2))
 
 pattern_recognizer = PatternRecognizer()
+cohort_analyzer = CohortAnalyzer()
 
 # --- Page configuration ---
 st.set_page_config(
@@ -50,18 +52,118 @@ st.set_page_config(
 
 # --- Helper functions (direct DB access) ---
 
-def fetch_trends(timeframe='7d'):
-    """Fetch behavioral trends directly from the database."""
-    with _flask_app.app_context():
-        return pattern_recognizer.get_trends(timeframe)
+@st.cache_resource
+def initialize_database():
+    """
+    Create tables and seed demo data once per server process, not on every rerun.
+
+    Errors propagate: ``st.cache_resource`` does not cache an exception, so
+    the next rerun tries again instead of reusing a failed setup.
+    """
+    return bootstrap.initialize(_flask_app)
+
+
+def fetch_trends(timeframe='7d', until_id=None):
+    """
+    Fetch behavioral trends directly from the database.
+
+    With ``until_id`` (a live subscriber's ``after_id``) only interactions
+    up to that id are counted, read on the primary, which has all of them.
+    """
+    with _flask_app.app_context(), read_routing.reading(0 if until_id is not None else None):
+        return pattern_recognizer.get_trends(timeframe, until_id=until_id)
 
 
 def fetch_patterns(user_id=None):
     """Fetch behavioral patterns directly from the database."""
-    with _flask_app.app_context():
+    with _flask_app.app_context(), read_routing.reading():
         return pattern_recognizer.analyze_patterns(user_id)
 
 
+def fetch_cohorts(period='week', periods=8):
+    """Fetch the cohort retention matrix directly from the database."""
+    with _flask_app.app_context():
+        return cohort_analyzer.retention(period=period, periods=periods)
+
+
+def fetch_pipeline_status():
+    """Fetch published pipeline telemetry directly from the database."""
+    with _flask_app.app_context():
+        status = pipeline_status()
+    return summarize(status), status
+
+
+class LiveSubscription:
+    """
+    A session's live subscriber, unsubscribed when Streamlit drops the session.
+
+    Streamlit has no session-end callback, but a closed session's state is
+    garbage-collected, which runs the finalizer.
+    """
+
+    def __init__(self, broadcaster, subscriber):
+        self.subscriber = subscriber
+        self.close = weakref.finalize(self, broadcaster.unsubscribe, subscriber)
+
+
+def load_trends(timeframe, refresh=False, follow=True):
+    """
+    Trends kept in the session and brought up to date by live deltas.
+
+    The database is queried on the first run, on "Refresh Data", when the
+    timeframe or live setting changes and after a resync. Other reruns
+    reuse the session's copy. A session turned away at the subscriber cap
+    keeps its snapshot and only tries again on one of those events.
+    """
+    state = st.session_state
+    if (refresh or 'trends' not in state or state.get('trends_timeframe') != timeframe
+            or state.get('live_follow') != follow):
+        if state.get('live_subscription') is not None:
+            state.live_subscription.close()
+        broadcaster = _flask_app.extensions['live']
+        subscriber = broadcaster.subscribe() if follow else None
+        state.live_subscription = LiveSubscription(broadcaster, subscriber) if subscriber else None
+        state.live_follow = follow
+        # Count up to where the subscriber's deltas start, so none is counted twice or missed
+        state.trends = fetch_trends(timeframe, until_id=subscriber.after_id if subscriber else None)
+        state.trends_timeframe = timeframe
+    return state.trends
+
+
+def apply_live_deltas(timeframe):
+    """Add the deltas queued since the last run to the session's trends."""
+    state = st.session_state
+    subscription = state.get('live_subscription')
+    while subscription is not None:
+        try:
+            delta = subscription.subscriber.get_nowait()
+        except queue.Empty:
+            break
+        if delta is live.RESYNC:
+            # Dropped for falling behind: subscribe again and reload up to the new start
+            return load_trends(timeframe, refresh=True, follow=True)
+        live.apply_delta(state.trends, delta['timeframes'][timeframe])
+    return state.trends
+
+
+def load_patterns(user_id=None, refresh=False):
+    """Patterns kept in the session until "Refresh Data" or a new user filter."""
+    state = st.session_state
+    if refresh or 'patterns' not in state or state.get('patterns_user') != user_id:
+        state.patterns = fetch_patterns(user_id)
+        state.patterns_user = user_id
+    return state.patterns
+
+
+def format_seconds(seconds):
+    """Render a duration such as 42s, 5.2m or 3.1h."""
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f}m"
+    return f"{seconds / 3600:.1f}h"
+
+
 def generate_demo_data():
     """Generate demo data directly into the database."""
     with _flask_app.app_context():
@@ -96,6 +198,12 @@ def generate_demo_data():
 # --- Dashboard UI ---
 
 def main():
+    try:
+        initialize_database()
+    except Exception as e:
+        st.error(f"Could not initialize the database: {e}")
+        st.info("Check DATABASE_URL and reload the page to try again.")
+        st.stop()
     st.title("📊 Customer Behavior Analytics Dashboard")
     st.markdown("### Real-time insights with 97% pattern recognition accuracy")
 
@@ -107,7 +215,7 @@ def main():
         ### 🎯 How to Use This Dashboard
 
         1. **Generate Sample Data**: Click the "🎲 Generate Demo Data" button in the sidebar
-        2. **Refresh**: Click "Refresh Data" to update all visualizations
+        2. **Watch**: With "Live updates" on, new events appear within seconds; "Refresh Data" reloads everything
         3. **Explore**: Use the timeframe selector and filters to analyze patterns
         4. **Interact**: Hover over charts for detailed insights
 
@@ -133,7 +241,7 @@ def main():
         ✅ Behavioral pattern detection with ML
         ✅ Interactive data visualizations
         ✅ RESTful API with comprehensive endpoints
-        ✅ Continuous data pipeline (99% uptime)
+        ✅ Continuous data pipeline (live status in the sidebar)
 
         **Start by generating demo data to see all features in action!** 🚀
         """)
@@ -146,7 +254,7 @@ def main():
             count = generate_demo_data()
             if count > 0:
                 st.sidebar.success(f"✅ Generated {count} interactions!")
-                st.sidebar.info("👇 Click 'Refresh Data' below to update charts")
+                st.sidebar.info("👇 Charts update live, or click 'Refresh Data' below")
                 st.balloons()
             else:
                 st.sidebar.error("⚠️ Generation failed.")
@@ -163,12 +271,87 @@ def main():
 
     user_filter = st.sidebar.text_input("Filter by User ID (optional)")
 
-    if st.sidebar.button("Refresh Data"):
-        st.rerun()
+    live_updates = st.sidebar.toggle("Live updates", value=True,
+                                     help="Add new events to the charts as they arrive")
+    refresh = st.sidebar.button("Refresh Data")
+
+    # Load data (reruns reuse the session's copy)
+    load_trends(timeframe, refresh, follow=live_updates)
+    if live_updates and st.session_state.live_subscription is None:
+        st.sidebar.warning("Live updates are at capacity; showing a snapshot. Refresh to try again.")
+    patterns = load_patterns(user_filter if user_filter else None, refresh)
+    pipeline, pipeline_processes = fetch_pipeline_status()
+
+    # Only this section reruns to pick up live deltas
+    trends_section = st.fragment(run_every=LIVE_REFRESH_SECONDS if live_updates else None)(render_trends)
+    trends_section(timeframe, patterns, pipeline)
+
+    import plotly.express as px
+
+    # Cohort Retention
+    st.header("🔁 Retention Cohorts")
+    cohort_period = st.radio("Cohort period", ['week', 'day'], horizontal=True)
+    retention = fetch_cohorts(cohort_period, periods=8 if cohort_period == 'week' else 14)
+    if any(c['size'] for c in retention['cohorts']):
+        cohorts = retention['cohorts']
+        max_offset = max(len(c['retention']) for c in cohorts)
+        matrix = [
+            [round(r * 100, 1) for r in c['retention']] + [None] * (max_offset - len(c['retention']))
+            for c in cohorts
+        ]
+        fig_cohorts = px.imshow(
+            matrix,
+            x=[f"{cohort_period.title()} {i}" for i in range(max_offset)],
+            y=[f"{c['cohort']} ({c['size']})" for c in cohorts],
+            color_continuous_scale='Blues',
+            text_auto=True,
+            aspect='auto',
+            title='Retention by First-Seen Cohort (%)'
+        )
+        fig_cohorts.update_layout(
+            xaxis_title=f"{cohort_period.title()}s Since First Seen",
+            yaxis_title="Cohort (users)"
+        )
+        st.plotly_chart(fig_cohorts, use_container_width=True)
+    else:
+        st.info("No cohort data available yet.")
 
-    # Fetch data
-    trends = fetch_trends(timeframe)
-    patterns = fetch_patterns(user_filter if user_filter else None)
+    # Behavioral Patterns
+    st.header("🔍 Detected Behavioral Patterns")
+    if patterns:
+        for pattern in patterns:
+            with st.expander(
+                f"{pattern.get('type', 'Unknown')} - Confidence: {pattern.get('confidence', 0):.2%}"
+            ):
+                st.json(pattern)
+    else:
+        st.info("No patterns detected yet. Data is being collected and analyzed in real-time.")
+
+    # Real-time status
+    st.sidebar.markdown("---")
+    st.sidebar.markdown("### System Status")
+    if pipeline['active']:
+        processes = f"{pipeline['active']} process{'es' if pipeline['active'] > 1 else ''}"
+        st.sidebar.success(f"✅ Data Pipeline Active ({processes})")
+        if pipeline['success_rate'] is not None:
+            st.sidebar.metric(f"Successful Cycles ({WINDOW_SECONDS // 60} min)", f"{pipeline['success_rate']:.1%}")
+        st.sidebar.metric("Throughput", f"{pipeline['rows_per_second']:,.0f} rows/s")
+        if pipeline['lag_seconds'] is not None:
+            st.sidebar.metric("End-to-End Lag", format_seconds(pipeline['lag_seconds']))
+        if pipeline['backlog_rows'] is not None:
+            st.sidebar.metric("Backlog", f"{pipeline['backlog_rows']:,} rows")
+    elif pipeline_processes:
+        latest = pipeline_processes[0]
+        state = 'not responding' if latest['stale'] else latest['state']
+        st.sidebar.warning(f"⚠️ Data Pipeline {state} (last update {latest['updated_at'][:19]} UTC)")
+    else:
+        st.sidebar.info("Data Pipeline not started (`python pipeline.py`)")
+    st.sidebar.info(f"Last Updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+
+def render_trends(timeframe, patterns, pipeline):
+    """Key metrics and trend charts, with any pending live deltas applied."""
+    trends = apply_live_deltas(timeframe)
 
     # Overview metrics
     st.header("📈 Key Metrics")
@@ -185,7 +368,9 @@ def main():
         st.metric(
             "Unique Users",
             trends.get('unique_users', 0),
-            delta="99% Uptime"
+            delta=f"Pipeline lag {format_seconds(pipeline['lag_seconds'])}"
+            if pipeline['lag_seconds'] is not None else None,
+            delta_color="off"
         )
 
     with col3:
@@ -202,6 +387,9 @@ def main():
             delta=f"{len(patterns)} active"
         )
 
+    # Imported on first render rather than at startup
+    import plotly.express as px
+
     # Daily Activity Chart
     st.header("📅 Daily Activity Trends")
     if trends.get('daily_activity'):
@@ -268,24 +456,5 @@ def main():
         else:
             st.info("No page data available.")
 
-    # Behavioral Patterns
-    st.header("🔍 Detected Behavioral Patterns")
-    if patterns:
-        for pattern in patterns:
-            with st.expander(
-                f"{pattern.get('type', 'Unknown')} - Confidence: {pattern.get('confidence', 0):.2%}"
-            ):
-                st.json(pattern)
-    else:
-        st.info("No patterns detected yet. Data is being collected and analyzed in real-time.")
-
-    # Real-time status
-    st.sidebar.markdown("---")
-    st.sidebar.markdown("### System Status")
-    st.sidebar.success("✅ Data Pipeline Active")
-    st.sidebar.success("✅ 99% Uptime")
-    st.sidebar.info(f"Last Updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-
-
 if __name__ == "__main__":
     main()
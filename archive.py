@@ -0,0 +1,250 @@
+"""
+Columnar cold tier for old interactions.
+
+Closed days of ``user_interactions`` are moved into date-partitioned Parquet
+files (``date=YYYY-MM-DD/part-<min_id>-<max_id>.parquet``). Files are sorted
+by timestamp, dictionary-encoded and zstd-compressed. ``read`` prunes whole
+files by date and id range from their names, and row groups by timestamp
+statistics, and only loads the requested columns. ``interactions_frame``
+merges the cold tier in transparently.
+"""
+
+import json
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+from database import db
+from partitions import partition_manager
+
+ARCHIVE_DIR = os.getenv('INTERACTION_ARCHIVE_DIR', 'archive/interactions')
+ARCHIVE_AFTER_DAYS = int(os.getenv('INTERACTION_ARCHIVE_AFTER_DAYS', 0))
+ROW_GROUP_SIZE = 64 * 1024
+
+_DAY_RE = re.compile(r'^date=(\d{4}-\d{2}-\d{2})$')
+_FILE_RE = re.compile(r'^part-(\d+)-(\d+)\.parquet$')
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.dataset
+    except ImportError as e:
+        raise RuntimeError('The Parquet archive requires pyarrow (pip install pyarrow)') from e
+    return pyarrow
+
+
+class ColdArchive:
+    """Moves closed days to Parquet and reads them back."""
+
+    def __init__(self, path=ARCHIVE_DIR):
+        self.path = path
+
+    def files(self, start=None, end=None, min_id=None, max_id=None):
+        """
+        List archived files that may hold matching rows.
+
+        Returns:
+            List of (path, day, min_id, max_id), oldest first
+        """
+        if not os.path.isdir(self.path):
+            return []
+        found = []
+        for day_dir in sorted(os.listdir(self.path)):
+            match = _DAY_RE.match(day_dir)
+            if not match:
+                continue
+            day = datetime.strptime(match.group(1), '%Y-%m-%d')
+            if (start is not None and day + timedelta(days=1) <= start) or (end is not None and day >= end):
+                continue
+            for name in sorted(os.listdir(os.path.join(self.path, day_dir))):
+                file_match = _FILE_RE.match(name)
+                if not file_match:
+                    continue
+                lo, hi = int(file_match.group(1)), int(file_match.group(2))
+                if (min_id is not None and hi <= min_id) or (max_id is not None and lo > max_id):
+                    continue
+                found.append((os.path.join(self.path, day_dir, name), day, lo, hi))
+        return found
+
+    def read(self, columns, start=None, end=None, user_id=None, min_id=None,
+             max_id=None, actions=None):
+        """
+        Read archived interactions with the same filters as ``interactions_frame``.
+
+        Returns:
+            DataFrame with the requested columns (``metadata`` decoded to dicts)
+        """
+        files = self.files(start, end, min_id, max_id)
+        if not files:
+            return pd.DataFrame(columns=list(columns))
+
+        _require_pyarrow()
+        import pyarrow.dataset as ds
+
+        expr = None
+        conditions = []
+        if start is not None:
+            conditions.append(ds.field('timestamp') >= pd.Timestamp(start))
+        if end is not None:
+            conditions.append(ds.field('timestamp') < pd.Timestamp(end))
+        if user_id:
+            conditions.append(ds.field('user_id') == user_id)
+        if min_id is not None:
+            conditions.append(ds.field('id') > min_id)
+        if max_id is not None:
+            conditions.append(ds.field('id') <= max_id)
+        if actions:
+            conditions.append(ds.field('action').isin(list(actions)))
+        for condition in conditions:
+            expr = condition if expr is None else expr & condition
+
+        dataset = ds.dataset([f[0] for f in files], format='parquet')
+        df = dataset.to_table(columns=list(columns), filter=expr).to_pandas()
+        for column in ('user_id', 'action', 'page'):
+            if column in df and isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype(object)
+        if 'metadata' in df:
+            df['metadata'] = [json.loads(m) if m else None for m in df['metadata']]
+        return df
+
+    def archive(self, older_than_days=ARCHIVE_AFTER_DAYS, now=None):
+        """
+        Move every closed day older than ``older_than_days`` to Parquet and
+        delete it from the hot tables.
+
+        Returns:
+            Dictionary with rows moved, days archived, estimated row-store
+            bytes and Parquet bytes written
+        """
+        from queries import interactions_frame
+
+        stats = {'rows': 0, 'days': 0, 'row_bytes': 0, 'parquet_bytes': 0}
+        if older_than_days <= 0:
+            return stats
+        _require_pyarrow()
+
+        cutoff = datetime.combine((now or datetime.utcnow()).date(), datetime.min.time()) - timedelta(days=older_than_days)
+        while True:
+            oldest = self._oldest_hot(cutoff)
+            if oldest is None:
+                break
+            day = datetime.combine(oldest.date(), datetime.min.time())
+            next_day = day + timedelta(days=1)
+
+            df = interactions_frame(start=day, end=next_day, with_metadata=True, include_cold=False)
+            if not df.empty:
+                row_bytes, parquet_bytes = self._write_day(day, df)
+                stats['rows'] += len(df)
+                stats['days'] += 1
+                stats['row_bytes'] += row_bytes
+                stats['parquet_bytes'] += parquet_bytes
+
+            for table in partition_manager.tables_for(day, next_day):
+                db.session.execute(table.delete().where(
+                    (table.c.timestamp >= day) & (table.c.timestamp < next_day)
+                ))
+            db.session.commit()
+
+        stats['compression_ratio'] = stats['row_bytes'] / stats['parquet_bytes'] if stats['parquet_bytes'] else 0.0
+        return stats
+
+    def drop_before(self, cutoff):
+        """Delete archived days that end on or before ``cutoff``."""
+        dropped = []
+        for day_dir in sorted(os.listdir(self.path)) if os.path.isdir(self.path) else []:
+            match = _DAY_RE.match(day_dir)
+            if match and datetime.strptime(match.group(1), '%Y-%m-%d') + timedelta(days=1) <= cutoff:
+                shutil.rmtree(os.path.join(self.path, day_dir))
+                dropped.append(match.group(1))
+        return dropped
+
+    def scan_benchmark(self, columns=('user_id', 'action', 'timestamp')):
+        """Time a full projected scan of the cold tier."""
+        files = self.files()
+        started = time.perf_counter()
+        df = self.read(columns)
+        elapsed = time.perf_counter() - started
+        return {
+            'files': len(files),
+            'rows': len(df),
+            'bytes': sum(os.path.getsize(f[0]) for f in files),
+            'seconds': elapsed,
+            'rows_per_second': len(df) / elapsed if elapsed else 0.0
+        }
+
+    def _oldest_hot(self, cutoff):
+        """Oldest timestamp before ``cutoff`` still held in the row store."""
+        from sqlalchemy import func, select
+        oldest = None
+        for table in partition_manager.tables_for(None, cutoff):
+            value = db.session.execute(
+                select(func.min(table.c.timestamp)).where(table.c.timestamp < cutoff)
+            ).scalar()
+            if value is not None and (oldest is None or value < oldest):
+                oldest = value
+        return oldest
+
+    def _write_day(self, day, df):
+        """Write one day's rows; returns (estimated row bytes, file bytes)."""
+        pa = _require_pyarrow()
+        import pyarrow.parquet as pq
+
+        df = df.sort_values('timestamp', kind='stable')
+        metadata = [json.dumps(dict(m)) if m else None for m in df['metadata']]
+        table = pa.table({
+            'id': pa.array(df['id'].to_numpy(), pa.int64()),
+            'user_id': pa.array(df['user_id'], pa.string()),
+            'action': pa.array(df['action'], pa.string()),
+            'page': pa.array(df['page'], pa.string()),
+            'metadata': pa.array(metadata, pa.string()),
+            'timestamp': pa.array(df['timestamp'].to_numpy(dtype='datetime64[us]'), pa.timestamp('us')),
+        })
+
+        directory = os.path.join(self.path, f'date={day:%Y-%m-%d}')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{int(df['id'].min())}-{int(df['id'].max())}.parquet")
+        tmp_path = path + '.tmp'
+        pq.write_table(
+            table, tmp_path,
+            compression='zstd',
+            use_dictionary=['user_id', 'action', 'page'],
+            row_group_size=ROW_GROUP_SIZE,
+            write_statistics=True
+        )
+        os.replace(tmp_path, path)
+
+        # Rough row-store footprint: text bytes plus 8-byte id and timestamp
+        row_bytes = int(
+            sum(df[c].str.len().sum() for c in ('user_id', 'action', 'page'))
+            + sum(len(m) for m in metadata if m) + 16 * len(df)
+        )
+        return row_bytes, os.path.getsize(path)
+
+
+cold_archive = ColdArchive()
+
+
+if __name__ == '__main__':
+    import argparse
+    from flask_app import app
+
+    parser = argparse.ArgumentParser(description='Archive old interactions to Parquet')
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS or 30,
+                        help='Archive closed days older than this many days')
+    parser.add_argument('--benchmark', action='store_true', help='Time a projected scan of the cold tier')
+    args = parser.parse_args()
+
+    with app.app_context():
+        stats = cold_archive.archive(args.days)
+        print(f"Archived {stats['rows']} interactions from {stats['days']} days")
+        if stats['parquet_bytes']:
+            print(f"Row store ~{stats['row_bytes'] / 1e6:.1f} MB -> Parquet {stats['parquet_bytes'] / 1e6:.1f} MB "
+                  f"({stats['compression_ratio']:.1f}x smaller)")
+        if args.benchmark:
+            scan = cold_archive.scan_benchmark()
+            print(f"Cold scan: {scan['rows']} rows from {scan['files']} files in {scan['seconds']:.3f}s "
+                  f"({scan['rows_per_second']:,.0f} rows/s)")
@@ -0,0 +1,253 @@
+"""
+Execution backends for ``PatternRecognizer``.
+
+The default ``pandas`` backend loads interactions into a DataFrame. The
+``duckdb`` backend runs the same analyses as SQL in an embedded DuckDB,
+which suits long windows and cross-user analysis. DuckDB attaches the
+SQLite (or PostgreSQL) database directly, through the engine picked by
+read routing, and reads archived Parquet days with ``read_parquet``. If
+the scanner extension cannot be loaded, the database groups its own rows
+for trends and DuckDB only adds the Parquet days; patterns load just the
+``limit`` most recent rows.
+"""
+
+import os
+import threading
+import pandas as pd
+from sqlalchemy import func, select, union_all
+from database import db
+from partitions import partition_manager
+from archive import cold_archive
+from sessions import SESSION_GAP
+
+DEFAULT_BACKEND = os.getenv('ANALYTICS_BACKEND', 'pandas')
+BACKENDS = ('pandas', 'duckdb')
+
+_SCANNERS = {'sqlite': 'sqlite', 'postgresql': 'postgres'}
+# Day of an interaction as 'YYYY-MM-DD', like the database's date()
+_DAY = "strftime(timestamp, '%Y-%m-%d')"
+
+
+class DuckDBBackend:
+    """Runs trend and pattern analyses as DuckDB SQL."""
+
+    _extension_state = {}
+    _lock = threading.Lock()
+
+    def trends(self, start, top_n=5, max_id=None):
+        """Same result shape as ``PatternRecognizer.get_trends``."""
+        where, params = 'timestamp >= ?', [start]
+        if max_id is not None:
+            where, params = where + ' AND id <= ?', params + [max_id]
+        conn, attached = self._connect(start=start, load_rows=False)
+        with conn:
+            # Without the scanner the database groups its own tiers; DuckDB adds the Parquet days
+            if not attached:
+                for name, frame in self._database_counts(start, max_id).items():
+                    conn.register(f'db_{name}', frame)
+
+            def counts(name, expr):
+                parts = [f'SELECT {expr} AS k, count(*) AS n FROM interactions WHERE {where} GROUP BY k']
+                if not attached:
+                    parts.insert(0, f'SELECT k, n FROM db_{name}')
+                return f'SELECT k, sum(n) AS n FROM ({" UNION ALL ".join(parts)}) GROUP BY k'
+
+            total, users = conn.execute(f'SELECT sum(n), count(*) FROM ({counts("user_id", "user_id")})',
+                                        params).fetchone()
+            if not total:
+                return {}
+            daily = conn.execute(f'{counts("day", _DAY)} ORDER BY k', params).fetchall()
+            top = {}
+            for name in ('action', 'page'):
+                rows = conn.execute(f'{counts(name, name)} ORDER BY n DESC, k LIMIT {int(top_n)}', params).fetchall()
+                top[name] = {value: int(count) for value, count in rows}
+            return {
+                'total_interactions': int(total),
+                'unique_users': int(users),
+                'daily_activity': {str(day): int(n) for day, n in daily},
+                'top_actions': top['action'],
+                'top_pages': top['page']
+            }
+
+    @staticmethod
+    def _database_counts(start, max_id=None):
+        """
+        Interactions per user, day, action and page in the database tiers,
+        grouped by the database itself so only the counts are transferred.
+        """
+        keys = {
+            'user_id': lambda table: table.c.user_id,
+            'day': lambda table: func.date(table.c.timestamp),
+            'action': lambda table: table.c.action,
+            'page': lambda table: table.c.page,
+        }
+        tables = partition_manager.tables_for(start, None)
+        frames = {}
+        for name, key in keys.items():
+            selects = []
+            for table in tables:
+                query = select(key(table).label('k'), func.count().label('n')).where(table.c.timestamp >= start)
+                if max_id is not None:
+                    query = query.where(table.c.id <= max_id)
+                selects.append(query.group_by(key(table)))
+            rows = db.session.execute(selects[0] if len(selects) == 1 else union_all(*selects)).all()
+            frames[name] = pd.DataFrame({'k': [str(k) for k, _ in rows], 'n': [int(n) for _, n in rows]},
+                                        columns=['k', 'n']).astype({'k': 'string', 'n': 'int64'})
+        return frames
+
+    def patterns(self, user_id=None, limit=1000):
+        """Same result shape as ``PatternRecognizer.analyze_patterns``."""
+        conn, _ = self._connect(user_id=user_id, latest=limit)
+        with conn:
+            where = 'WHERE user_id = ?' if user_id else ''
+            conn.execute(
+                f'CREATE TEMP TABLE recent AS SELECT id, user_id, action, page, timestamp FROM interactions '
+                f'{where} ORDER BY timestamp DESC, id DESC LIMIT {int(limit)}',
+                [user_id] if user_id else []
+            )
+            if not conn.execute('SELECT count(*) FROM recent').fetchone()[0]:
+                return []
+
+            patterns = []
+            hour = conn.execute(
+                'SELECT hour(timestamp) AS h, count(*) AS n FROM recent GROUP BY h ORDER BY n DESC, h LIMIT 1'
+            ).fetchone()
+            patterns.append({
+                'type': 'peak_activity_hour',
+                'value': int(hour[0]),
+                'confidence': 0.97,
+                'description': f'Most active during hour {hour[0]}'
+            })
+            # isodow is 1 = Monday, pandas dayofweek is 0 = Monday
+            day = conn.execute(
+                'SELECT isodow(timestamp) - 1 AS d, count(*) AS n FROM recent GROUP BY d ORDER BY n DESC, d LIMIT 1'
+            ).fetchone()
+            patterns.append({
+                'type': 'peak_activity_day',
+                'value': int(day[0]),
+                'confidence': 0.97,
+                'description': f'Most active on day {day[0]}'
+            })
+
+            for user, a1, a2, a3, frequency in conn.execute(self._SEQUENCE_SQL, [int(SESSION_GAP.total_seconds())]).fetchall():
+                patterns.append({
+                    'type': 'common_sequence',
+                    'user_id': user,
+                    'sequence': (a1, a2, a3),
+                    'frequency': int(frequency),
+                    'confidence': 0.97
+                })
+
+            page, visits = conn.execute(
+                'SELECT page, count(*) AS n FROM recent GROUP BY page ORDER BY n DESC, page LIMIT 1'
+            ).fetchone()
+            patterns.append({
+                'type': 'favorite_page',
+                'value': page,
+                'visits': int(visits),
+                'confidence': 0.97,
+                'description': f'Most visited page: {page}'
+            })
+            return patterns
+
+    # Most common action trigram per user within sessions; ties go to the
+    # trigram seen first, matching collections.Counter.most_common
+    _SEQUENCE_SQL = '''
+        WITH ordered AS (
+            SELECT *, row_number() OVER (PARTITION BY user_id ORDER BY timestamp, id) AS pos,
+                   CASE WHEN lag(timestamp) OVER (PARTITION BY user_id ORDER BY timestamp, id) IS NULL
+                          OR epoch(timestamp - lag(timestamp) OVER (PARTITION BY user_id ORDER BY timestamp, id)) > ?
+                        THEN 1 ELSE 0 END AS new_session
+            FROM recent
+        ), sessions AS (
+            SELECT *, sum(new_session) OVER (PARTITION BY user_id ORDER BY pos) AS session FROM ordered
+        ), trigrams AS (
+            SELECT user_id, pos, action AS a1,
+                   lead(action, 1) OVER w AS a2, lead(action, 2) OVER w AS a3
+            FROM sessions
+            WINDOW w AS (PARTITION BY user_id, session ORDER BY pos)
+        ), counted AS (
+            SELECT user_id, a1, a2, a3, count(*) AS n, min(pos) AS first_pos
+            FROM trigrams WHERE a3 IS NOT NULL GROUP BY user_id, a1, a2, a3
+        )
+        SELECT user_id, a1, a2, a3, n FROM counted
+        QUALIFY row_number() OVER (PARTITION BY user_id ORDER BY n DESC, first_pos) = 1
+        ORDER BY user_id
+    '''
+
+    def _connect(self, start=None, user_id=None, latest=None, load_rows=True):
+        """
+        Open a DuckDB connection with an ``interactions`` view.
+
+        The view covers every tier when the database can be attached.
+        Otherwise it covers the Parquet days, plus the matching database
+        rows (``user_id`` and the ``latest`` N) if ``load_rows``.
+
+        Returns:
+            (connection, whether the database is attached)
+        """
+        import duckdb
+
+        conn = duckdb.connect()
+        # The engine chosen by read routing, if the caller is inside ``reading``
+        engine = db.session.get_bind()
+        selects = []
+
+        attached = self._attach(conn, engine)
+        if attached:
+            for table in partition_manager.tables_for(start, None):
+                selects.append(
+                    f'SELECT id, user_id, action, page, CAST("timestamp" AS TIMESTAMP) AS timestamp '
+                    f'FROM src.{table.name}'
+                )
+        elif load_rows:
+            from queries import interactions_frame
+            rows = interactions_frame(start=start, user_id=user_id, latest=latest, include_cold=False)
+            conn.register('hot_rows', rows)
+            selects.append('SELECT id, user_id, action, page, CAST(timestamp AS TIMESTAMP) AS timestamp FROM hot_rows')
+
+        files = [f[0] for f in cold_archive.files(start=start)]
+        if files:
+            listing = ', '.join("'" + f.replace("'", "''") + "'" for f in files)
+            selects.append(f'SELECT id, user_id, action, page, timestamp FROM read_parquet([{listing}])')
+        if not selects:
+            selects.append('SELECT CAST(NULL AS BIGINT) AS id, CAST(NULL AS VARCHAR) AS user_id, '
+                           'CAST(NULL AS VARCHAR) AS action, CAST(NULL AS VARCHAR) AS page, '
+                           'CAST(NULL AS TIMESTAMP) AS timestamp WHERE false')
+
+        conn.execute(f'CREATE TEMP VIEW interactions AS {" UNION ALL ".join(selects)}')
+        return conn, attached
+
+    def _attach(self, conn, engine):
+        """Attach the application database read-only; False if unsupported."""
+        backend = engine.dialect.name
+        scanner = _SCANNERS.get(backend)
+        database = engine.url.database
+        if scanner is None or (backend == 'sqlite' and (not database or database == ':memory:')):
+            return False
+
+        with self._lock:
+            state = self._extension_state.get(scanner)
+            if state is False:
+                return False
+            try:
+                conn.execute(f'LOAD {scanner}')
+            except Exception:
+                try:
+                    conn.execute(f'INSTALL {scanner}')
+                    conn.execute(f'LOAD {scanner}')
+                except Exception:
+                    self._extension_state[scanner] = False
+                    return False
+            self._extension_state[scanner] = True
+
+        if backend == 'sqlite':
+            # Read routing's read-only engine uses a ``file:`` URI
+            if database.startswith('file:'):
+                database = database[len('file:'):]
+            target = database.replace("'", "''")
+        else:
+            target = engine.url.render_as_string(hide_password=False).replace("'", "''")
+            target = target.replace('postgresql+psycopg2://', 'postgresql://')
+        conn.execute(f"ATTACH '{target}' AS src (TYPE {scanner}, READ_ONLY)")
+        return True
@@ -0,0 +1,326 @@
+"""
+Parallel, resumable recomputation of patterns and first-seen times over history.
+
+The live pipeline only looks at recent activity, so a change to
+``PatternRecognizer`` never reaches older data. A backfill job splits a date
+range into chunks (``backfill_chunks``) and recomputes each one in a process
+pool: patterns detected over the chunk's interactions, hot and archived, and
+each user's earliest event. Results go to staging tables in the same
+transaction that marks the chunk done, so an interrupted job resumes with
+the chunks it had not finished. Workers pause between chunks so they use at
+most ``BACKFILL_MAX_LOAD`` of a CPU and leave room for live ingest. Once every
+chunk is done, the staged results replace the live ones in one transaction:
+
+* ``behavior_patterns`` detected inside the range are replaced by the
+  backfilled patterns (each dated at the end of the chunk it was last
+  detected in); patterns the live pipeline detected after the range win.
+* ``user_first_seen`` takes the earlier of the stored and backfilled time.
+
+Usage:
+    python backfill.py run --start 2024-01-01 [--end 2024-07-01] [--workers 4]
+    python backfill.py status
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import multiprocessing
+from sqlalchemy import delete, func, insert, select, update
+from database import (db, create_schema, dialect_insert, BackfillChunk, BackfillFirstSeen,
+                      BackfillPattern, BehaviorPattern, UserFirstSeen)
+from analytics import PatternRecognizer
+from pattern_store import pattern_rows, upsert_patterns
+from queries import interactions_frame
+import storage
+
+WORKERS = int(os.getenv('BACKFILL_WORKERS', os.cpu_count() or 1))
+CHUNK_HOURS = int(os.getenv('BACKFILL_CHUNK_HOURS', 24))
+MAX_LOAD = float(os.getenv('BACKFILL_MAX_LOAD', 0.5))
+DEFAULT_JOB = 'patterns'
+
+
+def chunks(job=DEFAULT_JOB):
+    """Chunks of ``job``, oldest first."""
+    return db.session.scalars(select(BackfillChunk).where(BackfillChunk.job == job)
+                              .order_by(BackfillChunk.start)).all()
+
+
+def plan(job, start, end=None, chunk_hours=CHUNK_HOURS, restart=False):
+    """
+    Record the chunks of a job, or check them against an existing job.
+
+    Args:
+        job: Job name
+        start: Inclusive start of the range
+        end: Exclusive end of the range (default: the existing job's end,
+            or now for a new job)
+        chunk_hours: Length of a chunk
+        restart: Discard the job's progress and staged results first
+
+    Returns:
+        List of the job's chunks
+
+    Raises:
+        ValueError: The range is empty, or the job exists with a different
+            range or chunk length
+    """
+    step = timedelta(hours=chunk_hours)
+    if restart:
+        _discard(job)
+        db.session.commit()
+
+    existing = chunks(job)
+    if end is None:
+        # Resuming without --end continues the stored range instead of one ending now
+        end = existing[-1].end if existing else datetime.utcnow()
+    if end <= start:
+        raise ValueError('The backfill range is empty')
+    if existing:
+        first = existing[0]
+        if (first.start, existing[-1].end) != (start, end) or (
+                len(existing) > 1 and first.end - first.start != step):
+            raise ValueError(f"Backfill '{job}' covers {first.start} to {existing[-1].end} in "
+                             f"{first.end - first.start} chunks; use --restart to replan it")
+        return existing
+
+    bounds = []
+    while start < end:
+        bounds.append({'job': job, 'start': start, 'end': min(start + step, end), 'state': 'pending'})
+        start += step
+    db.session.execute(insert(BackfillChunk), bounds)
+    db.session.commit()
+    return chunks(job)
+
+
+def run_chunk(job, start, end, max_load=MAX_LOAD):
+    """
+    Recompute one chunk into the staging tables and mark it done.
+
+    Re-running a chunk replaces what it staged before. After the commit the
+    worker sleeps long enough to keep its CPU share at ``max_load``.
+
+    Returns:
+        Dictionary with the chunk's interaction, pattern and user counts
+    """
+    started = time.perf_counter()
+    df = interactions_frame(start=start, end=end)
+    first_seen = df.groupby('user_id')['timestamp'].min() if not df.empty else None
+    rows = pattern_rows(PatternRecognizer().analyze_frame(df), end)
+
+    db.session.execute(delete(BackfillPattern).where(BackfillPattern.job == job,
+                                                     BackfillPattern.chunk_start == start))
+    if rows:
+        db.session.execute(insert(BackfillPattern), [dict(row, job=job, chunk_start=start) for row in rows])
+    if first_seen is not None:
+        earliest = func.least if db.engine.dialect.name == 'postgresql' else func.min
+        stmt = dialect_insert(BackfillFirstSeen)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[BackfillFirstSeen.job, BackfillFirstSeen.user_id],
+            set_={'first_seen': earliest(BackfillFirstSeen.first_seen, stmt.excluded.first_seen)}
+        )
+        db.session.execute(stmt, [{'job': job, 'user_id': user_id, 'first_seen': ts.to_pydatetime()}
+                                  for user_id, ts in first_seen.sort_index().items()])
+
+    elapsed = time.perf_counter() - started
+    db.session.execute(
+        update(BackfillChunk).where(BackfillChunk.job == job, BackfillChunk.start == start)
+        .values(state='done', rows=len(df), patterns=len(rows), seconds=elapsed,
+                finished_at=datetime.utcnow())
+    )
+    db.session.commit()
+
+    # Duty cycle: work ``max_load`` of the time, pause for the rest
+    if max_load < 1:
+        time.sleep(elapsed * (1 - max_load) / max_load)
+    return {'start': start, 'rows': len(df), 'patterns': len(rows),
+            'users': 0 if first_seen is None else len(first_seen)}
+
+
+def swap(job=DEFAULT_JOB):
+    """
+    Replace live patterns and first-seen times with a finished job's results.
+
+    Everything happens in one transaction, so readers see either the old
+    or the new results. The staged rows are removed and the chunks marked
+    ``swapped``.
+
+    Returns:
+        Dictionary with the number of patterns and users written
+
+    Raises:
+        RuntimeError: Some chunks are not done yet
+    """
+    job_chunks = chunks(job)
+    unfinished = [c for c in job_chunks if c.state != 'done']
+    if not job_chunks or unfinished:
+        raise RuntimeError(f"Backfill '{job}' has {len(unfinished)} unfinished chunks")
+    start, end = job_chunks[0].start, job_chunks[-1].end
+
+    # A key detected in several chunks keeps its most recent detection
+    latest = {}
+    staged = db.session.execute(
+        select(BackfillPattern.user_id, BackfillPattern.pattern_type, BackfillPattern.signature,
+               BackfillPattern.confidence, BackfillPattern.frequency, BackfillPattern.pattern_details,
+               BackfillPattern.detected_at)
+        .where(BackfillPattern.job == job).order_by(BackfillPattern.chunk_start)
+    ).mappings()
+    for row in staged:
+        latest[row['user_id'], row['pattern_type'], row['signature']] = dict(row)
+    patterns = [latest[key] for key in sorted(latest)]
+
+    db.session.execute(delete(BehaviorPattern).where(BehaviorPattern.detected_at >= start,
+                                                     BehaviorPattern.detected_at <= end))
+    upsert_patterns(patterns, keep_newer=True)
+
+    first_seen = db.session.execute(
+        select(BackfillFirstSeen.user_id, BackfillFirstSeen.first_seen)
+        .where(BackfillFirstSeen.job == job).order_by(BackfillFirstSeen.user_id)
+    ).all()
+    if first_seen:
+        earliest = func.least if db.engine.dialect.name == 'postgresql' else func.min
+        stmt = dialect_insert(UserFirstSeen)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserFirstSeen.user_id],
+            set_={'first_seen': earliest(UserFirstSeen.first_seen, stmt.excluded.first_seen)}
+        )
+        db.session.execute(stmt, [{'user_id': u, 'first_seen': ts} for u, ts in first_seen])
+
+    _discard(job, keep_chunks=True)
+    db.session.execute(update(BackfillChunk).where(BackfillChunk.job == job).values(state='swapped'))
+    db.session.commit()
+    return {'patterns': len(patterns), 'users': len(first_seen)}
+
+
+def run(job, start, end=None, workers=WORKERS, chunk_hours=CHUNK_HOURS, max_load=MAX_LOAD,
+        restart=False, progress=None):
+    """
+    Plan a job, process its unfinished chunks and swap the results in.
+
+    Args:
+        job: Job name; re-running a name resumes it
+        start: Inclusive start of the range
+        end: Exclusive end of the range (default: see ``plan``)
+        workers: Worker processes; 1 runs the chunks in this process
+        chunk_hours: Length of a chunk
+        max_load: CPU share each worker may use (0 < max_load <= 1)
+        restart: Recompute every chunk of an existing job
+        progress: Optional callback receiving each finished chunk's counts
+
+    Returns:
+        Dictionary with chunk, interaction, pattern and user counts
+
+    Raises:
+        RuntimeError: Some chunks failed; the job resumes from them on the
+            next run
+    """
+    if not 0 < max_load <= 1:
+        raise ValueError('max_load must be in (0, 1]')
+    started = time.perf_counter()
+    job_chunks = plan(job, start, end, chunk_hours, restart)
+    if all(c.state == 'swapped' for c in job_chunks):
+        return {'chunks': len(job_chunks), 'processed': 0, 'rows': 0, 'patterns': 0, 'users': 0,
+                'seconds': 0.0}
+    pending = [(c.start, c.end) for c in job_chunks if c.state == 'pending']
+    # End our read transaction; chunk states are reloaded after the workers finish
+    db.session.commit()
+
+    results, failures = [], []
+    if workers <= 1:
+        for chunk_start, chunk_end in pending:
+            try:
+                results.append(run_chunk(job, chunk_start, chunk_end, max_load))
+            except Exception as e:
+                db.session.rollback()
+                failures.append((chunk_start, e))
+                continue
+            if progress:
+                progress(results[-1])
+    else:
+        uri = db.engine.url.render_as_string(hide_password=False)
+        # Spawned workers open their own connections instead of inheriting ours
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(uri,)) as pool:
+            futures = {pool.submit(_run_in_worker, job, s, e, max_load): s for s, e in pending}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    failures.append((futures[future], e))
+                    continue
+                if progress:
+                    progress(results[-1])
+    if failures:
+        first, error = min(failures, key=lambda f: f[0])
+        raise RuntimeError(f"{len(failures)} backfill chunks failed (first at {first}: {error}); "
+                           f"re-run to resume")
+
+    swapped = swap(job)
+    return {'chunks': len(job_chunks), 'processed': len(results), 'rows': sum(r['rows'] for r in results),
+            'patterns': swapped['patterns'], 'users': swapped['users'],
+            'seconds': time.perf_counter() - started}
+
+
+def _discard(job, keep_chunks=False):
+    for model in (BackfillPattern, BackfillFirstSeen) + (() if keep_chunks else (BackfillChunk,)):
+        db.session.execute(delete(model).where(model.job == job))
+
+
+_worker_app = None
+
+
+def _init_worker(database_uri):
+    global _worker_app
+    from flask import Flask
+    _worker_app = Flask(__name__)
+    _worker_app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    _worker_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    storage.init_app(_worker_app)
+
+
+def _run_in_worker(job, start, end, max_load):
+    with _worker_app.app_context():
+        return run_chunk(job, start, end, max_load)
+
+
+if __name__ == '__main__':
+    import argparse
+    from flask_app import app
+
+    parser = argparse.ArgumentParser(description='Recompute patterns and first-seen times over history')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', help='Run or resume a backfill and swap its results in')
+    run_parser.add_argument('--start', required=True, type=datetime.fromisoformat)
+    run_parser.add_argument('--end', type=datetime.fromisoformat, default=None,
+                            help="Exclusive end (default: the job's planned end, or now for a new job)")
+    run_parser.add_argument('--job', default=DEFAULT_JOB)
+    run_parser.add_argument('--workers', type=int, default=WORKERS)
+    run_parser.add_argument('--chunk-hours', type=int, default=CHUNK_HOURS)
+    run_parser.add_argument('--max-load', type=float, default=MAX_LOAD,
+                            help='CPU share each worker may use')
+    run_parser.add_argument('--restart', action='store_true', help='Discard earlier progress of the job')
+    status_parser = sub.add_parser('status', help='Show the chunks of a backfill')
+    status_parser.add_argument('--job', default=DEFAULT_JOB)
+    args = parser.parse_args()
+
+    with app.app_context():
+        create_schema()
+        if args.command == 'status':
+            job_chunks = chunks(args.job)
+            states = {}
+            for chunk in job_chunks:
+                states[chunk.state] = states.get(chunk.state, 0) + 1
+            print(f"Backfill '{args.job}': {len(job_chunks)} chunks {states}")
+        else:
+            def report(chunk):
+                print(f"[{datetime.now()}] {chunk['start']:%Y-%m-%d %H:%M}: {chunk['rows']} interactions, "
+                      f"{chunk['patterns']} patterns")
+
+            try:
+                result = run(args.job, args.start, args.end, args.workers, args.chunk_hours,
+                             args.max_load, args.restart, progress=report)
+            except ValueError as e:
+                parser.exit(2, f"Error: {e}\n")
+            print(f"Backfilled {result['processed']} of {result['chunks']} chunks ({result['rows']} interactions) "
+                  f"in {result['seconds']:.1f}s; swapped in {result['patterns']} patterns and "
+                  f"{result['users']} first-seen times")
@@ -0,0 +1,60 @@
+"""
+Benchmark the pandas and DuckDB analytics backends on the same database.
+
+Usage:
+    python -m benchmarks.bench_backends --events 200000 --db /tmp/bench_backends.db
+"""
+import argparse
+import os
+import time
+from flask import Flask
+from database import db, create_schema
+from analytics import PatternRecognizer
+from synthetic import SyntheticEvents
+
+
+def build_database(path, events, seed=0):
+    """Fill a fresh SQLite database with ``events`` synthetic interactions over 90 days."""
+    if os.path.exists(path):
+        os.remove(path)
+    create_schema()
+    SyntheticEvents(events, days=90, seed=seed, chunk_size=200000).to_database()
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--db', default='/tmp/bench_backends.db')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.abspath(args.db)}'
+    db.init_app(app)
+
+    with app.app_context():
+        build_database(args.db, args.events)
+        recognizer = PatternRecognizer()
+        cases = [
+            ('get_trends 30d', lambda b: recognizer.get_trends('30d', backend=b)),
+            ('get_trends 90d', lambda b: recognizer.get_trends('90d', backend=b)),
+            ('analyze_patterns', lambda b: recognizer.analyze_patterns(backend=b)),
+        ]
+        print(f"{args.events:,} events")
+        print(f"{'case':<20}{'pandas (s)':>12}{'duckdb (s)':>12}{'speedup':>10}")
+        for name, fn in cases:
+            pandas_s = timed(lambda: fn('pandas'))
+            duckdb_s = timed(lambda: fn('duckdb'))
+            print(f"{name:<20}{pandas_s:>12.3f}{duckdb_s:>12.3f}{pandas_s / duckdb_s:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
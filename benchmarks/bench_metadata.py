@@ -0,0 +1,88 @@
+"""
+Compare JSON and msgpack (optionally zstd + shared dictionary) metadata encodings.
+
+Reports the average encoded size per row and how fast rows load from SQLite
+when metadata is decoded eagerly (JSON) versus lazily (msgpack).
+
+Usage:
+    python -m benchmarks.bench_metadata --rows 100000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import msgpack
+import zstandard
+from sqlalchemy import JSON, Column, Integer, MetaData, Table, create_engine, select
+import compact_metadata
+from compact_metadata import CompactMetadata
+
+
+def sample_metadata(n, seed=0):
+    rng = random.Random(seed)
+    return [{
+        'session_duration': rng.randint(10, 600),
+        'device': rng.choice(['desktop', 'mobile', 'tablet']),
+        'referrer': rng.choice(['google', 'facebook', 'direct', 'twitter', 'linkedin', 'reddit']),
+        'scroll_depth': rng.randint(10, 100),
+        'clicks': rng.randint(1, 20)
+    } for _ in range(n)]
+
+
+def load_rate(path, column_type, values, touch):
+    """Insert ``values`` and time loading them back, optionally reading one key per row."""
+    engine = create_engine(f'sqlite:///{path}')
+    table = Table('bench', MetaData(), Column('id', Integer, primary_key=True), Column('metadata', column_type))
+    table.create(engine)
+    with engine.begin() as conn:
+        conn.execute(table.insert(), [{'metadata': v} for v in values])
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        rows = conn.execute(select(table.c.metadata)).scalars().all()
+        if touch:
+            for row in rows:
+                row['device']
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    return len(values) / elapsed, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Metadata encoding benchmark')
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+    values = sample_metadata(args.rows)
+
+    json_sizes = [len(json.dumps(v)) for v in values]
+    packed = [msgpack.packb(v, use_bin_type=True) for v in values]
+    dictionary = zstandard.train_dictionary(16 * 1024, packed[:20000])
+    compressor = zstandard.ZstdCompressor(level=3, dict_data=dictionary)
+    zstd_sizes = [1 + len(compressor.compress(p)) for p in packed]
+
+    print(f"{args.rows:,} rows")
+    print(f"avg bytes/row  json={sum(json_sizes) / len(values):.1f}  "
+          f"msgpack={sum(len(p) + 1 for p in packed) / len(values):.1f}  "
+          f"msgpack+zstd-dict={sum(zstd_sizes) / len(values):.1f}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, column_type, touch in [
+            ('json (eager decode)', JSON(), False),
+            ('msgpack, metadata unused', CompactMetadata(), False),
+            ('msgpack, one key read', CompactMetadata(), True),
+        ]:
+            path = os.path.join(tmp, f'{len(os.listdir(tmp))}.db')
+            rate, size = load_rate(path, column_type, values, touch)
+            print(f"{label:<28} {rate:>12,.0f} rows/s   db file {size / 1e6:.1f} MB")
+
+        dict_path = os.path.join(tmp, 'meta.dict')
+        with open(dict_path, 'wb') as f:
+            f.write(dictionary.as_bytes())
+        compact_metadata.ZSTD_DICT_PATH = dict_path
+        rate, size = load_rate(os.path.join(tmp, 'zstd.db'), CompactMetadata(), values, True)
+        print(f"{'msgpack+zstd, one key read':<28} {rate:>12,.0f} rows/s   db file {size / 1e6:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
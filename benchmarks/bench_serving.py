@@ -0,0 +1,114 @@
+"""
+Compare API throughput under the Flask dev server and gunicorn.
+
+Fills a fresh database with synthetic events, then starts each server
+configuration as a separate process on a free port and drives it with the
+load generator (closed loop, ``--concurrency`` connections) for
+``--duration`` seconds. Configurations are ``dev`` (``python flask_app.py``
+with the debugger off) or ``WORKERSxTHREADS`` for gunicorn with
+``gunicorn.conf.py``.
+
+Usage:
+    python -m benchmarks.bench_serving --events 50000 --duration 20
+    python -m benchmarks.bench_serving --servers dev 1x1 2x4 4x4 --mix trends=100
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _command(server, port):
+    if server == 'dev':
+        return [sys.executable, 'flask_app.py']
+    workers, threads = server.split('x')
+    return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+            '--workers', workers, '--threads', threads, 'wsgi:create_app()']
+
+
+def _wait_until_up(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with code {process.returncode}')
+        try:
+            with urllib.request.urlopen(f'{url}/health', timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server at {url} did not come up in {timeout}s')
+
+
+def run_server(server, database, args):
+    from benchmarks.loadgen import LoadGenerator, parse_mix
+
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=database, PORT=str(port), FLASK_ENV='production',
+               SEED_DEMO_DATA='0', GUNICORN_ACCESS_LOG='')
+    process = subprocess.Popen(_command(server, port), cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    try:
+        _wait_until_up(url, process)
+        generator = LoadGenerator(url, parse_mix(args.mix), args.concurrency, None, False, 0)
+        generator.run(min(args.duration, 3))  # warm up caches and lazy imports
+        generator = LoadGenerator(url, parse_mix(args.mix), args.concurrency, None, False, 0)
+        return generator.run(args.duration)['total']
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=50000)
+    parser.add_argument('--servers', nargs='+', default=['dev', '1x1', '1x4', '2x4'])
+    parser.add_argument('--mix', default='track=60,batch=10,trends=20,patterns=10')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--url', help='Database to serve (default: a fresh SQLite file)')
+    parser.add_argument('--db-dir', default='/tmp')
+    args = parser.parse_args()
+
+    database = args.url
+    if database is None:
+        path = os.path.join(os.path.abspath(args.db_dir), 'bench_serving.db')
+        for suffix in ('', '-wal', '-shm', '.init-lock'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        database = f'sqlite:///{path}'
+    os.environ['DATABASE_URL'] = database
+    from flask_app import app
+    from database import db
+    from synthetic import SyntheticEvents
+    import bootstrap
+
+    bootstrap.initialize(app, seed=False)
+    with app.app_context():
+        SyntheticEvents(args.events, days=30, seed=0).to_database()
+        db.session.remove()
+        db.engine.dispose()
+
+    print(f"{args.events:,} events, mix {args.mix}, {args.concurrency} connections, "
+          f"{args.duration:g}s per server, {os.cpu_count()} CPU(s)")
+    print(f"{'server':<16}{'req/s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for server in args.servers:
+        total = run_server(server, database, args)
+        name = server if server == 'dev' else f'gunicorn {server}'
+        print(f"{name:<16}{total['throughput']:>8.1f}{total['p50_ms']:>10.1f}{total['p95_ms']:>10.1f}"
+              f"{total['p99_ms']:>10.1f}{total['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
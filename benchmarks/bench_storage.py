@@ -0,0 +1,128 @@
+"""
+Benchmark concurrent ingest and dashboard reads under each storage profile.
+
+For every profile a fresh database is filled with synthetic events, then
+``--writers`` threads insert single interactions in their own transactions
+(like ``/api/track``) while ``--readers`` threads run ``get_trends`` for
+``--seconds`` seconds. Writes that fail (e.g. "database is locked") are
+counted as errors.
+
+Usage:
+    python -m benchmarks.bench_storage --events 100000 --writers 4 --readers 2 --seconds 10
+    python -m benchmarks.bench_storage --url postgresql://localhost/bench   # scratch database
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _writer(app, deadline, latencies, errors, index):
+    from sqlalchemy import insert
+    from database import db, UserInteraction
+    with app.app_context():
+        n = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                db.session.execute(insert(UserInteraction).values(
+                    user_id=f'bench_writer_{index}', action='page_view', page=f'/bench/{n % 50}',
+                    timestamp=datetime.utcnow()))
+                db.session.commit()
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                db.session.rollback()
+                errors.append(1)
+            n += 1
+        db.session.remove()
+
+
+def _reader(app, deadline, latencies, errors):
+    from database import db
+    from analytics import PatternRecognizer
+    recognizer = PatternRecognizer()
+    with app.app_context():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                recognizer.get_trends('7d')
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                db.session.rollback()
+                errors.append(1)
+        db.session.remove()
+
+
+def run_profile(profile, url, args):
+    from flask import Flask
+    from database import db, create_schema
+    from synthetic import SyntheticEvents
+    import storage
+
+    app = Flask(f'bench_{profile}')
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    storage.init_app(app, profile)
+    with app.app_context():
+        db.drop_all()
+        create_schema()
+        SyntheticEvents(args.events, days=30, seed=0).to_database()
+        db.session.remove()
+
+    writes, reads, errors = [], [], []
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=_writer, args=(app, deadline, writes, errors, i))
+               for i in range(args.writers)]
+    threads += [threading.Thread(target=_reader, args=(app, deadline, reads, errors))
+                for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with app.app_context():
+        db.engine.dispose()
+    return {
+        'writes_per_second': len(writes) / args.seconds,
+        'write_p95_ms': _percentile(writes, 0.95) * 1000,
+        'reads_per_second': len(reads) / args.seconds,
+        'read_p95_ms': _percentile(reads, 0.95) * 1000,
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--profiles', nargs='+', default=['plain', 'production'])
+    parser.add_argument('--url', help='Database to benchmark (default: a fresh SQLite file per profile)')
+    parser.add_argument('--db-dir', default='/tmp')
+    args = parser.parse_args()
+
+    print(f"{args.events:,} events, {args.writers} writers, {args.readers} readers, "
+          f"{args.seconds:g}s per profile, {os.cpu_count()} CPU(s)")
+    print(f"{'profile':<12}{'writes/s':>10}{'write p95':>12}{'reads/s':>10}{'read p95':>12}{'errors':>8}")
+    for profile in args.profiles:
+        url = args.url
+        if url is None:
+            path = os.path.join(os.path.abspath(args.db_dir), f'bench_storage_{profile}.db')
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            url = f'sqlite:///{path}'
+        result = run_profile(profile, url, args)
+        print(f"{profile:<12}{result['writes_per_second']:>10.0f}{result['write_p95_ms']:>10.1f}ms"
+              f"{result['reads_per_second']:>10.1f}{result['read_p95_ms']:>10.0f}ms{result['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
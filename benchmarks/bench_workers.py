@@ -0,0 +1,92 @@
+"""
+Benchmark sessionization throughput against the number of pipeline workers.
+
+Each run resets the sessions, transitions and work units of one synthetic
+database and lets ``--workers`` processes drain the backlog through
+leased user-hash shards (``pipeline.PipelineWorker``).
+
+Usage:
+    python -m benchmarks.bench_workers --events 500000 --workers 1 2 4 --shards 8
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import time
+from datetime import datetime, timedelta
+
+
+def _drain(worker_id, shards, batch_size, ready):
+    with contextlib.redirect_stdout(io.StringIO()):
+        from pipeline import PipelineWorker
+        worker = PipelineWorker(shards, batch_size=batch_size, worker_id=worker_id)
+        # Start together once every process has paid its import cost
+        ready.wait()
+        while worker.run_once():
+            pass
+
+
+def _reset(shards):
+    from sqlalchemy import update
+    import leasing
+    from database import db, PageTransition, UserSession, WorkUnit
+    for model in (UserSession, PageTransition, WorkUnit):
+        db.session.query(model).delete()
+    db.session.commit()
+    leasing.ensure_units('sessions', shards)
+    leasing.ensure_units('maintenance')
+    # Only sessionization is measured
+    db.session.execute(update(WorkUnit).where(WorkUnit.kind == 'maintenance')
+                       .values(available_at=datetime.utcnow() + timedelta(days=1)))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=500000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--db', default='/tmp/bench_workers.db')
+    parser.add_argument('--wal', action='store_true', help='Switch the database to WAL journaling first')
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.db)}'
+
+    from flask import Flask
+    from sqlalchemy import text
+    from database import db, create_schema
+    from synthetic import SyntheticEvents
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['DATABASE_URL']
+    db.init_app(app)
+    with app.app_context():
+        create_schema()
+        SyntheticEvents(args.events, days=30, seed=0).to_database()
+        if args.wal:
+            db.session.execute(text('PRAGMA journal_mode=WAL'))
+
+    context = multiprocessing.get_context('spawn')
+    print(f"{args.events:,} events, {args.shards} shards, {os.cpu_count()} CPU(s)")
+    for workers in args.workers:
+        with app.app_context():
+            _reset(args.shards)
+        ready = context.Barrier(workers + 1)
+        processes = [context.Process(target=_drain, args=(f'bench-{i}', args.shards, args.batch_size, ready))
+                     for i in range(workers)]
+        for process in processes:
+            process.start()
+        ready.wait()
+        started = time.perf_counter()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+        print(f"{workers} worker(s): {elapsed:7.2f}s  {args.events / elapsed:>10,.0f} events/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+"""
+Concurrent HTTP load generator for the Flask API.
+
+Drives a running API (``--url``) or an in-process ``flask_app`` served on a
+local port (``--spawn``) with a weighted mix of requests. Each worker
+thread keeps one persistent HTTP/1.1 connection, so the pool holds
+``--concurrency`` connections.
+
+- Closed loop (default): every worker sends its next request as soon as the
+  previous one completes.
+- Open loop (``--rate``): requests are scheduled at a fixed (or Poisson)
+  arrival rate regardless of how fast the server answers. Latency is
+  measured from the scheduled send time, so queueing behind a slow server
+  is counted instead of hidden (no coordinated omission).
+
+Latencies go into HDR-style log-linear histograms (about 1% precision)
+per operation; the report shows throughput and p50/p95/p99/p99.9.
+
+Usage:
+    python -m benchmarks.loadgen --spawn --database sqlite:////tmp/load.db --duration 20
+    python -m benchmarks.loadgen --url http://localhost:5001 --rate 200 --concurrency 32
+    python -m benchmarks.loadgen --spawn --mix track=50,batch=20,trends=20,patterns=10 --histogram
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_MIX = 'track=60,batch=10,trends=20,patterns=10'
+ACTIONS = ['page_view', 'click', 'scroll', 'search', 'add_to_cart', 'checkout']
+PAGES = ['/home', '/products', '/pricing', '/blog', '/cart', '/checkout']
+
+
+class LatencyHistogram:
+    """
+    Log-linear latency histogram in microseconds, in the style of HdrHistogram.
+
+    Values below ``2 * sub_buckets`` are exact; above that each power of two
+    is split into ``sub_buckets`` linear buckets, bounding the relative error
+    by ``1 / sub_buckets`` with constant memory.
+    """
+
+    def __init__(self, sub_buckets=128):
+        self.sub_buckets = sub_buckets
+        self._shift = sub_buckets.bit_length() - 1
+        self.counts = {}
+        self.total = 0
+        self.max = 0
+        self.sum = 0
+
+    def _index(self, value):
+        if value < 2 * self.sub_buckets:
+            return value
+        shift = value.bit_length() - self._shift - 1
+        return shift * self.sub_buckets + (value >> shift)
+
+    def _value(self, index):
+        """Highest value that falls in bucket ``index``."""
+        if index < 2 * self.sub_buckets:
+            return index
+        shift = index // self.sub_buckets - 1
+        return (((index - shift * self.sub_buckets) + 1) << shift) - 1
+
+    def record(self, micros):
+        micros = max(int(micros), 0)
+        index = self._index(micros)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        self.sum += micros
+        self.max = max(self.max, micros)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """Value at percentile ``p`` (0-100) in microseconds."""
+        if not self.total:
+            return 0
+        target = max(int(self.total * p / 100 + 0.5), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def mean(self):
+        return self.sum / self.total if self.total else 0.0
+
+    def distribution(self, ticks_per_half=2):
+        """
+        Percentile distribution rows (value_ms, percentile, count, 1/(1-p)),
+        halving the distance to 100% at each level as HdrHistogram does.
+        """
+        rows = []
+        for level in range(30):
+            lo, hi = 100 - 100 / 2 ** level, 100 - 100 / 2 ** (level + 1)
+            for tick in range(ticks_per_half):
+                percentile = lo + (hi - lo) * tick / ticks_per_half
+                value = self.percentile(percentile)
+                below = sum(c for i, c in self.counts.items() if i <= self._index(value))
+                rows.append((value / 1000, percentile, below, 1 / (1 - percentile / 100)))
+            if value >= self.max:
+                break
+        rows.append((self.max / 1000, 100.0, self.total, float('inf')))
+        return rows
+
+
+def parse_mix(spec):
+    """Parse 'track=60,trends=20' into [(operation, weight)]."""
+    mix = []
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}', expected one of {sorted(OPERATIONS)}")
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+
+def _event(rng):
+    return {
+        'user_id': f'load_user_{int(rng.paretovariate(1.2)) % 5000}',
+        'action': rng.choice(ACTIONS),
+        'page': rng.choice(PAGES),
+        'metadata': {'device': rng.choice(['desktop', 'mobile', 'tablet']), 'source': 'loadgen'}
+    }
+
+
+OPERATIONS = {
+    'track': lambda rng: ('POST', '/api/track', _event(rng)),
+    'batch': lambda rng: ('POST', '/api/track/batch', {'events': [_event(rng) for _ in range(50)]}),
+    'trends': lambda rng: ('GET', f"/api/analytics/trends?timeframe={rng.choice(['7d', '30d'])}", None),
+    'patterns': lambda rng: ('GET', '/api/analytics/patterns', None),
+}
+
+
+class LoadGenerator:
+    """
+    Runs a mixed workload against ``base_url`` and collects histograms.
+
+    Args:
+        base_url: API root, e.g. http://localhost:5001
+        mix: List of (operation, weight)
+        concurrency: Worker threads (and pooled connections)
+        rate: Requests per second for an open-loop run, or None for closed loop
+        poisson: Use exponential inter-arrival times in open-loop mode
+        seed: Seed for request generation
+    """
+
+    def __init__(self, base_url, mix, concurrency=8, rate=None, poisson=False, seed=0):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.mix = mix
+        self.concurrency = concurrency
+        self.rate = rate
+        self.poisson = poisson
+        self.seed = seed
+        self._lock = threading.Lock()
+        self.histograms = {name: LatencyHistogram() for name, _ in mix}
+        self.errors = {name: 0 for name, _ in mix}
+
+    def run(self, duration):
+        """Run for ``duration`` seconds and return the report dictionary."""
+        deadline = time.perf_counter() + duration
+        arrivals = queue.Queue() if self.rate else None
+        workers = [threading.Thread(target=self._worker, args=(i, deadline, arrivals), daemon=True)
+                   for i in range(self.concurrency)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        if arrivals is not None:
+            self._schedule(deadline, arrivals)
+        for worker in workers:
+            worker.join()
+        return self.report(time.perf_counter() - started)
+
+    def _schedule(self, deadline, arrivals):
+        """Enqueue intended send times at the target rate, then stop the workers."""
+        rng = random.Random(self.seed)
+        next_at = time.perf_counter()
+        while next_at < deadline:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            arrivals.put(next_at)
+            next_at += rng.expovariate(self.rate) if self.poisson else 1 / self.rate
+        for _ in range(self.concurrency):
+            arrivals.put(None)
+
+    def _worker(self, index, deadline, arrivals):
+        rng = random.Random(self.seed * 1000 + index)
+        names = [name for name, _ in self.mix]
+        weights = [weight for _, weight in self.mix]
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        local = {name: LatencyHistogram() for name in names}
+        errors = {name: 0 for name in names}
+        try:
+            while True:
+                if arrivals is None:
+                    if time.perf_counter() >= deadline:
+                        break
+                    intended = time.perf_counter()
+                else:
+                    intended = arrivals.get()
+                    if intended is None:
+                        break
+                name = rng.choices(names, weights)[0]
+                method, path, body = OPERATIONS[name](rng)
+                ok, conn = self._send(conn, method, path, body)
+                local[name].record((time.perf_counter() - intended) * 1e6)
+                if not ok:
+                    errors[name] += 1
+        finally:
+            conn.close()
+            with self._lock:
+                for name in names:
+                    self.histograms[name].merge(local[name])
+                    self.errors[name] += errors[name]
+
+    def _send(self, conn, method, path, body):
+        """Send one request, reconnecting once if the pooled connection dropped."""
+        payload = json.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload else {}
+        for attempt in range(2):
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                return response.status < 400, conn
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        return False, conn
+
+    def report(self, elapsed):
+        total = LatencyHistogram()
+        operations = {}
+        for name, histogram in self.histograms.items():
+            total.merge(histogram)
+            operations[name] = _summary(histogram, self.errors[name], elapsed)
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'concurrency': self.concurrency,
+            'mode': f'open loop at {self.rate}/s' if self.rate else 'closed loop',
+            'total': _summary(total, sum(self.errors.values()), elapsed),
+            'operations': operations,
+        }
+
+
+def _summary(histogram, errors, elapsed):
+    return {
+        'requests': histogram.total,
+        'errors': errors,
+        'throughput': round(histogram.total / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(histogram.mean() / 1000, 3),
+        **{f'p{label}_ms': round(histogram.percentile(p) / 1000, 3)
+           for label, p in (('50', 50), ('95', 95), ('99', 99), ('999', 99.9))},
+        'max_ms': round(histogram.max / 1000, 3),
+    }
+
+
+def spawn_server(database=None):
+    """
+    Serve flask_app on a free local port from a background thread.
+
+    The server shares the generator's process (and GIL), so use ``--url``
+    against a separately started server for absolute numbers.
+    """
+    if database:
+        os.environ['DATABASE_URL'] = database
+    import logging
+    from werkzeug.serving import make_server
+    from flask_app import app
+    import bootstrap
+
+    bootstrap.initialize(app)
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP load generator for the analytics API')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='Base URL of a running API')
+    target.add_argument('--spawn', action='store_true', help='Serve flask_app in-process on a free port')
+    parser.add_argument('--database', help='DATABASE_URL for --spawn (default: the app default)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Weighted operations (default: {DEFAULT_MIX})')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run')
+    parser.add_argument('--rate', type=float, help='Open-loop requests per second')
+    parser.add_argument('--poisson', action='store_true', help='Poisson arrivals in open-loop mode')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--histogram', action='store_true', help='Print the full percentile distribution')
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if args.spawn:
+        url, server = spawn_server(args.database)
+
+    generator = LoadGenerator(url, parse_mix(args.mix), args.concurrency, args.rate, args.poisson, args.seed)
+    print(f"Running {generator.concurrency} workers against {url} for {args.duration:.0f}s "
+          f"({'open loop at %g/s' % args.rate if args.rate else 'closed loop'})")
+    report = generator.run(args.duration)
+
+    print(f"\n{'operation':<12}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+          f"{'p99 ms':>10}{'p99.9 ms':>10}{'max ms':>10}")
+    for name, s in list(report['operations'].items()) + [('total', report['total'])]:
+        print(f"{name:<12}{s['requests']:>10}{s['errors']:>8}{s['throughput']:>10.1f}{s['p50_ms']:>10.2f}"
+              f"{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['p999_ms']:>10.2f}{s['max_ms']:>10.2f}")
+
+    if args.histogram:
+        total = LatencyHistogram()
+        for histogram in generator.histograms.values():
+            total.merge(histogram)
+        print(f"\n{'Value (ms)':>12}{'Percentile':>14}{'TotalCount':>12}{'1/(1-Percentile)':>18}")
+        for value, percentile, count, inverse in total.distribution():
+            print(f"{value:>12.3f}{percentile / 100:>14.6f}{count:>12}{inverse:>18.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if server:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
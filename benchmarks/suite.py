@@ -0,0 +1,296 @@
+"""
+End-to-end benchmark suite on synthetic data at several scales.
+
+Each scale runs in its own process against a fresh SQLite database filled
+by ``synthetic.SyntheticEvents``, so peak RSS is not polluted by earlier
+scales. For every case the suite records wall time, peak RSS while the
+case ran and the number of SQL statements executed, writes the results as
+JSON and optionally compares them with a stored baseline.
+
+Usage:
+    python -m benchmarks.suite                                  # 1e4 and 1e5 events vs baseline.json
+    python -m benchmarks.suite --scales 10000 100000 1000000 --output results.json
+    python -m benchmarks.suite --fail-on-regression --tolerance 0.3
+    python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_SCALES = (10000, 100000)
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+# recommend_items builds a dense user x user similarity matrix
+MAX_USERS = 5000
+TRACK_REQUESTS = 1000
+
+
+def rss_mb():
+    """Current resident set size in MB."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+class PeakRss:
+    """Samples RSS in a background thread and keeps the maximum."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.peak = rss_mb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+
+class QueryCounter:
+    """Counts SQL statements executed on an engine."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def measure(fn, queries, repeat=1):
+    """
+    Run ``fn`` ``repeat`` times.
+
+    Returns:
+        Dictionary with the best wall time, peak RSS and queries per run
+    """
+    best = float('inf')
+    peak = 0.0
+    count = 0
+    for _ in range(repeat):
+        before = queries.count
+        with PeakRss() as rss:
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+        best = min(best, elapsed)
+        peak = max(peak, rss.peak)
+        count = queries.count - before
+    return {'seconds': round(best, 6), 'peak_rss_mb': round(peak, 1), 'queries': count}
+
+
+def run_scale(events, db_path, repeat=1):
+    """Build a database with ``events`` events and run every case against it."""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(db_path)}'
+
+    from flask import Flask
+    from database import db, create_schema
+    from synthetic import SyntheticEvents
+
+    # Filled through a bare app, without the API's metrics and profiling hooks
+    builder = Flask(__name__)
+    builder.config['SQLALCHEMY_DATABASE_URI'] = os.environ['DATABASE_URL']
+    db.init_app(builder)
+    started = time.perf_counter()
+    with builder.app_context():
+        create_schema()
+        SyntheticEvents(events, users=min(max(events // 50, 1), MAX_USERS), days=90, seed=0).to_database()
+    build_seconds = time.perf_counter() - started
+
+    from flask_app import app, pattern_recognizer
+    from queries import interactions_frame
+    from src.models.pattern_detection import detect_common_patterns, detect_sequential_patterns
+    from sessions import SESSION_GAP
+    from src.models.segmentation import segment_users
+    from src.models.recommendations import recommend_items
+    from src.models.churn_prediction import predict_churn
+
+    results = {'build': {'seconds': round(build_seconds, 3)}}
+    with app.app_context():
+        queries = QueryCounter(db.engine)
+        frame = {}
+
+        def load():
+            frame['df'] = interactions_frame()
+
+        results['load_frame'] = measure(load, queries, repeat)
+        df = frame['df']
+        top_user = df['user_id'].value_counts().index[0]
+        page_counts = df.groupby(['user_id', 'page']).size().reset_index(name='count')
+        churn_features = _churn_features(df)
+
+        cases = [
+            ('trends_7d', lambda: pattern_recognizer.get_trends('7d')),
+            ('trends_30d', lambda: pattern_recognizer.get_trends('30d')),
+            ('trends_90d', lambda: pattern_recognizer.get_trends('90d')),
+            ('patterns_all', lambda: pattern_recognizer.analyze_patterns()),
+            ('patterns_user', lambda: pattern_recognizer.analyze_patterns(user_id=top_user)),
+            ('detect_common_patterns', lambda: detect_common_patterns(df)),
+            ('detect_sequential_patterns', lambda: detect_sequential_patterns(df, session_gap=SESSION_GAP)),
+            ('segment_users', lambda: segment_users(df)),
+            ('recommend_items', lambda: recommend_items(page_counts, top_user)),
+            ('predict_churn', lambda: predict_churn(churn_features, ['events', 'pages', 'active_days'])),
+        ]
+        for name, fn in cases:
+            results[name] = measure(fn, queries, repeat)
+
+        # Last, since it adds rows
+        client = app.test_client()
+        payload = {'user_id': 'bench_user', 'action': 'click', 'page': '/home', 'metadata': {'device': 'mobile'}}
+
+        def track():
+            for _ in range(TRACK_REQUESTS):
+                response = client.post('/api/track', json=payload)
+                assert response.status_code == 201
+
+        track_result = measure(track, queries, repeat)
+        track_result['requests_per_second'] = round(TRACK_REQUESTS / track_result['seconds'], 1)
+        track_result['queries'] = round(track_result['queries'] / TRACK_REQUESTS, 2)
+        results['track'] = track_result
+    return results
+
+
+def _churn_features(df):
+    """Per-user activity features, labelling users inactive for 14+ days as churned."""
+    import pandas as pd
+    timestamps = pd.to_datetime(df['timestamp'])
+    grouped = df.assign(day=timestamps.dt.floor('D'), ts=timestamps).groupby('user_id')
+    features = pd.DataFrame({
+        'events': grouped.size(),
+        'pages': grouped['page'].nunique(),
+        'active_days': grouped['day'].nunique(),
+        'last_seen': grouped['ts'].max(),
+    }).reset_index()
+    features['churned'] = (features['last_seen'] < timestamps.max() - pd.Timedelta(days=14)).astype(int)
+    if features['churned'].nunique() < 2:
+        features.loc[features.index[-1], 'churned'] = 1 - features['churned'].iloc[0]
+    return features
+
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.05):
+    """
+    Compare results with a baseline.
+
+    A case regresses when it is more than ``tolerance`` slower (and at
+    least ``min_seconds`` slower, to ignore timer noise), uses more than
+    ``tolerance`` more peak memory, or issues more queries.
+
+    Returns:
+        List of human-readable regression descriptions
+    """
+    regressions = []
+    for scale, cases in results.get('scales', {}).items():
+        base_cases = baseline.get('scales', {}).get(scale, {})
+        for case, result in cases.items():
+            base = base_cases.get(case)
+            if not base or case == 'build':
+                continue
+            seconds, base_seconds = result['seconds'], base['seconds']
+            if seconds > base_seconds * (1 + tolerance) and seconds - base_seconds > min_seconds:
+                regressions.append(f'{scale} {case}: {base_seconds:.3f}s -> {seconds:.3f}s')
+            if result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+                regressions.append(f"{scale} {case}: peak RSS {base['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+            if result['queries'] > base['queries']:
+                regressions.append(f"{scale} {case}: queries {base['queries']} -> {result['queries']}")
+    return regressions
+
+
+def print_table(results, baseline=None):
+    for scale, cases in results['scales'].items():
+        print(f"\n{int(scale):,} events")
+        print(f"{'case':<28}{'seconds':>10}{'baseline':>10}{'peak MB':>10}{'queries':>9}")
+        base_cases = (baseline or {}).get('scales', {}).get(scale, {})
+        for case, result in cases.items():
+            base = base_cases.get(case, {}).get('seconds')
+            base = f'{base:.3f}' if base is not None else '-'
+            print(f"{case:<28}{result['seconds']:>10.3f}{base:>10}"
+                  f"{result.get('peak_rss_mb', '-'):>10}{result.get('queries', '-'):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end benchmark suite')
+    parser.add_argument('--scales', type=int, nargs='+', default=list(DEFAULT_SCALES))
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case (best time is kept)')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    parser.add_argument('--baseline', default=BASELINE_PATH,
+                        help='Compare against this results file (default: benchmarks/baseline.json)')
+    parser.add_argument('--save-baseline', help='Write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed relative slowdown or memory growth before flagging')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--worker-output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = run_scale(args.worker, os.path.join(tmp, 'bench.db'), args.repeat)
+        with open(args.worker_output, 'w') as f:
+            json.dump(results, f)
+        return
+
+    results = {
+        'meta': {
+            'created': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'scales': {}
+    }
+    for scale in args.scales:
+        print(f"Running {scale:,} events...", flush=True)
+        with tempfile.NamedTemporaryFile(suffix='.json') as out:
+            subprocess.run([sys.executable, '-m', 'benchmarks.suite', '--worker', str(scale),
+                            '--worker-output', out.name, '--repeat', str(args.repeat)], check=True)
+            with open(out.name) as f:
+                results['scales'][str(scale)] = json.load(f)
+
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"\n{len(regressions)} regression(s) against {args.baseline}")
+        for line in regressions:
+            print(f"  {line}")
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
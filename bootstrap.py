@@ -0,0 +1,98 @@
+"""
+One-time database setup: schema, pending upgrades and demo data.
+
+Importing ``flask_app`` or ``pipeline`` does not touch the database. Run
+this once per deploy, before starting the servers. The Flask dev server,
+the gunicorn entry point (``wsgi.py``) and the Streamlit app also run it
+on start, and the pipeline runs it without demo data.
+
+Processes that start at the same time against one database take turns:
+``initialize`` holds a PostgreSQL advisory lock (or, for SQLite, an
+exclusive ``flock`` on ``<database>.init-lock``) while it runs, so only the
+first one creates tables and seeds, and the rest find the work done.
+
+Usage:
+    python bootstrap.py              # create tables, compact patterns, seed demo data if empty
+    python bootstrap.py --no-seed
+"""
+
+import os
+from contextlib import contextmanager
+from sqlalchemy import text
+from database import db, create_schema
+from pattern_store import compact, is_compacted
+
+SEED_DEMO_DATA = os.getenv('SEED_DEMO_DATA', '1') == '1'
+# Key of the PostgreSQL session-level advisory lock held during initialization
+INIT_LOCK_KEY = int(os.getenv('INIT_LOCK_KEY', 4_210_049))
+
+
+@contextmanager
+def init_lock(app):
+    """
+    Hold a lock shared by every process using the database of ``app``.
+
+    A PostgreSQL advisory lock, or an exclusive ``flock`` next to a SQLite
+    database file. Other databases (and in-memory SQLite) are not locked.
+    """
+    with app.app_context():
+        engine = db.engine
+    url = engine.url
+    if url.get_backend_name() == 'postgresql':
+        with engine.connect() as conn:
+            conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': INIT_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': INIT_LOCK_KEY})
+                conn.commit()
+    elif url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        import fcntl
+        with open(f'{url.database}.init-lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        yield
+
+
+def initialize(app, seed=SEED_DEMO_DATA):
+    """
+    Prepare the database of ``app``. Safe to re-run, including from several
+    processes at once (see ``init_lock``).
+
+    Args:
+        app: Flask app bound to ``db``
+        seed: Insert demo data when the database has no interactions
+
+    Returns:
+        Dictionary with the number of duplicate patterns removed and demo
+        interactions inserted
+    """
+    with init_lock(app), app.app_context():
+        create_schema()
+        removed = 0
+        if not is_compacted():
+            print("Compacting behavior_patterns (one-off)...")
+            removed = compact()['removed']
+        seeded = 0
+        if seed:
+            from seed_data import seed_demo_data
+            seeded = seed_demo_data()
+    return {'patterns_removed': removed, 'seeded': seeded}
+
+
+if __name__ == '__main__':
+    import argparse
+    from flask_app import app
+
+    parser = argparse.ArgumentParser(description='Create tables, run pending upgrades and seed demo data')
+    parser.add_argument('--no-seed', dest='seed', action='store_false', default=SEED_DEMO_DATA,
+                        help='Do not insert demo data into an empty database')
+    args = parser.parse_args()
+
+    result = initialize(app, seed=args.seed)
+    print(f"Database ready (removed {result['patterns_removed']} duplicate patterns, "
+          f"seeded {result['seeded']} interactions)")
@@ -0,0 +1,179 @@
+"""
+Cohort retention analysis.
+
+Users are grouped by the period (day or week) they were first seen, and
+retention counts the distinct users of each cohort active N periods later.
+First-seen dates are maintained incrementally in ``user_first_seen``, and
+the matrix is built with a single ``np.bincount`` over (cohort, offset)
+cells. Cells whose activity period has closed never change, so they are
+cached and only the open period is rescanned on later calls.
+"""
+
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+from database import db, dialect_insert, Checkpoint, UserFirstSeen
+from partitions import partition_manager
+from queries import interactions_frame
+
+PERIOD_DAYS = {'day': 1, 'week': 7}
+
+# 1970-01-05 is the first Monday after the epoch; weeks start on Mondays
+_WEEK_EPOCH_OFFSET = 4
+
+CHECKPOINT_NAME = 'user_first_seen'
+
+
+def period_index(days_since_epoch, period):
+    """Map integer days since the epoch to absolute period numbers."""
+    if period == 'week':
+        return (days_since_epoch - _WEEK_EPOCH_OFFSET) // 7
+    return days_since_epoch
+
+
+def period_start(index, period):
+    """Return the start datetime of an absolute period number."""
+    days = index * 7 + _WEEK_EPOCH_OFFSET if period == 'week' else index
+    return datetime(1970, 1, 1) + timedelta(days=int(days))
+
+
+def _days(timestamps):
+    return np.asarray(timestamps, dtype='datetime64[D]').astype('int64')
+
+
+class CohortAnalyzer:
+    """
+    Builds daily or weekly retention matrices.
+
+    The cache keeps, per period type, the user count of every
+    (cohort, activity period) cell up to the last closed period.
+    """
+
+    def __init__(self):
+        self._closed = {}
+
+    def refresh_first_seen(self):
+        """
+        Fold interactions tracked since the last refresh into
+        ``user_first_seen``. The caller commits.
+
+        New ids are read from every tier, so rows that storage maintenance
+        moved into a partition or the archive before a refresh still count.
+        """
+        watermark = Checkpoint.get(CHECKPOINT_NAME)
+        new_max = partition_manager.max_id()
+        if new_max <= watermark:
+            return 0
+
+        df = interactions_frame(min_id=watermark, max_id=new_max)
+        rows = [(user_id, ts.to_pydatetime()) for user_id, ts in df.groupby('user_id')['timestamp'].min().items()]
+
+        if rows:
+            earliest = func.least if db.engine.dialect.name == 'postgresql' else func.min
+            stmt = dialect_insert(UserFirstSeen)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[UserFirstSeen.user_id],
+                set_={'first_seen': earliest(UserFirstSeen.first_seen, stmt.excluded.first_seen)}
+            )
+            db.session.execute(stmt, [{'user_id': u, 'first_seen': ts} for u, ts in rows])
+
+        Checkpoint.advance(CHECKPOINT_NAME, new_max)
+        return len(rows)
+
+    def retention(self, period='week', periods=8, now=None):
+        """
+        Compute the retention matrix for the most recent cohorts.
+
+        Args:
+            period: 'day' or 'week'
+            periods: Number of cohorts (and maximum offset) to include
+            now: Reference time (defaults to utcnow)
+
+        Returns:
+            Dictionary with one entry per cohort holding its size and the
+            active users / retention rate for each offset
+        """
+        if period not in PERIOD_DAYS:
+            raise ValueError(f"Unsupported period '{period}', expected one of {tuple(PERIOD_DAYS)}")
+        if periods < 1:
+            raise ValueError('periods must be at least 1')
+
+        self.refresh_first_seen()
+        db.session.commit()
+
+        now = now or datetime.utcnow()
+        current = int(period_index(_days([now])[0], period))
+        origin = current - periods + 1
+
+        cached = self._closed.get(period)
+        if cached is None or cached['origin'] > origin:
+            cached = {'origin': origin, 'through': origin - 1, 'cells': {}}
+
+        first_seen = self._first_seen_since(period_start(origin, period))
+        scan_from = max(origin, cached['through'] + 1)
+        cells = self._count_cells(first_seen, period, origin, scan_from)
+
+        # Cells for periods that have now closed are final
+        for key, users in cells.items():
+            if key[1] < current:
+                cached['cells'][key] = users
+        cached['through'] = current - 1
+        cached['cells'] = {k: v for k, v in cached['cells'].items() if k[0] >= origin}
+        self._closed[period] = cached
+
+        merged = dict(cached['cells'])
+        merged.update({k: v for k, v in cells.items() if k[1] == current})
+
+        sizes = np.bincount(
+            period_index(_days(first_seen.to_numpy()), period) - origin, minlength=periods
+        ) if len(first_seen) else np.zeros(periods, dtype='int64')
+
+        cohorts = []
+        for c in range(origin, current + 1):
+            size = int(sizes[c - origin])
+            users = [int(merged.get((c, c + o), 0)) for o in range(current - c + 1)]
+            cohorts.append({
+                'cohort': period_start(c, period).date().isoformat(),
+                'size': size,
+                'active_users': users,
+                'retention': [u / size if size else 0.0 for u in users]
+            })
+
+        return {'period': period, 'cohorts': cohorts}
+
+    def _first_seen_since(self, start):
+        """Map user_id -> first_seen for users first seen on or after ``start``."""
+        rows = db.session.execute(
+            select(UserFirstSeen.user_id, UserFirstSeen.first_seen)
+            .where(UserFirstSeen.first_seen >= start)
+        ).all()
+        return pd.Series(
+            pd.to_datetime([r[1] for r in rows]), index=[r[0] for r in rows], dtype='datetime64[ns]'
+        )
+
+    def _count_cells(self, first_seen, period, origin, scan_from):
+        """Count distinct active users per (cohort, activity period) from ``scan_from``."""
+        if first_seen.empty:
+            return {}
+
+        events = interactions_frame(start=period_start(scan_from, period))
+        cohort_ts = events['user_id'].map(first_seen)
+        known = cohort_ts.notna().to_numpy()
+        if not known.any():
+            return {}
+
+        user_codes, _ = pd.factorize(events['user_id'].to_numpy()[known])
+        cohort = period_index(_days(cohort_ts.to_numpy()[known]), period)
+        active = period_index(_days(events['timestamp'].to_numpy()[known]), period)
+
+        span = int(active.max()) - origin + 1
+        cell = (cohort - origin) * span + (active - origin)
+        # One count per user per cell
+        unique_cells = np.unique(cell * (int(user_codes.max()) + 1) + user_codes) // (int(user_codes.max()) + 1)
+        counts = np.bincount(unique_cells, minlength=span * span)
+
+        return {
+            (int(origin + i // span), int(origin + i % span)): int(n)
+            for i, n in zip(np.flatnonzero(counts), counts[np.flatnonzero(counts)])
+        }
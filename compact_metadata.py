@@ -0,0 +1,219 @@
+"""
+Compact binary encoding for interaction metadata.
+
+With ``METADATA_ENCODING=msgpack`` the ``metadata`` column stores msgpack
+bytes (zstd-compressed with a shared dictionary when ``METADATA_ZSTD_DICT``
+points at one) instead of JSON text. Values are returned as
+``LazyMetadata`` mappings that keep the raw bytes and only decode them when
+a key is first read, so queries that never look at metadata never pay for
+parsing it. Legacy JSON values are still readable, which lets ``migrate``
+re-encode existing rows in batches.
+"""
+
+import json
+import os
+import threading
+from collections.abc import Mapping
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+METADATA_ENCODING = os.getenv('METADATA_ENCODING', 'json')
+ZSTD_DICT_PATH = os.getenv('METADATA_ZSTD_DICT')
+
+# First byte of every encoded value; JSON text never starts with these
+MSGPACK = b'\x01'
+ZSTD_MSGPACK = b'\x02'
+
+_local = threading.local()
+
+
+def _zstd_dict():
+    """Shared compression dictionary, or None if not configured."""
+    if not ZSTD_DICT_PATH or not os.path.exists(ZSTD_DICT_PATH):
+        return None
+    import zstandard
+    if not hasattr(_local, 'zstd_dict'):
+        with open(ZSTD_DICT_PATH, 'rb') as f:
+            _local.zstd_dict = zstandard.ZstdCompressionDict(f.read())
+    return _local.zstd_dict
+
+
+def encode(value):
+    """Encode a metadata mapping to bytes."""
+    import msgpack
+    packed = msgpack.packb(value, use_bin_type=True)
+    dictionary = _zstd_dict()
+    if dictionary is None:
+        return MSGPACK + packed
+    import zstandard
+    if not hasattr(_local, 'compressor'):
+        _local.compressor = zstandard.ZstdCompressor(level=3, dict_data=dictionary)
+    return ZSTD_MSGPACK + _local.compressor.compress(packed)
+
+
+def decode(raw):
+    """Decode bytes (or legacy JSON text) back to a Python value."""
+    if raw is None:
+        return None
+    if isinstance(raw, str):
+        return json.loads(raw)
+    raw = bytes(raw)
+    tag, body = raw[:1], raw[1:]
+    if tag == MSGPACK:
+        import msgpack
+        return msgpack.unpackb(body, raw=False)
+    if tag == ZSTD_MSGPACK:
+        import msgpack
+        import zstandard
+        if not hasattr(_local, 'decompressor'):
+            _local.decompressor = zstandard.ZstdDecompressor(dict_data=_zstd_dict())
+        return msgpack.unpackb(_local.decompressor.decompress(body), raw=False)
+    return json.loads(raw.decode('utf-8'))
+
+
+class LazyMetadata(Mapping):
+    """Read-only mapping that decodes its raw value on first access."""
+
+    __slots__ = ('raw', '_value')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._value = None
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = decode(self.raw) or {}
+        return self._value
+
+    def __getitem__(self, key):
+        return self.value[key]
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __eq__(self, other):
+        return self.value == (other.value if isinstance(other, LazyMetadata) else other)
+
+    def __repr__(self):
+        return f'LazyMetadata({self.value!r})'
+
+
+class CompactMetadata(TypeDecorator):
+    """Stores metadata as msgpack bytes and loads it as ``LazyMetadata``."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, LazyMetadata) and isinstance(value.raw, bytes):
+            return value.raw
+        return encode(dict(value) if isinstance(value, Mapping) else value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return LazyMetadata(value)
+
+
+def metadata_column_type():
+    """Column type for ``UserInteraction.meta_data`` per ``METADATA_ENCODING``."""
+    if METADATA_ENCODING == 'msgpack':
+        return CompactMetadata()
+    from sqlalchemy import JSON
+    return JSON()
+
+
+def plain(value):
+    """Return metadata as a plain dict (for JSON responses)."""
+    return dict(value) if isinstance(value, LazyMetadata) else value
+
+
+def migrate(batch_size=5000):
+    """
+    Re-encode existing JSON metadata as msgpack, in id-ordered batches.
+
+    On PostgreSQL the column is first converted from json to bytea. Rows that
+    are already encoded are skipped, so the migration can be re-run after an
+    interruption.
+
+    Returns:
+        Number of rows re-encoded
+    """
+    from sqlalchemy import text
+    from database import db, UserInteraction
+
+    table = UserInteraction.__tablename__
+    if db.engine.dialect.name == 'postgresql':
+        column_type = db.session.execute(text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = :table AND column_name = 'metadata'"
+        ), {'table': table}).scalar()
+        if column_type != 'bytea':
+            db.session.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN metadata TYPE bytea "
+                f"USING convert_to(metadata::text, 'UTF8')"
+            ))
+            db.session.commit()
+
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(text(
+            f'SELECT id, metadata FROM {table} WHERE id > :last_id AND metadata IS NOT NULL '
+            f'ORDER BY id LIMIT :limit'
+        ), {'last_id': last_id, 'limit': batch_size}).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = []
+        for row_id, raw in rows:
+            if isinstance(raw, (bytes, bytearray, memoryview)) and bytes(raw[:1]) in (MSGPACK, ZSTD_MSGPACK):
+                continue
+            updates.append({'id': row_id, 'metadata': encode(decode(raw))})
+        if updates:
+            db.session.execute(text(f'UPDATE {table} SET metadata = :metadata WHERE id = :id'), updates)
+            db.session.commit()
+            migrated += len(updates)
+    return migrated
+
+
+def train_dictionary(path, samples=20000, size=16 * 1024):
+    """Train a zstd dictionary from stored metadata and write it to ``path``."""
+    import msgpack
+    import zstandard
+    from sqlalchemy import text
+    from database import db, UserInteraction
+
+    rows = db.session.execute(text(
+        f'SELECT metadata FROM {UserInteraction.__tablename__} WHERE metadata IS NOT NULL '
+        f'ORDER BY id DESC LIMIT :limit'
+    ), {'limit': samples}).scalars().all()
+    packed = [msgpack.packb(decode(raw), use_bin_type=True) for raw in rows]
+    dictionary = zstandard.train_dictionary(size, packed)
+    with open(path, 'wb') as f:
+        f.write(dictionary.as_bytes())
+    return len(packed)
+
+
+if __name__ == '__main__':
+    import argparse
+    from flask_app import app
+
+    parser = argparse.ArgumentParser(description='Manage compact metadata encoding')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('migrate', help='Re-encode JSON metadata rows as msgpack')
+    train = sub.add_parser('train-dict', help='Train a shared zstd dictionary')
+    train.add_argument('path')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'migrate':
+            print(f"Re-encoded {migrate()} rows")
+        else:
+            print(f"Trained dictionary from {train_dictionary(args.path)} samples -> {args.path}")
@@ -1,10 +1,11 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 import requests
 import os
+import queue
+import threading
 from datetime import datetime, timedelta
+import live_events
 
 # Page configuration
 st.set_page_config(
@@ -16,12 +17,25 @@ st.set_page_config(
 
 # API Configuration
 API_BASE_URL = os.getenv('API_BASE_URL', 'http://localhost:5001/api')
+LIVE_REFRESH_SECONDS = float(os.getenv('LIVE_REFRESH_SECONDS', 2))
+# Longest wait between attempts to reach the live stream while the API is down
+LIVE_MAX_BACKOFF = 30
+# How long a new live feed may take to connect before the trends load without it
+LIVE_CONNECT_TIMEOUT = 5
 
 
-def fetch_trends(timeframe='7d'):
-    """Fetch behavioral trends from Flask API."""
+def fetch_trends(timeframe='7d', until_id=None):
+    """
+    Fetch behavioral trends from Flask API.
+
+    With ``until_id`` only interactions up to that id are counted, read on
+    the primary database, which has all of them.
+    """
     try:
-        response = requests.get(f"{API_BASE_URL}/analytics/trends", params={'timeframe': timeframe})
+        params = {'timeframe': timeframe}
+        if until_id is not None:
+            params.update(until_id=until_id, max_staleness=0)
+        response = requests.get(f"{API_BASE_URL}/analytics/trends", params=params)
         if response.status_code == 200:
             return response.json().get('trends', {})
         return {}
@@ -43,6 +57,122 @@ def fetch_patterns(user_id=None):
         return []
 
 
+class LiveFeed:
+    """
+    Read the API's live trends stream into a queue from a background thread.
+
+    ``events`` receives ``('hello', data)`` on every connection, with the
+    ``last_id`` the following deltas start after, then ``('delta', data)``.
+    The thread reconnects whenever the stream ends, waiting twice as long
+    after each failed attempt, up to ``LIVE_MAX_BACKOFF`` seconds. Nothing
+    is queued while the API is unreachable, so an outage leaves the loaded
+    trends on screen.
+    """
+
+    def __init__(self, timeframe):
+        self.events = queue.Queue()
+        self._response = None
+        self._closed = threading.Event()
+        threading.Thread(target=self._run, args=(timeframe,), daemon=True).start()
+
+    def _run(self, timeframe):
+        delay = 0
+        while not self._closed.wait(delay):
+            try:
+                self._response = requests.get(f"{API_BASE_URL}/live/trends", params={'timeframe': timeframe},
+                                              stream=True, timeout=(5, live_events.LIVE_HEARTBEAT * 2))
+                self._response.raise_for_status()
+            except Exception:
+                delay = min(max(delay * 2, 1), LIVE_MAX_BACKOFF)
+                continue
+            self._read()
+            # The stream ended (resync, API restart or network error)
+            delay = live_events.RETRY_MS / 1000
+
+    def _read(self):
+        try:
+            for event, data in live_events.parse_events(self._response.iter_lines(decode_unicode=True)):
+                if self._closed.is_set() or event == 'resync':
+                    return
+                if event in ('hello', 'delta'):
+                    self.events.put((event, data))
+        except Exception:
+            pass
+
+    def close(self):
+        self._closed.set()
+        if self._response is not None:
+            self._response.close()
+
+
+def _reload_trends(timeframe, last_id):
+    """Fetch the trends up to ``last_id``, where the live deltas continue."""
+    state = st.session_state
+    state.trends = fetch_trends(timeframe, until_id=last_id)
+    state.trends_last_id = last_id
+    state.trends_timeframe = timeframe
+    return state.trends
+
+
+def load_trends(timeframe, refresh=False, follow=True):
+    """
+    Trends kept in the session and brought up to date by the live stream.
+
+    The API's trends endpoint is called on the first run, on "Refresh Data",
+    when the timeframe or live setting changes and when the stream
+    reconnects after missing events. Other reruns reuse the session's copy.
+    """
+    state = st.session_state
+    feed = state.get('live_feed')
+    if state.get('trends_timeframe') != timeframe or follow != (feed is not None):
+        if feed is not None:
+            feed.close()
+        feed = state.live_feed = LiveFeed(timeframe) if follow else None
+        state.trends_last_id = None
+        if feed is not None:
+            # The first event is the hello saying where the deltas start
+            try:
+                state.trends_last_id = feed.events.get(timeout=LIVE_CONNECT_TIMEOUT)[1]['last_id']
+            except queue.Empty:
+                pass
+        refresh = True
+    if refresh or 'trends' not in state:
+        last_id = state.get('trends_last_id')
+        # Queued events are covered by the reload; continue after the newest
+        while feed is not None and not feed.events.empty():
+            last_id = feed.events.get_nowait()[1]['last_id']
+        return _reload_trends(timeframe, last_id)
+    return state.trends
+
+
+def apply_live_deltas(timeframe):
+    """Add the deltas received since the last run to the session's trends."""
+    state = st.session_state
+    feed = state.get('live_feed')
+    while feed is not None:
+        try:
+            event, data = feed.events.get_nowait()
+        except queue.Empty:
+            break
+        if event == 'hello':
+            # A new connection: reload unless the trends end where its deltas start
+            if data['last_id'] != state.trends_last_id:
+                _reload_trends(timeframe, data['last_id'])
+        else:
+            live_events.apply_delta(state.trends, data)
+            state.trends_last_id = data['last_id']
+    return state.trends
+
+
+def load_patterns(user_id=None, refresh=False):
+    """Patterns kept in the session until "Refresh Data" or a new user filter."""
+    state = st.session_state
+    if refresh or 'patterns' not in state or state.get('patterns_user') != user_id:
+        state.patterns = fetch_patterns(user_id)
+        state.patterns_user = user_id
+    return state.patterns
+
+
 def generate_demo_data():
     """Generate demo data by sending sample interactions to the API."""
     import random
@@ -90,7 +220,7 @@ def main():
         ### 🎯 How to Use This Dashboard
         
         1. **Generate Sample Data**: Click the "🎲 Generate Demo Data" button in the sidebar
-        2. **Refresh**: Click "Refresh Data" to update all visualizations
+        2. **Watch**: With "Live updates" on, new events appear within seconds; "Refresh Data" reloads everything
         3. **Explore**: Use the timeframe selector and filters to analyze patterns
         4. **Interact**: Hover over charts for detailed insights
         
@@ -129,7 +259,7 @@ def main():
             count = generate_demo_data()
             if count > 0:
                 st.sidebar.success(f"✅ Generated {count} interactions!")
-                st.sidebar.info("👇 Click 'Refresh Data' below to update charts")
+                st.sidebar.info("👇 Charts update live, or click 'Refresh Data' below")
                 st.balloons()
             else:
                 st.sidebar.error("⚠️ Generation failed. Check API connection.")
@@ -147,12 +277,38 @@ def main():
     
     user_filter = st.sidebar.text_input("Filter by User ID (optional)")
     
-    if st.sidebar.button("Refresh Data"):
-        st.rerun()
+    live_updates = st.sidebar.toggle("Live updates", value=True,
+                                     help="Add new events to the charts as they arrive")
+    refresh = st.sidebar.button("Refresh Data")
+    
+    # Load data (reruns reuse the session's copy)
+    load_trends(timeframe, refresh, follow=live_updates)
+    patterns = load_patterns(user_filter if user_filter else None, refresh)
     
-    # Fetch data
-    trends = fetch_trends(timeframe)
-    patterns = fetch_patterns(user_filter if user_filter else None)
+    # Only this section reruns to pick up live deltas
+    trends_section = st.fragment(run_every=LIVE_REFRESH_SECONDS if live_updates else None)(render_trends)
+    trends_section(timeframe, patterns)
+    
+    # Behavioral Patterns
+    st.header("🔍 Detected Behavioral Patterns")
+    if patterns:
+        for pattern in patterns:
+            with st.expander(f"{pattern.get('type', 'Unknown')} - Confidence: {pattern.get('confidence', 0):.2%}"):
+                st.json(pattern)
+    else:
+        st.info("No patterns detected yet. Data is being collected and analyzed in real-time.")
+    
+    # Real-time status
+    st.sidebar.markdown("---")
+    st.sidebar.markdown("### System Status")
+    st.sidebar.success("✅ Data Pipeline Active")
+    st.sidebar.success("✅ 99% Uptime")
+    st.sidebar.info(f"Last Updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+
+def render_trends(timeframe, patterns):
+    """Key metrics and trend charts, with any pending live deltas applied."""
+    trends = apply_live_deltas(timeframe)
     
     # Overview metrics
     st.header("📈 Key Metrics")
@@ -186,6 +342,9 @@ def main():
             delta=f"{len(patterns)} active"
         )
     
+    # Imported on first render rather than at startup
+    import plotly.express as px
+    
     # Daily Activity Chart
     st.header("📅 Daily Activity Trends")
     if trends.get('daily_activity'):
@@ -251,22 +410,6 @@ def main():
             st.plotly_chart(fig_pages, use_container_width=True)
         else:
             st.info("No page data available.")
-    
-    # Behavioral Patterns
-    st.header("🔍 Detected Behavioral Patterns")
-    if patterns:
-        for pattern in patterns:
-            with st.expander(f"{pattern.get('type', 'Unknown')} - Confidence: {pattern.get('confidence', 0):.2%}"):
-                st.json(pattern)
-    else:
-        st.info("No patterns detected yet. Data is being collected and analyzed in real-time.")
-    
-    # Real-time status
-    st.sidebar.markdown("---")
-    st.sidebar.markdown("### System Status")
-    st.sidebar.success("✅ Data Pipeline Active")
-    st.sidebar.success("✅ 99% Uptime")
-    st.sidebar.info(f"Last Updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
 
 if __name__ == "__main__":
@@ -1,20 +1,63 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import json
+import sqlite3
+import zlib
+from sqlalchemy import BigInteger, cast, event, func
+from sqlalchemy.engine import Engine
+from compact_metadata import metadata_column_type, plain
 
 db = SQLAlchemy()
 
 
+def create_schema():
+    """Create all tables, setting up native interaction partitioning first."""
+    from partitions import partition_manager
+    partition_manager.create_partitioned_table()
+    db.create_all()
+    partition_manager.ensure_increasing_ids()
+    partition_manager.ensure_future_partitions()
+
+
+def dialect_insert(model):
+    """Return an INSERT for ``model`` that supports ``on_conflict_do_update``."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
+def user_shard(user_id, shards):
+    """Shard (0 .. shards-1) of ``user_id``; matches ``shard_expression`` on SQLite."""
+    return zlib.crc32(user_id.encode()) % shards
+
+
+def shard_expression(column, shards):
+    """SQL expression assigning ``column`` (a user id) to one of ``shards`` shards."""
+    if db.engine.dialect.name == 'postgresql':
+        return func.mod(cast(func.hashtext(column), BigInteger) + 2147483648, shards)
+    return func.user_shard(column, shards)
+
+
+@event.listens_for(Engine, 'connect')
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('user_shard', 2, user_shard, deterministic=True)
+
+
 class UserInteraction(db.Model):
     """Model for storing user interaction data."""
     
     __tablename__ = 'user_interactions'
+    # Ids keep increasing after roll/archive empty the table: progress is tracked by id
+    __table_args__ = {'sqlite_autoincrement': True}
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(100), nullable=False, index=True)
     action = db.Column(db.String(100), nullable=False)
     page = db.Column(db.String(200), nullable=False)
-    meta_data = db.Column('metadata', db.JSON, nullable=True)
+    meta_data = db.Column('metadata', metadata_column_type(), nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     def __repr__(self):
@@ -27,7 +70,7 @@ class UserInteraction(db.Model):
             'user_id': self.user_id,
             'action': self.action,
             'page': self.page,
-            'metadata': self.meta_data,
+            'metadata': plain(self.meta_data),
             'timestamp': self.timestamp.isoformat()
         }
 
@@ -36,13 +79,19 @@ class BehaviorPattern(db.Model):
     """Model for storing recognized behavioral patterns."""
     
     __tablename__ = 'behavior_patterns'
+    __table_args__ = (
+        # One row per pattern; repeated detections update it (see pattern_store.py)
+        db.Index('uq_behavior_patterns_key', 'user_id', 'pattern_type', 'signature', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(100), nullable=False, index=True)
     pattern_type = db.Column(db.String(100), nullable=False)
+    signature = db.Column(db.String(200), nullable=False, default='')
     confidence = db.Column(db.Float, nullable=False)
+    frequency = db.Column(db.Integer, nullable=True)
     pattern_details = db.Column('details', db.JSON, nullable=True)
-    detected_at = db.Column(db.DateTime, default=datetime.utcnow)
+    detected_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     def __repr__(self):
         return f'<BehaviorPattern {self.id}: {self.pattern_type} - {self.confidence}>'
@@ -53,7 +102,209 @@ class BehaviorPattern(db.Model):
             'id': self.id,
             'user_id': self.user_id,
             'pattern_type': self.pattern_type,
+            'signature': self.signature,
             'confidence': self.confidence,
+            'frequency': self.frequency,
             'details': self.pattern_details,
             'detected_at': self.detected_at.isoformat()
         }
+
+
+class UserSession(db.Model):
+    """Model for storing sessionized user activity."""
+    
+    __tablename__ = 'sessions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(100), nullable=False, index=True)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False, index=True)
+    event_count = db.Column(db.Integer, nullable=False, default=0)
+    entry_page = db.Column(db.String(200), nullable=True)
+    exit_page = db.Column(db.String(200), nullable=True)
+    last_event_id = db.Column(db.Integer, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<UserSession {self.id}: {self.user_id} - {self.event_count} events>'
+    
+    def to_dict(self):
+        """Convert session to dictionary."""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'start_time': self.start_time.isoformat(),
+            'end_time': self.end_time.isoformat(),
+            'event_count': self.event_count,
+            'entry_page': self.entry_page,
+            'exit_page': self.exit_page,
+            'duration_seconds': (self.end_time - self.start_time).total_seconds()
+        }
+
+
+class PageTransition(db.Model):
+    """Model for storing page-to-page transition counts within sessions."""
+    
+    __tablename__ = 'page_transitions'
+    
+    from_page = db.Column(db.String(200), primary_key=True)
+    to_page = db.Column(db.String(200), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<PageTransition {self.from_page} -> {self.to_page}: {self.count}>'
+
+
+class UserFirstSeen(db.Model):
+    """Model for storing the first time each user was seen."""
+    
+    __tablename__ = 'user_first_seen'
+    
+    user_id = db.Column(db.String(100), primary_key=True)
+    first_seen = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<UserFirstSeen {self.user_id}: {self.first_seen}>'
+
+
+class Checkpoint(db.Model):
+    """Model for storing the last interaction id consumed by a background job."""
+    
+    __tablename__ = 'checkpoints'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @classmethod
+    def get(cls, name):
+        """Return the stored id for ``name`` (0 if never recorded)."""
+        checkpoint = db.session.get(cls, name)
+        return checkpoint.last_id if checkpoint else 0
+    
+    @classmethod
+    def advance(cls, name, last_id):
+        """Record ``last_id`` for ``name``; the caller commits."""
+        checkpoint = db.session.get(cls, name)
+        if checkpoint is None:
+            checkpoint = cls(name=name, last_id=last_id)
+            db.session.add(checkpoint)
+        else:
+            checkpoint.last_id = max(checkpoint.last_id, last_id)
+        checkpoint.updated_at = datetime.utcnow()
+        return checkpoint
+
+
+class WorkUnit(db.Model):
+    """Model for storing a leasable unit of pipeline work and its progress."""
+    
+    __tablename__ = 'work_units'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    kind = db.Column(db.String(50), nullable=False, index=True)
+    shard = db.Column(db.Integer, nullable=False, default=0)
+    shards = db.Column(db.Integer, nullable=False, default=1)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    owner = db.Column(db.String(100), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<WorkUnit {self.name}: {self.owner or "free"} @ {self.last_id}>'
+    
+    def to_dict(self):
+        """Convert work unit to dictionary."""
+        return {
+            'name': self.name,
+            'kind': self.kind,
+            'shard': self.shard,
+            'shards': self.shards,
+            'last_id': self.last_id,
+            'owner': self.owner,
+            'lease_expires_at': self.lease_expires_at.isoformat() if self.lease_expires_at else None,
+            'available_at': self.available_at.isoformat() if self.available_at else None
+        }
+
+
+class BackfillChunk(db.Model):
+    """Model for storing the progress of one date-range chunk of a backfill job."""
+    
+    __tablename__ = 'backfill_chunks'
+    
+    job = db.Column(db.String(100), primary_key=True)
+    start = db.Column(db.DateTime, primary_key=True)
+    end = db.Column(db.DateTime, nullable=False)
+    state = db.Column(db.String(20), nullable=False, default='pending')
+    rows = db.Column(db.Integer, nullable=True)
+    patterns = db.Column(db.Integer, nullable=True)
+    seconds = db.Column(db.Float, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<BackfillChunk {self.job}: {self.start} {self.state}>'
+    
+    def to_dict(self):
+        """Convert chunk to dictionary."""
+        return {
+            'job': self.job,
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+            'state': self.state,
+            'rows': self.rows,
+            'patterns': self.patterns,
+            'seconds': self.seconds,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class BackfillPattern(db.Model):
+    """Model for staging patterns recomputed by a backfill chunk until the job is swapped in."""
+    
+    __tablename__ = 'backfill_patterns'
+    __table_args__ = (db.Index('ix_backfill_patterns_chunk', 'job', 'chunk_start'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(100), nullable=False)
+    chunk_start = db.Column(db.DateTime, nullable=False)
+    user_id = db.Column(db.String(100), nullable=False)
+    pattern_type = db.Column(db.String(100), nullable=False)
+    signature = db.Column(db.String(200), nullable=False)
+    confidence = db.Column(db.Float, nullable=False)
+    frequency = db.Column(db.Integer, nullable=True)
+    pattern_details = db.Column('details', db.JSON, nullable=True)
+    detected_at = db.Column(db.DateTime, nullable=False)
+
+
+class BackfillFirstSeen(db.Model):
+    """Model for staging first-seen times recomputed by a backfill job."""
+    
+    __tablename__ = 'backfill_first_seen'
+    
+    job = db.Column(db.String(100), primary_key=True)
+    user_id = db.Column(db.String(100), primary_key=True)
+    first_seen = db.Column(db.DateTime, nullable=False)
+
+
+class PipelineStatus(db.Model):
+    """Model for storing the latest telemetry published by each pipeline process."""
+    
+    __tablename__ = 'pipeline_status'
+    
+    worker_id = db.Column(db.String(100), primary_key=True)
+    state = db.Column(db.String(20), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True)
+    details = db.Column(db.JSON, nullable=True)
+    
+    def __repr__(self):
+        return f'<PipelineStatus {self.worker_id}: {self.state}>'
+    
+    def to_dict(self):
+        """Convert status to dictionary."""
+        return {
+            'worker_id': self.worker_id,
+            'state': self.state,
+            'started_at': self.started_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            **(self.details or {})
+        }
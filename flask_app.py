@@ -1,9 +1,21 @@
-from flask import Flask, request, jsonify
-from datetime import datetime
+from flask import Flask, Response, request, jsonify
+from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
+from sqlalchemy import insert
 from database import db, UserInteraction
 from analytics import PatternRecognizer
+from funnels import FunnelAnalyzer
+from cohorts import CohortAnalyzer
+from transitions import TransitionIndex
+import metrics
+import bootstrap
+import live
+import profiling
+import read_routing
+import storage
+import telemetry
+from pattern_store import stored_patterns
 
 load_dotenv()
 
@@ -12,20 +24,17 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///cus
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
 
-db.init_app(app)
-
-# Initialize database tables
-with app.app_context():
-    db.create_all()
-    
-    # Auto-seed demo data on first run
-    try:
-        from seed_data import seed_demo_data
-        seed_demo_data()
-    except Exception as e:
-        print(f"Note: Could not seed demo data: {e}")
+storage.init_app(app)
+metrics.init_app(app)
+profiling.init_app(app)
+read_routing.init_app(app)
+live.init_app(app)
 
 pattern_recognizer = PatternRecognizer()
+funnel_analyzer = FunnelAnalyzer()
+cohort_analyzer = CohortAnalyzer()
+
+MAX_BATCH_EVENTS = int(os.getenv('MAX_BATCH_EVENTS', 1000))
 
 
 @app.route('/health', methods=['GET'])
@@ -34,6 +43,74 @@ def health_check():
     return jsonify({'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()}), 200
 
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request, SQL, analysis stage and pipeline metrics in Prometheus text format."""
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+
+@app.route('/api/pipeline/status', methods=['GET'])
+def get_pipeline_status():
+    """
+    Get live data pipeline telemetry.
+
+    Returns per-process stage timings, throughput, patterns per cycle and
+    end-to-end lag over a rolling window, plus a combined summary.
+    """
+    try:
+        status = telemetry.pipeline_status()
+        return jsonify({
+            'status': 'success',
+            'summary': telemetry.summarize(status),
+            'processes': status
+        }), 200
+
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/debug/slow-queries', methods=['GET'])
+def get_slow_queries():
+    """
+    Get the slowest SQL statements seen since startup, with parameters and plans.
+
+    Query parameters:
+        sort: 'total_ms', 'max_ms' or 'count' (default: total_ms)
+        limit: Number of statements to return (default: 10)
+    """
+    if not profiling.debug_allowed(request):
+        return jsonify({'status': 'error', 'message': 'debug endpoints are disabled'}), 404
+    try:
+        log = profiling.slow_query_log
+        return jsonify({
+            'status': 'success',
+            'threshold_ms': log.threshold * 1000,
+            'queries': log.top(int(request.args.get('limit', 10)), request.args.get('sort', 'total_ms'))
+        }), 200
+
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/debug/profiles', methods=['GET'])
+def get_profiles():
+    """List stored request profiles, newest first."""
+    if not profiling.debug_allowed(request):
+        return jsonify({'status': 'error', 'message': 'debug endpoints are disabled'}), 404
+    return jsonify({'status': 'success', 'profiles': profiling.list_profiles()}), 200
+
+
+@app.route('/api/debug/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Get a stored request profile in collapsed-stack format."""
+    folded = profiling.load_profile(profile_id) if profiling.debug_allowed(request) else None
+    if folded is None:
+        return jsonify({'status': 'error', 'message': 'profile not found'}), 404
+    return Response(folded, mimetype='text/plain')
+
+
 @app.route('/api/track', methods=['POST'])
 def track_interaction():
     """
@@ -71,12 +148,68 @@ def track_interaction():
         return jsonify({'status': 'error', 'message': str(e)}), 400
 
 
+def _parse_timestamp(value):
+    """Parse an ISO 8601 timestamp to naive UTC."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+@app.route('/api/track/batch', methods=['POST'])
+def track_batch():
+    """
+    Track many interactions in one request and one INSERT.
+
+    Expected JSON payload:
+    {
+        "events": [{"user_id": "string", "action": "string", "page": "string",
+                    "metadata": {}, "timestamp": "optional ISO 8601"}, ...]
+    }
+    """
+    try:
+        events = (request.get_json() or {}).get('events')
+        if not isinstance(events, list) or not events:
+            return jsonify({'status': 'error', 'message': 'events must be a non-empty list'}), 400
+        if len(events) > MAX_BATCH_EVENTS:
+            return jsonify({'status': 'error', 'message': f'at most {MAX_BATCH_EVENTS} events per batch'}), 413
+
+        now = datetime.utcnow()
+        rows = []
+        for event in events:
+            if not all(event.get(field) for field in ('user_id', 'action', 'page')):
+                return jsonify({'status': 'error', 'message': 'user_id, action and page are required'}), 400
+            rows.append({
+                'user_id': event['user_id'],
+                'action': event['action'],
+                'page': event['page'],
+                'meta_data': event.get('metadata', {}),
+                'timestamp': _parse_timestamp(event['timestamp']) if event.get('timestamp') else now
+            })
+
+        ids = db.session.scalars(
+            insert(UserInteraction).returning(UserInteraction.id, sort_by_parameter_order=True), rows
+        ).all()
+        db.session.commit()
+
+        return jsonify({
+            'status': 'success',
+            'count': len(ids),
+            'interaction_ids': ids
+        }), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+
 @app.route('/api/analytics/patterns', methods=['GET'])
+@read_routing.routed
 def get_patterns():
     """Get behavioral patterns with 97% accuracy."""
     try:
         user_id = request.args.get('user_id')
-        patterns = pattern_recognizer.analyze_patterns(user_id)
+        patterns = pattern_recognizer.analyze_patterns(user_id, backend=request.args.get('backend'))
         
         return jsonify({
             'status': 'success',
@@ -88,24 +221,216 @@ def get_patterns():
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+@app.route('/api/patterns', methods=['GET'])
+@read_routing.routed
+def get_stored_patterns():
+    """
+    Get patterns stored by the data pipeline, most recently detected first.
+    
+    Query parameters:
+        user_id: Optional user ID
+        type: Optional pattern type (e.g. common_sequence)
+        since: Optional ISO 8601 lower bound on detection time
+        limit: Maximum number of patterns (default: 100)
+    """
+    try:
+        since = request.args.get('since')
+        patterns = stored_patterns(
+            user_id=request.args.get('user_id'),
+            pattern_type=request.args.get('type'),
+            since=_parse_timestamp(since) if since else None,
+            limit=min(int(request.args.get('limit', 100)), 1000)
+        )
+        
+        return jsonify({
+            'status': 'success',
+            'patterns': patterns,
+            'count': len(patterns)
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
 @app.route('/api/analytics/trends', methods=['GET'])
+@read_routing.routed
 def get_trends():
-    """Get behavioral trends for dashboards."""
+    """
+    Get behavioral trends for dashboards.
+
+    Query parameters:
+        timeframe: Time period (default: 7d)
+        backend: Optional execution backend ('pandas' or 'duckdb')
+        until_id: Optional highest interaction id to count, e.g. the
+            ``last_id`` of the live stream's ``hello`` event (pass
+            max_staleness=0 with it so the read sees every such id)
+    """
     try:
         timeframe = request.args.get('timeframe', '7d')
-        trends = pattern_recognizer.get_trends(timeframe)
+        until_id = request.args.get('until_id')
+        trends = pattern_recognizer.get_trends(
+            timeframe, backend=request.args.get('backend'),
+            until_id=int(until_id) if until_id is not None else None
+        )
         
         return jsonify({
             'status': 'success',
             'trends': trends
         }), 200
         
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/live/trends', methods=['GET'])
+def stream_live_trends():
+    """
+    Stream trend deltas as Server-Sent Events.
+
+    Query parameters:
+        timeframe: '7d', '30d' or '90d' (default: 7d)
+
+    Events: ``hello`` on connect with the ``last_id`` the deltas start
+    after, ``delta`` with the new events per action, page and day and the
+    new unique users in the timeframe, and ``resync`` when the client fell
+    behind and should reconnect and reload /api/analytics/trends.
+    """
+    try:
+        timeframe = live.check_timeframe(request.args.get('timeframe', '7d'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    broadcaster = app.extensions['live']
+    subscriber = broadcaster.subscribe()
+    if subscriber is None:
+        return jsonify({'status': 'error', 'message': 'too many live subscribers'}), 503
+    return Response(broadcaster.stream(subscriber, timeframe), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/analytics/funnel', methods=['GET'])
+@read_routing.routed
+def get_funnel():
+    """
+    Get step-by-step funnel conversion.
+    
+    Query parameters:
+        steps: Comma-separated ordered actions (e.g. page_view,add_to_cart,checkout)
+        window: Conversion window measured from the first step (default: 1d)
+        breakdown: Optional 'device' or 'referrer'
+        timeframe: How far back to look for funnel entries (default: 30d)
+    """
+    try:
+        steps = [s.strip() for s in request.args.get('steps', '').split(',') if s.strip()]
+        if not steps:
+            return jsonify({'status': 'error', 'message': 'steps is required'}), 400
+        
+        funnel = funnel_analyzer.analyze(
+            steps,
+            window=request.args.get('window', '1d'),
+            breakdown=request.args.get('breakdown'),
+            timeframe=request.args.get('timeframe', '30d')
+        )
+        
+        return jsonify({
+            'status': 'success',
+            'funnel': funnel
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/analytics/cohorts', methods=['GET'])
+def get_cohorts():
+    """
+    Get the retention matrix by first-seen cohort.
+    
+    Query parameters:
+        period: 'day' or 'week' (default: week)
+        periods: Number of cohorts to return (default: 8)
+    """
+    try:
+        retention = cohort_analyzer.retention(
+            period=request.args.get('period', 'week'),
+            periods=int(request.args.get('periods', 8))
+        )
+        
+        return jsonify({
+            'status': 'success',
+            'retention': retention
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/analytics/transitions/next', methods=['GET'])
+@read_routing.routed
+def get_next_pages():
+    """Get the most likely next pages after a given page."""
+    try:
+        page = request.args.get('page')
+        if not page:
+            return jsonify({'status': 'error', 'message': 'page is required'}), 400
+        
+        limit = int(request.args.get('limit', 5))
+        
+        return jsonify({
+            'status': 'success',
+            'page': page,
+            'next_pages': TransitionIndex.get().next_pages(page, limit)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/analytics/transitions/paths', methods=['GET'])
+@read_routing.routed
+def get_top_paths():
+    """Get the most frequent navigation paths."""
+    try:
+        limit = int(request.args.get('limit', 10))
+        length = int(request.args.get('length', 2))
+        
+        return jsonify({
+            'status': 'success',
+            'paths': TransitionIndex.get().top_paths(limit, length)
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/analytics/transitions/exits', methods=['GET'])
+@read_routing.routed
+def get_exit_rates():
+    """Get pages ranked by exit rate."""
+    try:
+        limit = int(request.args.get('limit', 10))
+        
+        return jsonify({
+            'status': 'success',
+            'exit_rates': TransitionIndex.get().exit_rates(limit)
+        }), 200
+        
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
+    bootstrap.initialize(app)
     port = int(os.getenv('PORT', 5001))
     app.run(debug=os.getenv('FLASK_ENV') != 'production', host='0.0.0.0', port=port)
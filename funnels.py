@@ -0,0 +1,169 @@
+"""
+Funnel analysis over ordered event streams.
+
+A funnel is an ordered list of actions (e.g. ``page_view`` -> ``add_to_cart``
+-> ``checkout``). A user converts through a step when they perform it after
+the previous step and within the conversion window of entering the funnel.
+Each step is one vectorized pass over the user-sorted events, so the cost is
+O(steps x events) with no self-joins.
+"""
+
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+from database import db, UserInteraction
+from queries import interactions_frame
+
+BREAKDOWN_FIELDS = ('device', 'referrer')
+
+_WINDOW_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+
+def parse_window(window):
+    """Parse a window such as '30m', '2h' or '7d' into a timedelta."""
+    if isinstance(window, timedelta):
+        return window
+    match = re.fullmatch(r'\s*(\d+)\s*([smhdw])\s*', str(window))
+    if not match:
+        raise ValueError(f"Invalid window '{window}', expected e.g. '30m', '2h' or '7d'")
+    return timedelta(**{_WINDOW_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def compute_funnel(events, steps, window, breakdown=None):
+    """
+    Compute per-step funnel conversion.
+
+    Args:
+        events: DataFrame sorted by (user_id, timestamp) with columns
+            user_id, action, timestamp (and ``breakdown`` if given)
+        steps: Ordered list of action names
+        window: Conversion window as a timedelta, measured from the first step
+        breakdown: Optional column whose value at the funnel entry event
+            is used to split the results
+
+    Returns:
+        Dictionary with overall step counts and, if requested, one entry per
+        breakdown value
+    """
+    if not steps:
+        raise ValueError('A funnel needs at least one step')
+
+    codes, users = pd.factorize(events['user_id'].to_numpy())
+    n_users = len(users)
+    actions = events['action'].to_numpy()
+    ts = events['timestamp'].to_numpy(dtype='datetime64[ns]').view('int64')
+    positions = np.arange(len(events))
+    window_ns = int(window.total_seconds() * 1e9)
+
+    # Entry: each user's earliest first-step event
+    entry_pos = np.full(n_users, -1, dtype='int64')
+    first_hits = positions[actions == steps[0]]
+    entered, first_idx = np.unique(codes[first_hits], return_index=True)
+    entry_pos[entered] = first_hits[first_idx]
+
+    reached = np.zeros((len(steps), n_users), dtype=bool)
+    reached[0] = entry_pos >= 0
+    deadline = np.where(reached[0], ts[np.maximum(entry_pos, 0)] + window_ns, np.iinfo('int64').min)
+    prev_pos = entry_pos.copy()
+
+    for i, step in enumerate(steps[1:], start=1):
+        hits = positions[actions == step]
+        hit_users = codes[hits]
+        ok = reached[i - 1][hit_users] & (hits > prev_pos[hit_users]) & (ts[hits] <= deadline[hit_users])
+        hits, hit_users = hits[ok], hit_users[ok]
+        # Events are user-sorted, so the first surviving hit per user is the earliest
+        step_users, first_idx = np.unique(hit_users, return_index=True)
+        reached[i, step_users] = True
+        prev_pos[step_users] = hits[first_idx]
+
+    result = {'steps': _summarize(steps, reached.sum(axis=1))}
+
+    if breakdown:
+        values = events[breakdown].to_numpy()[np.maximum(entry_pos, 0)]
+        group_codes, groups = pd.factorize(pd.Series(values).fillna('unknown').where(reached[0]))
+        result['breakdown'] = {}
+        for g, group in enumerate(groups):
+            counts = reached[:, group_codes == g].sum(axis=1)
+            result['breakdown'][str(group)] = _summarize(steps, counts)
+
+    return result
+
+
+def _summarize(steps, counts):
+    """Turn per-step user counts into conversion rates."""
+    summary = []
+    entered = int(counts[0])
+    for i, step in enumerate(steps):
+        users = int(counts[i])
+        previous = int(counts[i - 1]) if i else users
+        summary.append({
+            'step': step,
+            'users': users,
+            'conversion_rate': users / entered if entered else 0.0,
+            'step_conversion': users / previous if previous else 0.0
+        })
+    return summary
+
+
+class FunnelAnalyzer:
+    """
+    Runs funnels against the database and caches results per
+    (funnel, window, breakdown, timeframe).
+
+    Cached results are reused until new interactions are tracked or the
+    entry is older than ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl=None, max_entries=128):
+        self.ttl = ttl if ttl is not None else int(os.getenv('FUNNEL_CACHE_TTL', 60))
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+
+    def analyze(self, steps, window='1d', breakdown=None, timeframe='30d'):
+        """
+        Compute a funnel over recent interactions.
+
+        Args:
+            steps: Ordered list of action names
+            window: Conversion window (e.g. '1h', '1d')
+            breakdown: Optional metadata field ('device' or 'referrer')
+            timeframe: How far back to look for funnel entries (e.g. '30d')
+
+        Returns:
+            Dictionary of funnel results
+        """
+        steps = [s for s in steps if s]
+        if breakdown and breakdown not in BREAKDOWN_FIELDS:
+            raise ValueError(f"Unsupported breakdown '{breakdown}', expected one of {BREAKDOWN_FIELDS}")
+        window = parse_window(window)
+        days = int(timeframe.rstrip('d'))
+
+        key = (tuple(steps), window, breakdown, days)
+        version = db.session.execute(select(func.max(UserInteraction.id))).scalar()
+        cached = self._cache.get(key)
+        if cached and cached[0] == version and time.monotonic() - cached[1] < self.ttl:
+            self._cache.move_to_end(key)
+            return cached[2]
+
+        events = interactions_frame(
+            start=datetime.utcnow() - timedelta(days=days),
+            actions=set(steps),
+            with_metadata=bool(breakdown),
+            order_by_user=True
+        )
+        if breakdown:
+            events[breakdown] = [m.get(breakdown) if m else None for m in events['metadata']]
+
+        result = compute_funnel(events, steps, window, breakdown)
+        result['window_seconds'] = int(window.total_seconds())
+
+        self._cache[key] = (version, time.monotonic(), result)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return result
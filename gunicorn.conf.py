@@ -0,0 +1,60 @@
+"""
+gunicorn settings for the Flask API (picked up automatically from the
+working directory).
+
+    gunicorn 'wsgi:create_app()'
+
+Every setting can be overridden with the environment variables below or
+on the command line.
+
+- ``preload_app``: the app, the database setup and the heavy libraries are
+  loaded once in the master and shared by the forked workers.
+- ``gthread`` workers: each process serves ``GUNICORN_THREADS`` requests at
+  once, so requests waiting on the database do not hold a whole process,
+  while separate processes let CPU-bound analysis run in parallel.
+- ``max_requests`` recycles workers to bound memory growth from pandas
+  frames; the jitter keeps them from restarting together.
+- Each live trends stream (``/api/live/trends``) holds a thread for as
+  long as it is open, so ``post_fork`` caps streams at ``threads - 1`` per
+  worker unless ``LIVE_MAX_SUBSCRIBERS`` is set.
+- Workers write their metrics to ``METRICS_MULTIPROC_DIR`` (a temporary
+  directory by default), so ``/metrics`` on any worker reports all of them.
+"""
+
+import os
+import shutil
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+# WEB_CONCURRENCY is set by Heroku and Render to suit the instance size
+workers = int(os.getenv('WEB_CONCURRENCY') or os.cpu_count() or 1)
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+metrics_dir = os.getenv('METRICS_MULTIPROC_DIR') or tempfile.mkdtemp(prefix='gunicorn-metrics-')
+
+
+def on_starting(server):
+    from metrics import clear_directory
+    if os.path.isdir(metrics_dir):
+        clear_directory(metrics_dir)
+
+
+def on_exit(server):
+    if not os.getenv('METRICS_MULTIPROC_DIR'):
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def post_fork(server, worker):
+    from wsgi import after_fork
+    after_fork(threads=worker.cfg.threads, metrics_dir=metrics_dir)
@@ -0,0 +1,309 @@
+"""
+Bulk import of historical interactions from CSV, NDJSON or Parquet.
+
+Files are streamed in chunks. Timestamps are parsed and formatted for the
+database column-wise, metadata is normalized to JSON text (or encoded with
+the compact metadata encoding), and each chunk is written in a single
+transaction: ``COPY`` on PostgreSQL, a prepared ``executemany`` on SQLite.
+The number of source rows consumed is stored as a checkpoint in the same
+transaction, so an interrupted import resumes where it stopped.
+
+Usage:
+    python importer.py data/interactions.csv
+    python importer.py exports/2023.parquet --chunk-size 200000 --rebuild-indexes
+"""
+
+import ast
+import hashlib
+import io
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from database import db, dialect_insert, UserInteraction, Checkpoint
+import compact_metadata
+
+FORMATS = ('csv', 'ndjson', 'parquet')
+COLUMNS = ('user_id', 'action', 'page', 'metadata', 'timestamp')
+CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 100000))
+
+
+def detect_format(path):
+    """Guess the input format from the file extension."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.parquet', '.pq'):
+        return 'parquet'
+    if ext in ('.ndjson', '.jsonl', '.json'):
+        return 'ndjson'
+    return 'csv'
+
+
+def read_chunks(path, fmt=None, chunk_size=CHUNK_SIZE):
+    """Yield DataFrames of at most ``chunk_size`` source rows."""
+    fmt = fmt or detect_format(path)
+    if fmt == 'csv':
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False, na_values=[''])
+    elif fmt == 'ndjson':
+        yield from pd.read_json(path, lines=True, chunksize=chunk_size, dtype=False, convert_dates=False)
+    elif fmt == 'parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unknown format '{fmt}', expected one of {FORMATS}")
+
+
+def format_timestamps(values):
+    """
+    Format datetime64 values the way SQLAlchemy stores SQLite DATETIMEs
+    ('YYYY-MM-DD HH:MM:SS.ffffff') without a per-row strftime.
+    """
+    text = np.datetime_as_string(values.astype('datetime64[us]'), unit='us').astype('U26')
+    chars = text.view('U1').reshape(len(text), 26)
+    chars[:, 10] = ' '
+    return chars.view('U26').ravel().tolist()
+
+
+def metadata_text(values):
+    """
+    Normalize a metadata column to JSON text (None where missing).
+
+    String columns are passed through as-is apart from Python dict reprs
+    (as written by ``data/generate_data.py``), which are converted; parsed
+    objects from NDJSON or Parquet are serialized.
+    """
+    present = values.notna().to_numpy()
+    out = np.full(len(values), None, dtype=object)
+    if not present.any():
+        return out
+    if pd.api.types.infer_dtype(values, skipna=True) == 'string':
+        text = values[present]
+        out[present] = text.to_numpy(dtype=object)
+        reprs = text.str.startswith("{'").to_numpy(dtype=bool)
+        if reprs.any():
+            rows = np.flatnonzero(present)[reprs]
+            out[rows] = [json.dumps(ast.literal_eval(v)) for v in out[rows]]
+        return out
+    out[present] = [
+        v if isinstance(v, str) else json.dumps(dict(v) if hasattr(v, 'keys') else v)
+        for v in values[present]
+    ]
+    return out
+
+
+def _as_text(values):
+    return values if pd.api.types.infer_dtype(values, skipna=True) == 'string' else values.astype(str)
+
+
+def prepare_chunk(df):
+    """
+    Validate and normalize one chunk.
+
+    Returns:
+        (DataFrame with COLUMNS ready to insert, number of rejected rows)
+    """
+    missing = {'user_id', 'action', 'page', 'timestamp'} - set(df.columns)
+    if missing:
+        raise ValueError(f"Input is missing columns: {', '.join(sorted(missing))}")
+
+    timestamps = pd.to_datetime(df['timestamp'], format='ISO8601', utc=True, errors='coerce').dt.tz_localize(None)
+    valid = timestamps.notna().to_numpy().copy()
+    for column in ('user_id', 'action', 'page'):
+        valid &= df[column].notna().to_numpy()
+    df, timestamps = df[valid], timestamps[valid]
+
+    out = pd.DataFrame({
+        **{column: _as_text(df[column]) for column in ('user_id', 'action', 'page')},
+        'metadata': metadata_text(df['metadata']) if 'metadata' in df else None,
+        'timestamp': format_timestamps(timestamps.to_numpy()),
+    })
+    return out, int((~valid).sum())
+
+
+def _encode_metadata(values, binary_literal=False):
+    """Apply the configured metadata encoding to JSON text values."""
+    if compact_metadata.METADATA_ENCODING != 'msgpack':
+        return values
+    encoded = [compact_metadata.encode(json.loads(v)) if v is not None else None for v in values]
+    if binary_literal:
+        return [('\\x' + v.hex()) if v is not None else None for v in encoded]
+    return encoded
+
+
+def _write_sqlite(conn, chunk):
+    rows = list(zip(
+        chunk['user_id'].tolist(), chunk['action'].tolist(), chunk['page'].tolist(),
+        _encode_metadata(chunk['metadata'].tolist()), chunk['timestamp']
+    ))
+    conn.exec_driver_sql(
+        f'INSERT INTO {UserInteraction.__tablename__} (user_id, action, page, metadata, timestamp) '
+        f'VALUES (?, ?, ?, ?, ?)', rows
+    )
+
+
+def _write_postgres(conn, chunk):
+    chunk = chunk.assign(metadata=_encode_metadata(chunk['metadata'].tolist(), binary_literal=True))
+    buffer = io.StringIO()
+    chunk.to_csv(buffer, columns=list(COLUMNS), header=False, index=False)
+    buffer.seek(0)
+    cursor = conn.connection.cursor()
+    cursor.copy_expert(
+        f"COPY {UserInteraction.__tablename__} (user_id, action, page, metadata, timestamp) "
+        f"FROM STDIN WITH (FORMAT csv)", buffer
+    )
+
+
+def _prepared_chunks(path, fmt, chunk_size, done):
+    """
+    Yield (prepared chunk, rejected rows, source rows consumed so far),
+    skipping the first ``done`` source rows. Reading and parsing run in a
+    background thread, one chunk ahead of the writer.
+    """
+    ready = queue.Queue(maxsize=2)
+
+    def produce():
+        try:
+            consumed = 0
+            for df in read_chunks(path, fmt, chunk_size):
+                if consumed + len(df) <= done:
+                    consumed += len(df)
+                    continue
+                if consumed < done:
+                    df = df.iloc[done - consumed:]
+                    consumed = done
+                consumed += len(df)
+                ready.put(prepare_chunk(df) + (consumed,))
+            ready.put(None)
+        except BaseException as e:
+            ready.put(e)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = ready.get()
+        if item is None:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def write_chunk(conn, chunk):
+    """Insert a prepared chunk on ``conn`` (inside the caller's transaction)."""
+    if conn.dialect.name == 'postgresql':
+        _write_postgres(conn, chunk)
+    else:
+        _write_sqlite(conn, chunk)
+
+
+def _set_indexes(enabled):
+    """Drop (``enabled=False``) or rebuild the secondary interaction indexes."""
+    with db.engine.begin() as conn:
+        for index in UserInteraction.__table__.indexes:
+            if enabled:
+                index.create(conn, checkfirst=True)
+            else:
+                index.drop(conn, checkfirst=True)
+
+
+def checkpoint_name(path):
+    """Checkpoint name for ``path``, unique per absolute path and within the column's 100 characters."""
+    return 'import:' + hashlib.sha256(os.path.abspath(path).encode()).hexdigest()
+
+
+def import_file(path, fmt=None, chunk_size=CHUNK_SIZE, rebuild_indexes=False, restart=False, progress=None):
+    """
+    Import interactions from ``path``.
+
+    Args:
+        path: CSV, NDJSON or Parquet file with user_id, action, page,
+            timestamp and optional metadata columns
+        fmt: Input format (detected from the extension by default)
+        chunk_size: Source rows per transaction
+        rebuild_indexes: Drop secondary indexes for the load and rebuild them after
+        restart: Ignore a stored checkpoint and import from the first row
+        progress: Optional callback receiving the running stats after each chunk
+
+    Returns:
+        Dictionary with rows imported, rejected and skipped (already imported
+        by an earlier run), elapsed seconds and rows per second
+    """
+    name = checkpoint_name(path)
+    done = 0 if restart else Checkpoint.get(name)
+    db.session.remove()
+
+    stats = {'rows': 0, 'rejected': 0, 'skipped': done, 'seconds': 0.0, 'rows_per_second': 0.0}
+
+    if rebuild_indexes:
+        _set_indexes(False)
+    started = time.perf_counter()
+    conn = db.engine.connect()
+    synchronous = None
+    try:
+        if conn.dialect.name == 'sqlite':
+            # Skip the fsync per commit for the load. SQLite only accepts the
+            # change outside a transaction, and the connection goes back to the
+            # pool afterwards, so it is restored in ``finally``.
+            synchronous = conn.exec_driver_sql('PRAGMA synchronous').scalar()
+            conn.exec_driver_sql('PRAGMA synchronous = OFF')
+            conn.commit()
+        for chunk, rejected, consumed in _prepared_chunks(path, fmt, chunk_size, done):
+            with conn.begin():
+                if len(chunk):
+                    write_chunk(conn, chunk)
+                conn.execute(dialect_insert(Checkpoint).values(
+                    name=name, last_id=consumed, updated_at=datetime.utcnow()
+                ).on_conflict_do_update(
+                    index_elements=['name'], set_={'last_id': consumed, 'updated_at': datetime.utcnow()}
+                ))
+
+            stats['rows'] += len(chunk)
+            stats['rejected'] += rejected
+            stats['seconds'] = time.perf_counter() - started
+            stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+            if progress:
+                progress(stats)
+    finally:
+        if synchronous is not None:
+            conn.rollback()
+            conn.exec_driver_sql(f'PRAGMA synchronous = {int(synchronous)}')
+            conn.commit()
+        conn.close()
+        # Also after a failed chunk: the committed rows stay and need their indexes
+        if rebuild_indexes:
+            _set_indexes(True)
+            stats['seconds'] = time.perf_counter() - started
+    return stats
+
+
+if __name__ == '__main__':
+    import argparse
+    from flask_app import app
+    from database import create_schema
+    from partitions import partition_manager
+
+    parser = argparse.ArgumentParser(description='Bulk import interactions')
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=FORMATS, help='Input format (default: from extension)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows per transaction')
+    parser.add_argument('--rebuild-indexes', action='store_true',
+                        help='Drop secondary indexes during the load and rebuild them afterwards')
+    parser.add_argument('--restart', action='store_true', help='Ignore the resume checkpoint')
+    args = parser.parse_args()
+
+    def report(stats):
+        print(f"  {stats['skipped'] + stats['rows'] + stats['rejected']:,} rows read, "
+              f"{stats['rows_per_second']:,.0f} rows/s")
+
+    with app.app_context():
+        create_schema()
+        stats = import_file(args.path, args.format, args.chunk_size, args.rebuild_indexes, args.restart, report)
+        print(f"Imported {stats['rows']:,} interactions in {stats['seconds']:.1f}s "
+              f"({stats['rows_per_second']:,.0f} rows/s); rejected {stats['rejected']}, "
+              f"skipped {stats['skipped']:,} already imported")
+        moved = partition_manager.roll()
+        if moved:
+            print(f"Moved {moved:,} interactions into closed partitions")
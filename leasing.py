@@ -0,0 +1,156 @@
+"""
+Leased units of pipeline work shared by several worker processes.
+
+Each row of ``work_units`` is a unit of work with its own progress
+(``last_id``). A worker claims a free unit by writing its lease token into
+``owner`` with an expiry; on PostgreSQL the candidate row is picked with
+``SELECT ... FOR UPDATE SKIP LOCKED`` so concurrent claims never wait on
+each other, on SQLite a single ``UPDATE ... WHERE name = (SELECT ...)``
+claims atomically under the database write lock. A unit whose lease has
+expired (its worker crashed or stalled) is claimable again.
+
+Progress is fenced: ``advance`` only moves ``last_id`` while the caller
+still owns the lease and runs in the caller's transaction, so work done
+under a lease that was lost meanwhile is rolled back instead of applied
+twice.
+"""
+
+import os
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import or_, select, update
+from database import db, dialect_insert, WorkUnit
+
+LEASE_SECONDS = int(os.getenv('PIPELINE_LEASE_SECONDS', 300))
+
+
+class LeaseLost(RuntimeError):
+    """Raised when a lease expired and was claimed by another worker."""
+
+
+class Lease:
+    """A claimed work unit."""
+
+    def __init__(self, name, kind, shard, shards, last_id, token):
+        self.name = name
+        self.kind = kind
+        self.shard = shard
+        self.shards = shards
+        self.last_id = last_id
+        self.token = token
+
+    def __repr__(self):
+        return f'<Lease {self.name} @ {self.last_id} by {self.token}>'
+
+
+def unit_name(kind, shard=0, shards=1):
+    return f'{kind}:{shard}/{shards}' if shards > 1 else kind
+
+
+def ensure_units(kind, shards=1, last_id=0):
+    """
+    Create the ``shards`` units of ``kind`` if they do not exist yet.
+
+    Args:
+        kind: Unit kind, e.g. 'sessions'
+        shards: Number of shards to split the work into
+        last_id: Starting progress for newly created units
+
+    Raises:
+        ValueError: If units of ``kind`` exist with a different shard count
+    """
+    existing = set(db.session.scalars(select(WorkUnit.shards).where(WorkUnit.kind == kind)).all())
+    if existing - {shards}:
+        raise ValueError(f'{kind} is split into {sorted(existing)} shards; '
+                         f'drain the pipeline and delete its work units before resharding to {shards}')
+    now = datetime.utcnow()
+    stmt = dialect_insert(WorkUnit).on_conflict_do_nothing(index_elements=[WorkUnit.name])
+    db.session.execute(stmt, [
+        {'name': unit_name(kind, shard, shards), 'kind': kind, 'shard': shard, 'shards': shards,
+         'last_id': last_id, 'available_at': now, 'updated_at': now}
+        for shard in range(shards)
+    ])
+    db.session.commit()
+
+
+def claim(kind, owner, lease_seconds=LEASE_SECONDS, now=None):
+    """
+    Lease the free unit of ``kind`` that has waited longest.
+
+    Args:
+        kind: Unit kind to claim
+        owner: Worker identifier, recorded with a random suffix as the lease token
+        lease_seconds: Time after which the lease can be claimed by others
+
+    Returns:
+        ``Lease`` or None if every unit is leased or not yet available
+    """
+    now = now or datetime.utcnow()
+    token = f'{owner}:{uuid.uuid4().hex[:8]}'[-100:]
+    claimable = (
+        (WorkUnit.kind == kind)
+        & (WorkUnit.available_at <= now)
+        & or_(WorkUnit.owner.is_(None), WorkUnit.lease_expires_at < now)
+    )
+    candidate = select(WorkUnit.name).where(claimable).order_by(WorkUnit.available_at, WorkUnit.name).limit(1)
+
+    if db.engine.dialect.name == 'postgresql':
+        name = db.session.execute(candidate.with_for_update(skip_locked=True)).scalar()
+        if name is None:
+            db.session.rollback()
+            return None
+        target = WorkUnit.name == name
+    else:
+        target = (WorkUnit.name == candidate.scalar_subquery()) & claimable
+
+    row = db.session.execute(
+        update(WorkUnit).where(target)
+        .values(owner=token, lease_expires_at=now + timedelta(seconds=lease_seconds), updated_at=now)
+        .returning(WorkUnit.name, WorkUnit.kind, WorkUnit.shard, WorkUnit.shards, WorkUnit.last_id)
+        .execution_options(synchronize_session=False)
+    ).first()
+    db.session.commit()
+    return Lease(*row, token) if row else None
+
+
+def _owned(lease):
+    return update(WorkUnit).where(WorkUnit.name == lease.name, WorkUnit.owner == lease.token) \
+        .execution_options(synchronize_session=False)
+
+
+def renew(lease, lease_seconds=LEASE_SECONDS):
+    """Extend a lease; returns False if it was lost."""
+    now = datetime.utcnow()
+    result = db.session.execute(_owned(lease).values(
+        lease_expires_at=now + timedelta(seconds=lease_seconds), updated_at=now))
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def advance(lease, last_id):
+    """
+    Record progress for a lease in the current transaction; the caller commits.
+
+    Raises:
+        LeaseLost: If the lease is no longer held
+    """
+    result = db.session.execute(_owned(lease).values(last_id=last_id, updated_at=datetime.utcnow()))
+    if result.rowcount != 1:
+        raise LeaseLost(f'{lease.name} is no longer leased by {lease.token}')
+    lease.last_id = last_id
+
+
+def release(lease, delay=0):
+    """Give a unit back, making it claimable again after ``delay`` seconds."""
+    now = datetime.utcnow()
+    db.session.execute(_owned(lease).values(
+        owner=None, lease_expires_at=None, available_at=now + timedelta(seconds=delay), updated_at=now))
+    db.session.commit()
+
+
+def units(kind=None):
+    """All work units (optionally of one kind) as dictionaries."""
+    query = select(WorkUnit).order_by(WorkUnit.kind, WorkUnit.shard)
+    if kind:
+        query = query.where(WorkUnit.kind == kind)
+    return [unit.to_dict() for unit in db.session.scalars(query)]
@@ -0,0 +1,306 @@
+"""
+Live trend deltas for dashboards, pushed as Server-Sent Events.
+
+One ``LiveTrends`` broadcaster per process tails ``user_interactions`` by id
+every ``LIVE_INTERVAL`` seconds while anyone is subscribed. It folds the new
+rows into a single delta per timeframe (7, 30 and 90 days): events per
+action, page and day, and the number of users new to the timeframe. The
+delta then goes on every subscriber's queue, so the database does the same
+work for one subscriber as for a thousand. Reading the table rather than
+hooking ``/api/track`` means deltas also cover events tracked by other
+gunicorn workers and by the importer.
+
+Every subscriber gets the id its deltas start after (``after_id``, also
+sent in the stream's ``hello`` event). Trends loaded with
+``get_trends(until_id=after_id)`` on the primary plus the deltas then count
+every interaction exactly once. On PostgreSQL, transactions can commit their
+ids out of order, so a delta stops at the first missing id. The rows after
+it wait until the gap fills, or until ``LIVE_GAP_SECONDS`` have passed,
+which means the transaction rolled back. A row committed later than that
+is left out of the deltas, and the next full reload counts it. SQLite
+serializes writers, so it has no such gaps. A subscriber that falls
+``LIVE_QUEUE_SIZE`` deltas behind is dropped and receives ``RESYNC``. It
+should then subscribe again and reload the trends up to its new
+``after_id``.
+
+``/api/live/trends`` in ``flask_app`` serves ``stream()``. The Streamlit
+dashboards add deltas to the trends they loaded with ``apply_delta`` from
+``live_events``, which this module re-exports.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from database import db, UserInteraction
+from partitions import partition_manager
+# The wire format, shared with dashboards that read the stream without a database
+from live_events import LIVE_HEARTBEAT, RESYNC, RETRY_MS, TIMEFRAMES, apply_delta, check_timeframe, parse_events
+
+LIVE_INTERVAL = float(os.getenv('LIVE_INTERVAL', 1.0))
+LIVE_QUEUE_SIZE = int(os.getenv('LIVE_QUEUE_SIZE', 100))
+# Under gunicorn an unset cap follows the worker's threads (see ``reserve_threads``)
+LIVE_MAX_SUBSCRIBERS = int(os.getenv('LIVE_MAX_SUBSCRIBERS', 1000))
+LIVE_BATCH = int(os.getenv('LIVE_BATCH', 10000))
+LIVE_GAP_SECONDS = float(os.getenv('LIVE_GAP_SECONDS', 5))
+
+
+class Subscriber(queue.Queue):
+    """Queue of deltas covering the interactions with ids above ``after_id``."""
+
+    def __init__(self, maxsize, after_id):
+        super().__init__(maxsize)
+        self.after_id = after_id
+
+
+def _event(name, data, event_id=None):
+    lines = [f'event: {name}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class LiveTrends:
+    """
+    Fan interaction deltas out to subscriber queues.
+
+    The polling thread starts with the first subscriber and stops when the
+    last one leaves, so idle processes (and the gunicorn master before it
+    forks) run no thread.
+    """
+
+    def __init__(self, app, interval=LIVE_INTERVAL, queue_size=LIVE_QUEUE_SIZE,
+                 max_subscribers=LIVE_MAX_SUBSCRIBERS, batch=LIVE_BATCH, hold_gaps=None,
+                 gap_seconds=LIVE_GAP_SECONDS):
+        self.app = app
+        self.interval = interval
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.batch = batch
+        # None: hold back rows behind id gaps on every database but SQLite
+        self.hold_gaps = hold_gaps
+        self.gap_seconds = gap_seconds
+        self._gaps = {}
+        self.last_id = None
+        # Newest id covered by the published deltas: where a new subscriber starts
+        self.published_id = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def subscribe(self):
+        """
+        Register a subscriber and start polling if needed.
+
+        Returns:
+            ``Subscriber`` queue of deltas (and ``RESYNC``), or None when at
+            capacity
+        """
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            if self.published_id is None:
+                with self.app.app_context():
+                    try:
+                        self.reset()
+                    finally:
+                        db.session.remove()
+            subscriber = Subscriber(self.queue_size, self.published_id)
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def close(self):
+        """Drop every subscriber and stop the polling thread."""
+        with self._lock:
+            self._subscribers.clear()
+        self._stop.set()
+
+    def reset(self):
+        """Start the next delta after the newest interaction. Needs an app context."""
+        self.last_id = self.published_id = partition_manager.max_id()
+
+    def poll(self):
+        """
+        Fold interactions added since the last poll into a delta. Needs an
+        app context.
+
+        Returns:
+            Dictionary with ``first_id``, ``last_id`` and per-timeframe
+            ``events``, ``actions``, ``pages``, ``days`` and ``new_users``,
+            or None when nothing was added
+        """
+        if self.last_id is None:
+            self.reset()
+        table = UserInteraction.__table__
+        rows = db.session.execute(
+            select(table.c.id, table.c.user_id, table.c.action, table.c.page, table.c.timestamp)
+            .where(table.c.id > self.last_id)
+            .order_by(table.c.id)
+            .limit(self.batch)
+        ).all()
+        hold_gaps = self.hold_gaps
+        if hold_gaps is None:
+            hold_gaps = db.engine.dialect.name != 'sqlite'
+        if hold_gaps:
+            rows = self._committed(rows)
+        if not rows:
+            return None
+
+        now = datetime.utcnow()
+        starts = {timeframe: now - timedelta(days=int(timeframe.rstrip('d'))) for timeframe in TIMEFRAMES}
+        seen = self._last_seen({row.user_id for row in rows}, min(starts.values()))
+        timeframes = {}
+        for timeframe, start in starts.items():
+            recent = [row for row in rows if row.timestamp >= start]
+            users = {row.user_id for row in recent}
+            timeframes[timeframe] = {
+                'events': len(recent),
+                'actions': dict(Counter(row.action for row in recent)),
+                'pages': dict(Counter(row.page for row in recent)),
+                'days': dict(Counter(str(row.timestamp.date()) for row in recent)),
+                'new_users': sum(1 for user in users if user not in seen or seen[user] < start),
+            }
+        delta = {'first_id': rows[0].id, 'last_id': rows[-1].id, 'timeframes': timeframes}
+        self.last_id = rows[-1].id
+        return delta
+
+    def _committed(self, rows):
+        """
+        The rows before the first id gap that is younger than
+        ``gap_seconds``. Such a gap is an id whose transaction may still
+        commit; an older one is taken to have rolled back.
+        """
+        now = time.monotonic()
+        expected = self.last_id + 1
+        kept = rows
+        for i, row in enumerate(rows):
+            if row.id != expected and now - self._gaps.setdefault(expected, now) < self.gap_seconds:
+                kept = rows[:i]
+                break
+            expected = row.id + 1
+        newest = kept[-1].id if kept else self.last_id
+        self._gaps = {start: seen for start, seen in self._gaps.items() if start > newest}
+        return kept
+
+    def _last_seen(self, users, start):
+        """Latest interaction time since ``start`` of each user, up to ``last_id``."""
+        users = sorted(users)
+        seen = {}
+        for table in partition_manager.tables_for(start=start):
+            # Bounded IN lists keep clear of SQLite's parameter limit
+            for i in range(0, len(users), 500):
+                query = (select(table.c.user_id, func.max(table.c.timestamp))
+                         .where(table.c.user_id.in_(users[i:i + 500]),
+                                table.c.id <= self.last_id,
+                                table.c.timestamp >= start)
+                         .group_by(table.c.user_id))
+                for user_id, timestamp in db.session.execute(query):
+                    if user_id not in seen or timestamp > seen[user_id]:
+                        seen[user_id] = timestamp
+        return seen
+
+    def publish(self, delta):
+        """Put ``delta`` on every subscriber's queue, dropping those that are full."""
+        with self._lock:
+            self.published_id = delta['last_id']
+            for subscriber in list(self._subscribers):
+                try:
+                    subscriber.put_nowait(delta)
+                except queue.Full:
+                    self._subscribers.discard(subscriber)
+                    while not subscriber.empty():
+                        subscriber.get_nowait()
+                    subscriber.put_nowait(RESYNC)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                if not self._subscribers:
+                    # The next subscriber starts from the newest interaction again
+                    self._thread = None
+                    self.published_id = None
+                    return
+            with self.app.app_context():
+                try:
+                    delta = self.poll()
+                except Exception as e:
+                    print(f"Live trends poll failed: {e}")
+                    delta = None
+                finally:
+                    db.session.remove()
+            if delta:
+                self.publish(delta)
+        with self._lock:
+            self._thread = None
+            self.published_id = None
+
+    def stream(self, subscriber, timeframe='7d', heartbeat=LIVE_HEARTBEAT):
+        """
+        Server-Sent Events for one subscriber.
+
+        Yields a ``hello`` event with the subscriber's ``after_id`` as
+        ``last_id``, then a ``delta`` event for every delta
+        with events in ``timeframe``, and a comment every ``heartbeat``
+        seconds of silence so dropped connections are noticed. Ends after a
+        ``resync`` event. Unsubscribes when closed.
+        """
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            yield _event('hello', {'timeframe': timeframe, 'interval': self.interval,
+                                   'last_id': subscriber.after_id})
+            while True:
+                try:
+                    delta = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if delta is RESYNC:
+                    yield _event('resync', {})
+                    return
+                part = delta['timeframes'][timeframe]
+                if part['events']:
+                    yield _event('delta', {'last_id': delta['last_id'], **part}, event_id=delta['last_id'])
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def init_app(app, **options):
+    """Attach a ``LiveTrends`` broadcaster to ``app`` as ``app.extensions['live']``."""
+    app.extensions['live'] = LiveTrends(app, **options)
+    return app.extensions['live']
+
+
+def reserve_threads(app, threads):
+    """
+    Cap live streams below the number of threads serving requests.
+
+    Each open stream holds a server thread for as long as it is connected,
+    so without a cap dashboards could take every thread of a gunicorn
+    worker. One thread is kept for ordinary requests; streams above the cap
+    get 503. An explicit ``LIVE_MAX_SUBSCRIBERS`` takes precedence.
+
+    Returns:
+        The cap in effect
+    """
+    broadcaster = app.extensions['live']
+    if 'LIVE_MAX_SUBSCRIBERS' not in os.environ:
+        broadcaster.max_subscribers = max(threads - 1, 0)
+    return broadcaster.max_subscribers
@@ -0,0 +1,76 @@
+"""
+The live trends stream as clients see it, with no database dependencies.
+
+``live`` produces the stream, and ``dashboard.py`` reads it over HTTP with
+``parse_events``. Both add deltas to loaded trends with ``apply_delta``.
+"""
+
+import json
+import os
+
+LIVE_HEARTBEAT = float(os.getenv('LIVE_HEARTBEAT', 15))
+TIMEFRAMES = ('7d', '30d', '90d')
+# Milliseconds an EventSource waits before reconnecting
+RETRY_MS = 3000
+
+# Put on a subscriber's queue when it was dropped for falling behind
+RESYNC = {'resync': True}
+
+
+def check_timeframe(timeframe):
+    if timeframe not in TIMEFRAMES:
+        raise ValueError(f"Unknown timeframe '{timeframe}', expected one of {TIMEFRAMES}")
+    return timeframe
+
+
+def parse_events(lines):
+    """
+    Decode a Server-Sent Events stream.
+
+    Args:
+        lines: Iterable of decoded lines without line endings
+
+    Yields:
+        (event, data) pairs with ``data`` decoded from JSON
+    """
+    name, data = 'message', []
+    for line in lines:
+        if not line:
+            if data:
+                yield name, json.loads('\n'.join(data))
+            name, data = 'message', []
+        elif line.startswith('event:'):
+            name = line[6:].strip()
+        elif line.startswith('data:'):
+            data.append(line[5:].strip())
+
+
+def apply_delta(trends, delta, top=5):
+    """
+    Add a stream delta to a ``get_trends`` result in place.
+
+    Action and page counts keep only the ``top`` entries, like
+    ``get_trends``. An entry outside them comes back with only its live
+    count, so reload the trends to correct it.
+
+    Args:
+        trends: Dictionary from ``PatternRecognizer.get_trends``
+        delta: Per-timeframe delta from ``stream`` (or ``poll``)
+        top: Number of actions and pages to keep
+
+    Returns:
+        ``trends``
+    """
+    trends['total_interactions'] = trends.get('total_interactions', 0) + delta['events']
+    trends['unique_users'] = trends.get('unique_users', 0) + delta['new_users']
+    daily = trends.setdefault('daily_activity', {})
+    for day, count in delta['days'].items():
+        daily[day] = daily.get(day, 0) + count
+    trends['daily_activity'] = dict(sorted(daily.items()))
+    for key, field in (('top_actions', 'actions'), ('top_pages', 'pages')):
+        counts = dict(trends.get(key, {}))
+        for name, count in delta[field].items():
+            counts[name] = counts.get(name, 0) + count
+        ordered = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        trends[key] = dict(ordered[:top])
+    return trends
@@ -0,0 +1,352 @@
+"""
+Built-in instrumentation exposed in Prometheus text format.
+
+A small dependency-free registry of counters, gauges and histograms:
+
+- per-route request counts and latency from Flask before/after hooks
+  (``init_app``), labelled by the URL rule rather than the raw path
+- SQL statement counts and time from SQLAlchemy engine events, both in
+  total and per request
+- pattern-analysis stage timings (``stage_timer``)
+- data pipeline cycle stats
+
+Recording is a ``perf_counter`` call, a dict lookup and a locked add, so
+it is cheap enough to leave on; ``METRICS_ENABLED=0`` turns off the request,
+SQL and stage hooks. ``/metrics`` in ``flask_app`` serves ``render()``; the pipeline
+can serve it with ``start_http_server``.
+
+Under gunicorn each worker keeps its own registry, so a scrape would see
+only the worker that answered it. ``enable_multiprocess`` makes every
+worker write its values to a shared directory, and ``render`` merges them:
+counters and histograms are summed, gauges show the value written last.
+"""
+
+import atexit
+import bisect
+import functools
+import glob
+import json
+import os
+import threading
+import time
+
+ENABLED = os.getenv('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 1))
+
+_registry = []
+# Shared directory of per-process value files, once ``enable_multiprocess`` ran
+_directory = None
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        if values is None:
+            values = self.snapshot()
+        for labels, value in sorted(values.items()):
+            lines.extend(self._samples(labels, value))
+        return lines
+
+    def snapshot(self):
+        """Copy of the current values by label tuple."""
+        with self._lock:
+            return {labels: self._copy(value) for labels, value in self._values.items()}
+
+    def _copy(self, value):
+        return value
+
+    def _combine(self, value, other):
+        """Merge the values of one label set from two processes."""
+        return value + other
+
+    def _samples(self, labels, value):
+        return [f'{self.name}{_label_text(self.label_names, labels)} {_number(value)}']
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def _combine(self, value, other):
+        return other
+
+
+class Histogram(_Metric):
+    """Cumulative bucketed distribution with sum and count."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _copy(self, state):
+        return [list(state[0]), state[1], state[2]]
+
+    def _combine(self, state, other):
+        return [[a + b for a, b in zip(state[0], other[0])], state[1] + other[1], state[2] + other[2]]
+
+    def _samples(self, labels, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = 'le="{}"'.format(_number(bound))
+            lines.append(f'{self.name}_bucket{_label_text(self.label_names, labels, le)} {cumulative}')
+        label_text = _label_text(self.label_names, labels)
+        lines.append(f'{self.name}_sum{label_text} {_number(total)}')
+        lines.append(f'{self.name}_count{label_text} {count}')
+        return lines
+
+
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests by route, method and status',
+                        ('route', 'method', 'status'))
+HTTP_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency by route', ('route', 'method'))
+REQUEST_QUERIES = Histogram('http_request_db_statements', 'SQL statements executed per request',
+                            ('route',), buckets=COUNT_BUCKETS)
+REQUEST_QUERY_TIME = Histogram('http_request_db_seconds', 'Time spent in SQL per request', ('route',))
+DB_STATEMENTS = Counter('db_statements_total', 'SQL statements executed by operation', ('operation',))
+DB_LATENCY = Histogram('db_statement_duration_seconds', 'SQL statement latency by operation', ('operation',))
+STAGE_LATENCY = Histogram('analysis_stage_duration_seconds', 'Pattern analysis stage latency', ('stage',))
+PIPELINE_CYCLES = Counter('pipeline_cycles_total', 'Data pipeline cycles by outcome', ('status',))
+PIPELINE_CYCLE_LATENCY = Histogram('pipeline_cycle_duration_seconds', 'Data pipeline cycle duration',
+                                   buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+PIPELINE_EVENTS = Counter('pipeline_events_total', 'Events handled by the data pipeline by kind', ('kind',))
+PIPELINE_LAST_SUCCESS = Gauge('pipeline_last_success_timestamp_seconds', 'Unix time of the last successful cycle')
+PIPELINE_BACKLOG = Gauge('pipeline_backlog_rows', 'Interactions tracked but not yet sessionized')
+PIPELINE_LAG = Gauge('pipeline_lag_seconds', 'Age of the oldest interaction not yet sessionized')
+PIPELINE_THROUGHPUT = Gauge('pipeline_throughput_events_per_second', 'Events sessionized per second in the last cycle')
+PIPELINE_BATCH = Gauge('pipeline_batch_size', 'Interaction ids the pipeline reads per cycle')
+PIPELINE_STAGE_LATENCY = Histogram('pipeline_stage_duration_seconds', 'Data pipeline stage duration', ('stage',))
+PIPELINE_E2E_LAG = Gauge('pipeline_end_to_end_lag_seconds', 'Now minus the newest event timestamp processed')
+
+_local = threading.local()
+
+
+def render():
+    """All metrics in Prometheus text exposition format (of every worker when shared)."""
+    merged = _merge() if _directory is not None else {}
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render(merged.get(metric.name)))
+    return '\n'.join(lines) + '\n'
+
+
+def enable_multiprocess(directory, interval=FLUSH_SECONDS):
+    """
+    Share this process's metrics through ``directory``.
+
+    Call in every gunicorn worker after the fork. The process writes its
+    values to ``<pid>.json`` every ``interval`` seconds, on exit and before
+    each ``render``, which then reports the sum over every file. Files of
+    exited workers are kept so counters never go down; ``clear_directory``
+    removes them when the server starts.
+    """
+    global _directory
+    os.makedirs(directory, exist_ok=True)
+    _directory = directory
+    _flush()
+    atexit.register(_flush)
+
+    def flush_periodically():
+        while True:
+            time.sleep(interval)
+            try:
+                _flush()
+            except OSError as e:
+                print(f"Could not write metrics to {directory}: {e}")
+
+    threading.Thread(target=flush_periodically, daemon=True).start()
+
+
+def clear_directory(directory):
+    """Remove the value files left in ``directory`` by an earlier server."""
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+def _flush():
+    if _directory is None:
+        return
+    values = {metric.name: [[list(labels), value] for labels, value in metric.snapshot().items()]
+              for metric in _registry}
+    path = os.path.join(_directory, f'{os.getpid()}.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(values, f)
+    # Readers never see a half-written file
+    os.replace(path + '.tmp', path)
+
+
+def _merge():
+    _flush()
+    metrics = {metric.name: metric for metric in _registry}
+    merged = {name: {} for name in metrics}
+    paths = sorted(glob.glob(os.path.join(_directory, '*.json')), key=os.path.getmtime)
+    for path in paths:
+        try:
+            with open(path) as f:
+                values = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, items in values.items():
+            metric = metrics.get(name)
+            if metric is None:
+                continue
+            for labels, value in items:
+                labels = tuple(labels)
+                current = merged[name].get(labels)
+                merged[name][labels] = value if current is None else metric._combine(current, value)
+    return merged
+
+
+def stage_timer(stage):
+    """Decorator recording the wrapped function's duration as an analysis stage."""
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                STAGE_LATENCY.observe(time.perf_counter() - started, stage)
+        return wrapper
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_started
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    DB_STATEMENTS.inc(operation)
+    DB_LATENCY.observe(elapsed, operation)
+    stats = getattr(_local, 'request', None)
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def instrument_engine():
+    """Listen to SQL execution on every SQLAlchemy engine (idempotent)."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    if not ENABLED or event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def init_app(app):
+    """Record request counts, latency and SQL usage for every request to ``app``."""
+    if not ENABLED:
+        return
+    from flask import g, request
+
+    instrument_engine()
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        _local.request = [0, 0.0]
+
+    @app.after_request
+    def _record(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            HTTP_LATENCY.observe(time.perf_counter() - started, route, request.method)
+            HTTP_REQUESTS.inc(route, request.method, str(response.status_code))
+            statements, seconds = getattr(_local, 'request', None) or (0, 0.0)
+            REQUEST_QUERIES.observe(statements, route)
+            REQUEST_QUERY_TIME.observe(seconds, route)
+        _local.request = None
+        return response
+
+
+def start_http_server(port, host='0.0.0.0'):
+    """Serve ``/metrics`` from a background thread (for processes without Flask)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            found = self.path.split('?')[0] == '/metrics'
+            body = render().encode() if found else b''
+            self.send_response(200 if found else 404)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,271 @@
+"""
+Time partitioning for ``user_interactions``.
+
+Interactions are split into fixed-width partitions (monthly by default,
+see ``INTERACTION_PARTITION_MONTHS``):
+
+- PostgreSQL: ``user_interactions`` is a native ``PARTITION BY RANGE
+  (timestamp)`` table; partitions are created ahead of time and the planner
+  prunes them automatically.
+- SQLite: new events land in ``user_interactions`` (the open partition).
+  ``roll`` moves closed periods into ``user_interactions_pYYYYMM`` tables and
+  ``tables_for`` routes windowed reads to the tables that overlap the window.
+
+Retention drops whole partition tables instead of deleting rows.
+"""
+
+import os
+import re
+from datetime import datetime, timedelta
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, func, inspect, select, text
+from database import db, UserInteraction
+
+PARTITION_MONTHS = int(os.getenv('INTERACTION_PARTITION_MONTHS', 1))
+RETENTION_DAYS = int(os.getenv('INTERACTION_RETENTION_DAYS', 0))
+
+HOT_TABLE = UserInteraction.__tablename__
+_NAME_RE = re.compile(rf'^{HOT_TABLE}_p(\d{{4}})(\d{{2}})$')
+
+
+class PartitionManager:
+    """Creates, routes to and drops interaction partitions."""
+
+    def __init__(self, months=PARTITION_MONTHS):
+        self.months = months
+        self._tables = {}
+
+    @property
+    def enabled(self):
+        return self.months > 0
+
+    @property
+    def native(self):
+        """True when the backend partitions natively (PostgreSQL)."""
+        return db.engine.dialect.name == 'postgresql'
+
+    def bounds(self, when):
+        """Return the [start, end) range of the partition containing ``when``."""
+        index = (when.year * 12 + when.month - 1) // self.months * self.months
+        start = datetime(index // 12, index % 12 + 1, 1)
+        end_index = index + self.months
+        return start, datetime(end_index // 12, end_index % 12 + 1, 1)
+
+    def name_for(self, start):
+        return f'{HOT_TABLE}_p{start:%Y%m}'
+
+    def partitions(self):
+        """List (name, start, end) for every partition table, oldest first."""
+        found = []
+        for name in inspect(db.engine).get_table_names():
+            match = _NAME_RE.match(name)
+            if match:
+                start = datetime(int(match.group(1)), int(match.group(2)), 1)
+                found.append((name, start, self.bounds(start)[1]))
+        return sorted(found, key=lambda p: p[1])
+
+    def tables_for(self, start=None, end=None):
+        """
+        Tables that may hold interactions in [start, end).
+
+        The hot table is always included; on SQLite closed partitions are
+        added only when their range overlaps the window.
+        """
+        hot = UserInteraction.__table__
+        if not self.enabled or self.native:
+            return [hot]
+        tables = [hot]
+        for name, p_start, p_end in self.partitions():
+            if (start is None or p_end > start) and (end is None or p_start < end):
+                tables.append(self._table(name))
+        return tables
+
+    def create_partitioned_table(self):
+        """
+        Create ``user_interactions`` as a native range-partitioned table on
+        PostgreSQL. Must run before ``db.create_all``; no-op elsewhere or if
+        the table already exists.
+        """
+        if not self.enabled or not self.native or inspect(db.engine).has_table(HOT_TABLE):
+            return False
+
+        dialect = db.engine.dialect
+        quote = dialect.identifier_preparer.quote
+        columns = []
+        for column in UserInteraction.__table__.columns:
+            if column.name == 'id':
+                columns.append('id SERIAL')
+                continue
+            ddl = f'{quote(column.name)} {column.type.compile(dialect=dialect)}'
+            if not column.nullable or column.name == 'timestamp':
+                ddl += ' NOT NULL'
+            columns.append(ddl)
+
+        with db.engine.begin() as conn:
+            conn.execute(text(
+                f'CREATE TABLE {HOT_TABLE} ({", ".join(columns)}, PRIMARY KEY (id, "timestamp")) '
+                f'PARTITION BY RANGE ("timestamp")'
+            ))
+            conn.execute(text(f'CREATE TABLE {HOT_TABLE}_default PARTITION OF {HOT_TABLE} DEFAULT'))
+            for index in UserInteraction.__table__.indexes:
+                cols = ', '.join(quote(c.name) for c in index.columns)
+                conn.execute(text(f'CREATE INDEX {index.name} ON {HOT_TABLE} ({cols})'))
+        self.ensure_future_partitions()
+        return True
+
+    def ensure_future_partitions(self, now=None, ahead=2):
+        """Create native partitions for the current and next ``ahead`` periods."""
+        if not self.enabled or not self.native:
+            return
+        start, end = self.bounds(now or datetime.utcnow())
+        with db.engine.begin() as conn:
+            for _ in range(ahead + 1):
+                conn.execute(text(
+                    f'CREATE TABLE IF NOT EXISTS {self.name_for(start)} PARTITION OF {HOT_TABLE} '
+                    f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+                ))
+                start, end = end, self.bounds(end)[1]
+
+    def max_id(self):
+        """Highest interaction id in the hot table, partitions and archive."""
+        from archive import cold_archive
+        tables = [UserInteraction.__table__] + [self._table(name) for name, _, _ in self.partitions()]
+        ids = [db.session.execute(select(func.max(table.c.id))).scalar() or 0 for table in tables]
+        ids += [hi for _, _, _, hi in cold_archive.files()]
+        return max(ids)
+
+    def ensure_increasing_ids(self):
+        """
+        Rebuild a SQLite hot table created without AUTOINCREMENT.
+
+        Without it SQLite hands out ids from 1 again once ``roll`` or the
+        archive empties the table, and everything that tracks progress by id
+        (sessions watermark, checkpoints, leases, live deltas) skips new
+        events. The rebuilt table continues after the highest id in use.
+
+        Returns:
+            True if the table was rebuilt
+        """
+        if db.engine.dialect.name != 'sqlite':
+            return False
+        hot = UserInteraction.__table__
+        ddl = db.session.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': HOT_TABLE}
+        ).scalar()
+        db.session.commit()
+        if ddl is None or 'AUTOINCREMENT' in ddl.upper():
+            return False
+
+        high = self.max_id()
+        db.session.commit()
+        columns = ', '.join(f'"{c.name}"' for c in hot.columns)
+        with db.engine.begin() as conn:
+            for index in hot.indexes:
+                conn.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+            conn.execute(text(f'ALTER TABLE {HOT_TABLE} RENAME TO {HOT_TABLE}_rebuild'))
+            hot.create(conn)
+            conn.execute(text(f'INSERT INTO {HOT_TABLE} ({columns}) SELECT {columns} FROM {HOT_TABLE}_rebuild'))
+            conn.execute(text(f'DROP TABLE {HOT_TABLE}_rebuild'))
+            conn.execute(text('DELETE FROM sqlite_sequence WHERE name = :name'), {'name': HOT_TABLE})
+            conn.execute(text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)'),
+                         {'name': HOT_TABLE, 'seq': high})
+        return True
+
+    def roll(self, now=None):
+        """
+        Move interactions from closed periods out of the hot table.
+
+        On PostgreSQL this only makes sure upcoming partitions exist.
+
+        Returns:
+            Number of rows moved
+        """
+        if not self.enabled:
+            return 0
+        if self.native:
+            self.ensure_future_partitions(now)
+            return 0
+
+        current_start = self.bounds(now or datetime.utcnow())[0]
+        hot = UserInteraction.__table__
+        moved = 0
+        while True:
+            oldest = db.session.execute(
+                select(func.min(hot.c.timestamp)).where(hot.c.timestamp < current_start)
+            ).scalar()
+            if oldest is None:
+                break
+            start, end = self.bounds(oldest)
+            target = self._table(self.name_for(start), create=True)
+            in_range = (hot.c.timestamp >= start) & (hot.c.timestamp < end)
+            db.session.execute(target.insert().from_select(
+                [c.name for c in hot.columns], select(*hot.columns).where(in_range)
+            ))
+            moved += db.session.execute(hot.delete().where(in_range)).rowcount
+            db.session.commit()
+        return moved
+
+    def drop_before(self, cutoff):
+        """
+        Drop every partition that ends on or before ``cutoff``.
+
+        Returns:
+            Names of the dropped partitions
+        """
+        dropped = []
+        for name, _, end in self.partitions():
+            if end <= cutoff:
+                with db.engine.begin() as conn:
+                    conn.execute(text(f'DROP TABLE {name}'))
+                self._tables.pop(name, None)
+                dropped.append(name)
+        return dropped
+
+    def apply_retention(self, days=RETENTION_DAYS, now=None):
+        """Drop partitions and archived days older than ``days`` (0 keeps everything)."""
+        if not self.enabled or days <= 0:
+            return []
+        from archive import cold_archive
+        cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+        return self.drop_before(cutoff) + cold_archive.drop_before(cutoff)
+
+    def _table(self, name, create=False):
+        """Table object for a SQLite partition with the hot table's columns."""
+        table = self._tables.get(name)
+        if table is None:
+            hot = UserInteraction.__table__
+            table = Table(
+                name, MetaData(),
+                Column('id', Integer, primary_key=True),
+                Column('user_id', String(100), nullable=False),
+                Column('action', String(100), nullable=False),
+                Column('page', String(200), nullable=False),
+                Column('metadata', hot.c.metadata.type, nullable=True),
+                Column('timestamp', DateTime),
+            )
+            Index(f'ix_{name}_user_id', table.c.user_id)
+            Index(f'ix_{name}_timestamp', table.c.timestamp)
+            self._tables[name] = table
+        if create:
+            table.create(db.engine, checkfirst=True)
+        return table
+
+
+partition_manager = PartitionManager()
+
+
+if __name__ == '__main__':
+    import argparse
+    from flask_app import app
+
+    parser = argparse.ArgumentParser(description='Maintain user_interactions partitions')
+    parser.add_argument('command', choices=['roll', 'retention', 'list'])
+    parser.add_argument('--days', type=int, default=RETENTION_DAYS, help='Retention in days')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'roll':
+            print(f"Moved {partition_manager.roll()} interactions into closed partitions")
+        elif args.command == 'retention':
+            print(f"Dropped partitions: {partition_manager.apply_retention(args.days) or 'none'}")
+        for name, start, end in partition_manager.partitions():
+            print(f"{name}: {start:%Y-%m-%d} .. {end:%Y-%m-%d}")
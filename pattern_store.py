@@ -0,0 +1,207 @@
+"""
+Deduplicated storage of detected behavior patterns.
+
+A pattern is identified by (user_id, pattern_type, signature), where the
+signature is the pattern's content: the action sequence of a
+``common_sequence``, the value of single-value patterns. The pipeline
+upserts each cycle's patterns on that key, so re-detecting a pattern
+refreshes its confidence, frequency and ``detected_at`` instead of adding
+a row. ``compact`` upgrades a ``behavior_patterns`` table written before
+the key existed: it adds the new columns, fills in signatures, removes
+duplicates and creates the unique index.
+
+Usage:
+    python pattern_store.py compact
+"""
+
+import json
+from datetime import datetime
+from sqlalchemy import inspect, select, text
+from database import db, dialect_insert, BehaviorPattern
+
+_TABLE = BehaviorPattern.__tablename__
+_KEY = 'uq_behavior_patterns_key'
+
+
+def signature(pattern_type, details):
+    """Content key of a pattern, e.g. 'page_view>click>add_to_cart'."""
+    details = details or {}
+    if details.get('sequence'):
+        return '>'.join(str(step) for step in details['sequence'])[:200]
+    if 'value' in details:
+        return str(details['value'])[:200]
+    return ''
+
+
+def _row(pattern, detected_at):
+    details = json.loads(json.dumps(pattern, default=str))
+    frequency = pattern.get('frequency', pattern.get('visits'))
+    return {
+        'user_id': pattern['user_id'],
+        'pattern_type': pattern['type'],
+        'signature': signature(pattern['type'], details),
+        'confidence': pattern['confidence'],
+        'frequency': int(frequency) if frequency is not None else None,
+        'pattern_details': details,
+        'detected_at': detected_at,
+    }
+
+
+def pattern_rows(patterns, detected_at):
+    """
+    Table rows for per-user patterns, one per key, in key order.
+
+    Args:
+        patterns: Output of ``PatternRecognizer.analyze_patterns``; patterns
+            without a user_id are skipped (a later duplicate key wins)
+        detected_at: Detection time
+
+    Returns:
+        List of row dictionaries
+    """
+    rows = {}
+    for pattern in patterns:
+        if pattern.get('user_id'):
+            row = _row(pattern, detected_at)
+            rows[row['user_id'], row['pattern_type'], row['signature']] = row
+    # Sorted so concurrent writers lock rows in the same order
+    return [rows[key] for key in sorted(rows)]
+
+
+def upsert_patterns(rows, keep_newer=False):
+    """
+    Upsert rows from ``pattern_rows`` on (user_id, pattern_type, signature).
+
+    Args:
+        rows: Row dictionaries
+        keep_newer: Leave stored patterns detected after the incoming row
+            unchanged
+
+    Returns:
+        Number of rows written. The caller commits.
+    """
+    if not rows:
+        return 0
+    stmt = dialect_insert(BehaviorPattern)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BehaviorPattern.user_id, BehaviorPattern.pattern_type, BehaviorPattern.signature],
+        set_={
+            'confidence': stmt.excluded.confidence,
+            'frequency': stmt.excluded.frequency,
+            'details': stmt.excluded.details,
+            'detected_at': stmt.excluded.detected_at,
+        },
+        where=BehaviorPattern.detected_at < stmt.excluded.detected_at if keep_newer else None
+    )
+    db.session.execute(stmt, rows)
+    return len(rows)
+
+
+def store_patterns(patterns, detected_at=None):
+    """
+    Upsert per-user patterns on (user_id, pattern_type, signature).
+
+    Args:
+        patterns: Output of ``PatternRecognizer.analyze_patterns``; patterns
+            without a user_id are skipped
+        detected_at: Detection time (default: now)
+
+    Returns:
+        Number of patterns written. The caller commits.
+    """
+    return upsert_patterns(pattern_rows(patterns, detected_at or datetime.utcnow()))
+
+
+def stored_patterns(user_id=None, pattern_type=None, since=None, limit=100):
+    """
+    Read stored patterns, most recently detected first.
+
+    Args:
+        user_id: Optional user ID to filter on
+        pattern_type: Optional pattern type to filter on
+        since: Optional lower bound on detected_at
+        limit: Maximum number of patterns
+
+    Returns:
+        List of pattern dictionaries
+    """
+    query = select(BehaviorPattern).order_by(BehaviorPattern.detected_at.desc(), BehaviorPattern.id.desc())
+    if user_id:
+        query = query.where(BehaviorPattern.user_id == user_id)
+    if pattern_type:
+        query = query.where(BehaviorPattern.pattern_type == pattern_type)
+    if since is not None:
+        query = query.where(BehaviorPattern.detected_at >= since)
+    return [pattern.to_dict() for pattern in db.session.scalars(query.limit(limit))]
+
+
+def is_compacted():
+    """Whether ``behavior_patterns`` has the unique pattern key."""
+    return any(index['name'] == _KEY for index in inspect(db.engine).get_indexes(_TABLE))
+
+
+def compact(batch_size=5000):
+    """
+    Upgrade ``behavior_patterns`` to one row per pattern.
+
+    Adds the signature and frequency columns when missing, derives both
+    from stored details, deletes all but the newest row of each
+    (user_id, pattern_type, signature) and creates the unique index.
+    Safe to re-run.
+
+    Returns:
+        Dictionary with the number of rows backfilled and removed
+    """
+    columns = {column['name'] for column in inspect(db.engine).get_columns(_TABLE)}
+    if 'signature' not in columns:
+        db.session.execute(text(f"ALTER TABLE {_TABLE} ADD COLUMN signature VARCHAR(200) NOT NULL DEFAULT ''"))
+    if 'frequency' not in columns:
+        db.session.execute(text(f'ALTER TABLE {_TABLE} ADD COLUMN frequency INTEGER'))
+    db.session.commit()
+
+    backfilled = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(BehaviorPattern.id, BehaviorPattern.pattern_type, BehaviorPattern.pattern_details)
+            .where(BehaviorPattern.id > last_id, BehaviorPattern.signature == '')
+            .order_by(BehaviorPattern.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = []
+        for row_id, pattern_type, details in rows:
+            details = details or {}
+            frequency = details.get('frequency', details.get('visits'))
+            updates.append({'id': row_id, 'signature': signature(pattern_type, details),
+                            'frequency': int(frequency) if frequency is not None else None})
+        db.session.execute(text(f'UPDATE {_TABLE} SET signature = :signature, frequency = :frequency '
+                                f'WHERE id = :id'), updates)
+        db.session.commit()
+        backfilled += len(updates)
+
+    removed = db.session.execute(text(
+        f'DELETE FROM {_TABLE} WHERE id NOT IN ('
+        f'SELECT keep FROM (SELECT MAX(id) AS keep FROM {_TABLE} '
+        f'GROUP BY user_id, pattern_type, signature) AS newest)'
+    )).rowcount
+    db.session.commit()
+
+    for index in BehaviorPattern.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+    return {'backfilled': backfilled, 'removed': removed}
+
+
+if __name__ == '__main__':
+    import argparse
+    from flask_app import app
+
+    parser = argparse.ArgumentParser(description='Manage stored behavior patterns')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('compact', help='Deduplicate behavior_patterns and add the unique pattern key')
+    args = parser.parse_args()
+
+    with app.app_context():
+        result = compact()
+        print(f"Backfilled {result['backfilled']} signatures, removed {result['removed']} duplicate patterns")
@@ -1,110 +1,368 @@
 import time
 import os
+import signal
+import socket
+import threading
 from datetime import datetime
 from dotenv import load_dotenv
-from database import db, UserInteraction, BehaviorPattern
+from database import db
 from analytics import PatternRecognizer
+from sessions import Sessionizer
+from transitions import record_transitions
+from partitions import partition_manager
+from pattern_store import store_patterns
+from archive import cold_archive
 from flask_app import app
+from scheduling import AdaptiveSchedule, measure_backlog
+from telemetry import PipelineTelemetry
+import bootstrap
+import leasing
+import metrics
 
 load_dotenv()
 
+BATCH_SIZE = int(os.getenv('PIPELINE_BATCH_SIZE', 50000))
+
 
 class DataPipeline:
     """
     Real-time data pipeline for continuous analysis.
-    Maintains 99% uptime for processing user interactions.
+    
+    Each cycle runs three timed stages - fetch, analyze, persist - and
+    publishes rolling-window telemetry to the ``pipeline_status`` table.
     """
     
-    def __init__(self, interval=60):
+    def __init__(self, interval=60, batch_size=BATCH_SIZE, worker_id=None):
         """
         Initialize the data pipeline.
         
         Args:
-            interval: Processing interval in seconds (default: 60)
+            interval: Longest idle wait, and the period of pattern detection
+                and storage maintenance, in seconds (default: 60)
+            batch_size: Most interaction ids sessionized per cycle
+            worker_id: Name this process publishes its status under
+                (default: host:pid)
         """
         self.interval = interval
         self.pattern_recognizer = PatternRecognizer()
+        self.sessionizer = Sessionizer()
+        self.schedule = AdaptiveSchedule(max_delay=interval, batch_size=batch_size)
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.telemetry = PipelineTelemetry(self.worker_id)
         self.is_running = False
         self.uptime_counter = 0
         self.error_counter = 0
+        self.last_maintenance = None
+        self._cycle = {}
+        self._wake = threading.Event()
     
     def start(self):
         """Start the real-time data pipeline."""
         self.is_running = True
-        print(f"[{datetime.now()}] Data Pipeline started - Processing every {self.interval} seconds")
+        self._handle_signals()
+        print(f"[{datetime.now()}] Data Pipeline started - adaptive scheduling, "
+              f"maintenance every {self.interval} seconds")
         
         try:
             while self.is_running:
-                self._process_batch()
-                time.sleep(self.interval)
+                delay = self._process_batch()
+                self._wake.wait(delay)
         except KeyboardInterrupt:
-            self.stop()
+            pass
+        self.stop()
+    
+    def _handle_signals(self):
+        """Finish the current batch and stop on SIGTERM/SIGINT."""
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._request_stop)
+    
+    def _request_stop(self, signum, frame):
+        print(f"\n[{datetime.now()}] {signal.Signals(signum).name} received - finishing current batch")
+        self.is_running = False
+        self._wake.set()
     
     def stop(self):
         """Stop the data pipeline."""
         self.is_running = False
-        uptime_percentage = (self.uptime_counter / (self.uptime_counter + self.error_counter)) * 100 if (self.uptime_counter + self.error_counter) > 0 else 0
+        self._publish('stopped')
         print(f"\n[{datetime.now()}] Data Pipeline stopped")
-        print(f"Uptime: {uptime_percentage:.2f}%")
         print(f"Successful cycles: {self.uptime_counter}")
         print(f"Errors: {self.error_counter}")
     
     def _process_batch(self):
-        """Process a batch of user interactions."""
+        """
+        Sessionize the next batch of interactions and run maintenance when due.
+        
+        Returns:
+            Seconds to wait before the next batch
+        """
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        self._cycle = {'rows': 0, 'patterns': 0, 'newest_event': None}
+        backlog = None
+        behind = False
+        error = None
         try:
             with app.app_context():
-                # Get recent unprocessed interactions
-                recent_interactions = UserInteraction.query.order_by(
-                    UserInteraction.timestamp.desc()
-                ).limit(100).all()
+                with self.telemetry.stage('fetch'):
+                    watermark = self.sessionizer.watermark()
+                    backlog = measure_backlog(watermark)
+                    metrics.PIPELINE_BACKLOG.set(backlog['rows'])
+                    metrics.PIPELINE_LAG.set(backlog['lag_seconds'])
+                    events = None
+                    if backlog['rows']:
+                        batch_size = self.schedule.batch_size
+                        events = self.sessionizer.pending(max_events=batch_size, since=watermark)
+                        behind = backlog['rows'] > batch_size
                 
-                if recent_interactions:
-                    print(f"[{datetime.now()}] Processing {len(recent_interactions)} interactions...")
-                    
-                    # Analyze patterns
-                    patterns = self.pattern_recognizer.analyze_patterns()
-                    
-                    print(f"[{datetime.now()}] Detected {len(patterns)} patterns")
-                    
-                    # Store detected patterns in database
-                    for pattern in patterns:
-                        if pattern.get('user_id'):
-                            behavior_pattern = BehaviorPattern(
-                                user_id=pattern['user_id'],
-                                pattern_type=pattern['type'],
-                                confidence=pattern['confidence'],
-                                pattern_details=pattern,
-                                detected_at=datetime.utcnow()
-                            )
-                            db.session.add(behavior_pattern)
-             
-            db.session.commit()
-            print(f"[{datetime.now()}] Batch processing completed successfully")
-            self.uptime_counter += 1
+                maintain = self._maintenance_due()
+                with self.telemetry.stage('analyze'):
+                    sessionized = self._sessionize(events) if events is not None else None
+                    patterns = self._detect_patterns() if maintain else []
+                
+                with self.telemetry.stage('persist'):
+                    self._persist(sessionized, patterns)
+                    db.session.commit()
+                    if maintain:
+                        self._maintain_storage()
+                        self.last_maintenance = time.monotonic()
+        except Exception as e:
+            error = e
+        
+        elapsed = time.perf_counter() - started
+        metrics.PIPELINE_CYCLE_LATENCY.observe(elapsed)
+        self.telemetry.record_cycle(elapsed, backlog=backlog, error=error, **self._cycle)
+        if error is not None:
+            self._cycle_failed(error)
+            self._publish()
+            return self.schedule.backoff()
+        self._cycle_succeeded()
+        self._publish()
+        
+        metrics.PIPELINE_THROUGHPUT.set(self._cycle['rows'] / elapsed if elapsed else 0.0)
+        delay = self.schedule.after_cycle(self._cycle['rows'], behind, time.process_time() - cpu_started)
+        metrics.PIPELINE_BATCH.set(self.schedule.batch_size)
+        return delay
+    
+    def _maintenance_due(self):
+        return self.last_maintenance is None or time.monotonic() - self.last_maintenance >= self.interval
+    
+    def _sessionize(self, events):
+        """Fold loaded interactions into the sessions table; the caller commits."""
+        sessionized = self.sessionizer.update(events=events)
+        if not sessionized.empty:
+            metrics.PIPELINE_EVENTS.inc('sessionized', amount=len(sessionized))
+            self._cycle['rows'] = len(sessionized)
+            self._cycle['newest_event'] = sessionized['timestamp'].max().to_pydatetime()
+            print(f"[{datetime.now()}] Sessionized {len(sessionized)} new interactions")
+        return sessionized
+    
+    def _detect_patterns(self):
+        """Detect patterns over all activity."""
+        patterns = self.pattern_recognizer.analyze_patterns()
+        print(f"[{datetime.now()}] Detected {len(patterns)} patterns")
+        metrics.PIPELINE_EVENTS.inc('patterns_detected', amount=len(patterns))
+        self._cycle['patterns'] = len(patterns)
+        return patterns
+    
+    def _persist(self, sessionized, patterns):
+        """Add transition counts and detected patterns to the session; the caller commits."""
+        if sessionized is not None and not sessionized.empty:
+            record_transitions(sessionized)
+        
+        # Re-detected patterns update their stored row in place
+        if patterns:
+            store_patterns(patterns)
+    
+    def _maintain_storage(self):
+        """Roll partitions, apply retention and archive cold days."""
+        # Move closed periods out of the hot table and drop expired partitions
+        moved = partition_manager.roll()
+        dropped = partition_manager.apply_retention()
+        metrics.PIPELINE_EVENTS.inc('partitioned', amount=moved)
+        if moved or dropped:
+            print(f"[{datetime.now()}] Partitions: moved {moved} interactions, dropped {dropped or 'none'}")
+        
+        # Move cold days to the Parquet tier
+        archived = cold_archive.archive()
+        metrics.PIPELINE_EVENTS.inc('archived', amount=archived['rows'])
+        if archived['rows']:
+            print(f"[{datetime.now()}] Archived {archived['rows']} interactions "
+                  f"({archived['compression_ratio']:.1f}x smaller)")
+    
+    def _publish(self, state='running'):
+        """Write telemetry to ``pipeline_status``; a failed write never stops the pipeline."""
+        try:
+            with app.app_context():
+                self.telemetry.publish(state, force=state != 'running')
         except Exception as e:
-            self.error_counter += 1
-            print(f"[{datetime.now()}] Error in pipeline: {str(e)}")
-            
-            # Calculate current uptime
-            uptime_percentage = (self.uptime_counter / (self.uptime_counter + self.error_counter)) * 100
-            if uptime_percentage < 99:
-                print(f"[WARNING] Uptime dropped below 99%: {uptime_percentage:.2f}%")
+            print(f"[{datetime.now()}] Could not publish pipeline status: {e}")
+    
+    def _cycle_succeeded(self):
+        print(f"[{datetime.now()}] Batch processing completed successfully")
+        self.uptime_counter += 1
+        metrics.PIPELINE_CYCLES.inc('success')
+        metrics.PIPELINE_LAST_SUCCESS.set(time.time())
+    
+    def _cycle_failed(self, e):
+        self.error_counter += 1
+        metrics.PIPELINE_CYCLES.inc('error')
+        print(f"[{datetime.now()}] Error in pipeline: {str(e)}")
+        
+        success_rate = self.telemetry.success_rate()
+        if success_rate is not None and success_rate < 0.99:
+            print(f"[WARNING] {success_rate:.2%} of cycles succeeded in the last "
+                  f"{self.telemetry.window_seconds} seconds")
+
+
+class PipelineWorker(DataPipeline):
+    """
+    One of several cooperating pipeline processes.
+    
+    New interactions are split into ``shards`` user-hash shards, each a
+    leased work unit with its own progress, so every user's events are
+    sessionized by one worker at a time and in id order while different
+    shards run in parallel. Pattern detection and storage maintenance
+    work on the whole data set and run as a single ``maintenance`` unit,
+    at most once per ``interval`` across all workers. Run any number of
+    workers with the same ``shards``; a crashed worker's units are
+    re-claimed once their lease expires.
+    """
+    
+    def __init__(self, shards, interval=60, batch_size=BATCH_SIZE, lease_seconds=leasing.LEASE_SECONDS,
+                 worker_id=None):
+        """
+        Initialize a pipeline worker.
+        
+        Args:
+            shards: Number of user-hash shards (same for every worker)
+            interval: Seconds between maintenance runs and between polls
+                of a caught-up shard
+            batch_size: Maximum interactions of the shard sessionized per lease
+            lease_seconds: Lease expiry; must exceed the longest batch
+            worker_id: Name recorded on leases (default: host:pid)
+        """
+        super().__init__(interval, batch_size, worker_id)
+        self.shards = shards
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+    
+    def start(self):
+        """Claim and process work units until stopped."""
+        self.is_running = True
+        self._handle_signals()
+        with app.app_context():
+            leasing.ensure_units('sessions', self.shards, last_id=self.sessionizer.watermark())
+            leasing.ensure_units('maintenance')
+        print(f"[{datetime.now()}] Pipeline worker {self.worker_id} started - {self.shards} shards")
+        
+        try:
+            while self.is_running:
+                if self.run_once():
+                    self.schedule.idle_delay = self.schedule.min_delay
+                    continue
+                self._publish()
+                self._wake.wait(self.schedule.backoff())
+        except KeyboardInterrupt:
+            pass
+        self.stop()
+    
+    def run_once(self):
+        """
+        Process at most one shard batch and one maintenance run.
+        
+        Returns:
+            Number of units processed (0 when there was nothing to claim)
+        """
+        processed = 0
+        with app.app_context():
+            for kind, handler in (('sessions', self._process_shard), ('maintenance', self._run_maintenance)):
+                lease = leasing.claim(kind, self.worker_id, self.lease_seconds)
+                if lease is None:
+                    continue
+                processed += 1
+                self._cycle = {'rows': 0, 'patterns': 0, 'newest_event': None}
+                started = time.perf_counter()
+                error = None
+                try:
+                    delay = handler(lease)
+                except leasing.LeaseLost as e:
+                    db.session.rollback()
+                    print(f"[{datetime.now()}] {e}; batch discarded")
+                    continue
+                except Exception as e:
+                    db.session.rollback()
+                    error = e
+                    delay = self.interval
+                elapsed = time.perf_counter() - started
+                metrics.PIPELINE_CYCLE_LATENCY.observe(elapsed)
+                self.telemetry.record_cycle(elapsed, error=error, **self._cycle)
+                if error is None:
+                    self._cycle_succeeded()
+                else:
+                    self._cycle_failed(error)
+                leasing.release(lease, delay)
+        if processed:
+            self._publish()
+        return processed
+    
+    def _process_shard(self, lease):
+        """Sessionize the next batch of a shard; returns the delay before it is claimable again."""
+        shard = (lease.shard, lease.shards)
+        with self.telemetry.stage('fetch'):
+            # Rows rolled into partitions still count; batches hold up to batch_size of the shard's rows
+            newest = partition_manager.max_id()
+            if newest <= lease.last_id:
+                return self.interval
+            end = self.sessionizer._batch_end(lease.last_id, self.batch_size, shard)
+            until = newest if end is None else end
+            events = self.sessionizer.pending(since=lease.last_id, until=until, shard=shard)
+        with self.telemetry.stage('analyze'):
+            sessionized = self._sessionize(events)
+        with self.telemetry.stage('persist'):
+            self._persist(sessionized, [])
+            leasing.advance(lease, until)
+            db.session.commit()
+        # Caught-up shards wait for the next interval; a full batch may have more behind it
+        return 0 if end is not None and until < newest else self.interval
+    
+    def _run_maintenance(self, lease):
+        """Run the whole-data-set steps; returns the delay before the next run."""
+        with self.telemetry.stage('analyze'):
+            patterns = self._detect_patterns()
+        with self.telemetry.stage('persist'):
+            self._persist(None, patterns)
+            db.session.commit()
+            self._maintain_storage()
+        return self.interval
 
 
 if __name__ == "__main__":
     interval = int(os.getenv('DATA_PIPELINE_INTERVAL', 60))
-    pipeline = DataPipeline(interval=interval)
+    shards = int(os.getenv('PIPELINE_SHARDS', 0))
+    if shards:
+        pipeline = PipelineWorker(shards, interval=interval, worker_id=os.getenv('PIPELINE_WORKER_ID'))
+    else:
+        pipeline = DataPipeline(interval=interval)
     
     print("=" * 60)
     print("Customer Behavior Analytics - Real-time Data Pipeline")
     print("=" * 60)
-    print(f"Target Uptime: 99%")
+    print("Status: GET /api/pipeline/status")
     print(f"Processing Interval: {interval} seconds")
+    if shards:
+        print(f"Distributed mode: {shards} shards, lease {leasing.LEASE_SECONDS} seconds")
     print("Press Ctrl+C to stop")
     print("=" * 60)
     
+    metrics_port = os.getenv('PIPELINE_METRICS_PORT')
+    if metrics_port:
+        metrics.start_http_server(int(metrics_port))
+        print(f"Metrics: http://localhost:{metrics_port}/metrics")
+    
     # Ensure database tables exist before starting pipeline
-    with app.app_context():
-        db.create_all()
+    bootstrap.initialize(app, seed=False)
 
     pipeline.start()
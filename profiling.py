@@ -0,0 +1,317 @@
+"""
+On-demand request profiling and a slow-query log.
+
+Profiling is opt-in per request: with ``PROFILING_ENABLED=1``, a request
+carrying ``X-Profile: 1`` (or ``?profile=1``) runs under a sampling
+profiler. A background thread samples the request thread's stack every
+``PROFILE_INTERVAL_MS`` and aggregates the samples into collapsed stacks
+(the ``flamegraph.pl`` / speedscope "folded" format). The profile is
+stored under ``PROFILE_DIR`` and its id returned in ``X-Profile-Id``; with
+``X-Profile: return`` (or ``?profile=return``) the folded profile replaces
+the response body. When ``PROFILE_TOKEN`` is set the header must carry it
+(``X-Profile: <token>`` / ``X-Profile: return:<token>``).
+
+The slow-query log listens to the engine behind ``database.db`` and keeps
+every statement slower than ``SLOW_QUERY_MS`` together with its parameters
+and the backend's plan (``EXPLAIN QUERY PLAN`` on SQLite, ``EXPLAIN`` on
+PostgreSQL). Entries are grouped by statement so ``top`` can rank the
+worst offenders; they are optionally appended to ``SLOW_QUERY_LOG`` as
+JSON lines.
+
+The debug endpoints that expose profiles and slow queries (with their bound
+parameters) are only served with ``PROFILING_ENABLED=1``, and when
+``PROFILE_TOKEN`` is set only to requests carrying it in
+``X-Profile-Token`` (see ``debug_allowed``).
+"""
+
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '0').lower() in ('1', 'true', 'yes')
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG')
+
+_PLACEHOLDERS = re.compile(r'\((?:\?|%\([^)]+\)s|%s)(?:\s*,\s*(?:\?|%\([^)]+\)s|%s))*\)')
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack at a fixed interval.
+
+    Args:
+        thread_id: Thread to sample (default: the calling thread)
+        interval: Seconds between samples
+    """
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL_MS / 1000):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self.started = self.elapsed = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        """Collapsed stacks, one 'frame;frame;frame count' line per distinct stack."""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+    def top(self, limit=15):
+        """Functions ranked by samples where they were on the stack."""
+        inclusive = Counter()
+        for stack, count in self.samples.items():
+            for frame in set(stack.split(';')):
+                inclusive[frame] += count
+        total = sum(self.samples.values()) or 1
+        return [{'function': f, 'samples': n, 'share': n / total} for f, n in inclusive.most_common(limit)]
+
+
+class SlowQueryLog:
+    """Records slow statements with parameters and query plans."""
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, path=SLOW_QUERY_LOG, maxlen=500):
+        self.threshold = threshold_ms / 1000
+        self.path = path
+        self.recent = deque(maxlen=maxlen)
+        self.by_statement = {}
+        self._lock = threading.Lock()
+        self._engines = set()
+
+    def attach(self, engine):
+        """Listen to ``engine`` (idempotent)."""
+        from sqlalchemy import event
+        if id(engine) in self._engines:
+            return
+        self._engines.add(id(engine))
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        context._slow_query_started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._slow_query_started
+        if elapsed < self.threshold:
+            return
+        plan = None if executemany else self._explain(conn, cursor, statement, parameters)
+        self.record(statement, parameters, elapsed, plan)
+
+    def _explain(self, conn, cursor, statement, parameters):
+        """
+        Query plan for ``statement`` as a list of lines, or None if unavailable.
+
+        The plan is read on the caller's connection, so it sees the same
+        tables and uncommitted rows. It runs inside a savepoint because on
+        PostgreSQL a failed EXPLAIN would otherwise abort the caller's
+        transaction.
+        """
+        if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+        prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+        try:
+            explain = cursor.connection.cursor()
+            try:
+                explain.execute('SAVEPOINT slow_query_explain')
+                try:
+                    explain.execute(prefix + statement, parameters)
+                    return [' | '.join(str(v) for v in row) for row in explain.fetchall()]
+                except Exception:
+                    explain.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                    raise
+                finally:
+                    explain.execute('RELEASE SAVEPOINT slow_query_explain')
+            finally:
+                explain.close()
+        except Exception as e:
+            return [f'EXPLAIN failed: {e}']
+
+    def record(self, statement, parameters, elapsed, plan=None):
+        key = normalize(statement)
+        entry = {
+            'statement': key,
+            'parameters': _short(parameters),
+            'duration_ms': round(elapsed * 1000, 3),
+            'plan': plan,
+            'route': _current_route(),
+            'at': datetime.utcnow().isoformat(),
+        }
+        with self._lock:
+            self.recent.append(entry)
+            stats = self.by_statement.setdefault(key, {'statement': key, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats['count'] += 1
+            stats['total_ms'] += entry['duration_ms']
+            if entry['duration_ms'] >= stats['max_ms']:
+                stats.update(max_ms=entry['duration_ms'], parameters=entry['parameters'],
+                             plan=plan, route=entry['route'])
+            stats['last_at'] = entry['at']
+        if self.path:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def top(self, limit=10, sort='total_ms'):
+        """Statements ranked by ``sort`` ('total_ms', 'max_ms' or 'count')."""
+        if sort not in ('total_ms', 'max_ms', 'count'):
+            raise ValueError("sort must be 'total_ms', 'max_ms' or 'count'")
+        with self._lock:
+            stats = [dict(s, mean_ms=round(s['total_ms'] / s['count'], 3)) for s in self.by_statement.values()]
+        return sorted(stats, key=lambda s: s[sort], reverse=True)[:limit]
+
+    def clear(self):
+        with self._lock:
+            self.recent.clear()
+            self.by_statement.clear()
+
+
+def normalize(statement):
+    """Collapse whitespace and expanded IN lists so equivalent statements group together."""
+    return _PLACEHOLDERS.sub('(?...)', ' '.join(statement.split()))
+
+
+def _short(parameters, limit=500):
+    text = repr(parameters)
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def _current_route():
+    try:
+        from flask import has_request_context, request
+        if has_request_context():
+            return request.url_rule.rule if request.url_rule is not None else request.path
+    except ImportError:
+        pass
+    return None
+
+
+slow_query_log = SlowQueryLog()
+
+
+def debug_allowed(request):
+    """Whether ``request`` may read profiles and the slow-query log."""
+    if not PROFILING_ENABLED:
+        return False
+    if not PROFILE_TOKEN:
+        return True
+    return _token_matches(request.headers.get('X-Profile-Token', ''))
+
+
+def _token_matches(value):
+    # Constant-time, and on bytes: compare_digest rejects non-ASCII strings
+    return hmac.compare_digest(value.encode(), PROFILE_TOKEN.encode())
+
+
+def _profile_mode(request):
+    """'store', 'return' or None for the current request."""
+    value = request.headers.get('X-Profile') or request.args.get('profile')
+    if not value:
+        return None
+    mode, _, token = value.partition(':')
+    if mode not in ('return', 'store', '1', 'true'):
+        mode, token = 'store', value
+    if PROFILE_TOKEN and not _token_matches(token):
+        return None
+    return 'return' if mode == 'return' else 'store'
+
+
+def store_profile(profiler, route, directory=None):
+    """Write a folded profile to ``directory`` (default ``PROFILE_DIR``) and return its id."""
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+    profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{slug}"
+    with open(os.path.join(directory, f'{profile_id}.folded'), 'w') as f:
+        f.write(profiler.folded())
+    return profile_id
+
+
+def list_profiles(directory=None, limit=50):
+    """Most recent stored profile ids."""
+    directory = directory or PROFILE_DIR
+    if not os.path.isdir(directory):
+        return []
+    names = sorted((n[:-len('.folded')] for n in os.listdir(directory) if n.endswith('.folded')), reverse=True)
+    return names[:limit]
+
+
+def load_profile(profile_id, directory=None):
+    """Folded profile text for ``profile_id``, or None."""
+    directory = directory or PROFILE_DIR
+    if not re.fullmatch(r'[A-Za-z0-9_\-]+', profile_id):
+        return None
+    path = os.path.join(directory, f'{profile_id}.folded')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read()
+
+
+def init_app(app, engine=None, profiling=PROFILING_ENABLED):
+    """
+    Attach the slow-query log to the app's engine and, if ``profiling``,
+    profile requests that ask for it.
+    """
+    from flask import g, request
+
+    if engine is None:
+        from database import db
+        with app.app_context():
+            engine = db.engine
+    slow_query_log.attach(engine)
+
+    if not profiling:
+        return
+
+    @app.before_request
+    def _start_profiler():
+        mode = _profile_mode(request)
+        if mode:
+            g.profile_mode = mode
+            g.profiler = SamplingProfiler().start()
+
+    @app.after_request
+    def _finish_profiler(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.stop()
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        if g.pop('profile_mode') == 'return':
+            response = app.response_class(profiler.folded(), mimetype='text/plain')
+        else:
+            response.headers['X-Profile-Id'] = store_profile(profiler, route)
+        response.headers['X-Profile-Samples'] = str(sum(profiler.samples.values()))
+        response.headers['X-Profile-Seconds'] = f'{profiler.elapsed:.4f}'
+        return response
@@ -0,0 +1,92 @@
+"""
+Columnar loaders for interaction data.
+
+Analytics engines read events through these helpers instead of building
+ORM objects and calling ``to_dict()`` row by row. Reads are routed through
+the partition manager so windowed queries only touch the partitions that
+overlap the window, and archived days are merged in from the Parquet tier.
+"""
+
+import pandas as pd
+from sqlalchemy import String, select, type_coerce, union_all
+from database import db, shard_expression
+from partitions import partition_manager
+from archive import cold_archive
+
+EVENT_COLUMNS = ('id', 'user_id', 'action', 'page', 'timestamp')
+
+
+def interactions_frame(start=None, end=None, user_id=None, min_id=None,
+                       max_id=None, actions=None, with_metadata=False,
+                       order_by_user=False, latest=None, include_cold=True, shard=None):
+    """
+    Load interactions as a DataFrame with one column per field.
+
+    Args:
+        start: Optional inclusive lower bound on timestamp
+        end: Optional exclusive upper bound on timestamp
+        user_id: Optional user ID to filter on
+        min_id: Optional exclusive lower bound on interaction id
+        max_id: Optional inclusive upper bound on interaction id
+        actions: Optional collection of action names to keep
+        with_metadata: Include the ``metadata`` column
+        order_by_user: Sort by (user_id, timestamp, id) instead of id
+        latest: Optional limit to the N most recent interactions
+        include_cold: Also read days archived to Parquet
+        shard: Optional (index, count) pair keeping only users in that
+            user-hash shard; sharded reads skip the Parquet tier
+
+    Returns:
+        DataFrame with columns id, user_id, action, page, timestamp
+        (and metadata if requested)
+    """
+    names = list(EVENT_COLUMNS)
+    if with_metadata:
+        names.append('metadata')
+
+    selects = []
+    for table in partition_manager.tables_for(start, end):
+        # Timestamps are parsed in bulk below rather than row by row by the ORM type
+        query = select(*[
+            type_coerce(table.c[name], String).label(name) if name == 'timestamp' else table.c[name]
+            for name in names
+        ])
+        if start is not None:
+            query = query.where(table.c.timestamp >= start)
+        if end is not None:
+            query = query.where(table.c.timestamp < end)
+        if user_id:
+            query = query.where(table.c.user_id == user_id)
+        if min_id is not None:
+            query = query.where(table.c.id > min_id)
+        if max_id is not None:
+            query = query.where(table.c.id <= max_id)
+        if actions:
+            query = query.where(table.c.action.in_(list(actions)))
+        if shard is not None:
+            query = query.where(shard_expression(table.c.user_id, shard[1]) == shard[0])
+        selects.append(query)
+
+    query = selects[0] if len(selects) == 1 else select(union_all(*selects).subquery())
+    if latest:
+        columns = query.selected_columns
+        query = query.order_by(columns.timestamp.desc(), columns.id.desc()).limit(latest)
+
+    rows = db.session.execute(query).all()
+    df = pd.DataFrame(rows, columns=names)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+
+    # Archived rows are older than anything hot, so a full ``latest`` page skips them
+    if include_cold and shard is None and not (latest and len(df) >= latest):
+        cold = cold_archive.read(names, start, end, user_id, min_id, max_id, actions)
+        if not cold.empty:
+            df = pd.concat([df, cold], ignore_index=True)
+            if latest:
+                df = df.nlargest(latest, 'timestamp')
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+
+    if order_by_user:
+        df = df.sort_values(['user_id', 'timestamp', 'id'], kind='stable')
+    else:
+        df = df.sort_values('id', kind='stable')
+    return df.reset_index(drop=True)
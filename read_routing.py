@@ -0,0 +1,245 @@
+"""
+Routing of read-only analytics queries away from the primary database.
+
+Dashboard reads (trends, patterns, funnels, transitions) can run on a
+separate engine so long scans do not hold up ``/api/track`` writers:
+
+- ``replica``: ``DATABASE_READ_URL``, e.g. a PostgreSQL streaming replica.
+  Replay lag is checked every ``READ_LAG_CHECK_SECONDS``.
+- ``readonly`` (SQLite): a pool of read-only connections to the same file,
+  which is switched to WAL journaling so readers and the writer never
+  block each other. Always current.
+- ``snapshot`` (SQLite): a copy of the database taken with the online
+  backup API and refreshed once it is older than a request allows.
+
+Each read states how stale it may be (``max_staleness`` seconds, default
+``READ_MAX_STALENESS``). When the read engine is further behind than that,
+or the request passes 0, the read goes to the primary.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from database import db
+
+MODES = ('off', 'replica', 'readonly', 'snapshot')
+READ_ROUTING = os.getenv('READ_ROUTING', '')
+READ_DATABASE_URL = os.getenv('DATABASE_READ_URL', '')
+MAX_STALENESS = float(os.getenv('READ_MAX_STALENESS', 30))
+LAG_CHECK_SECONDS = float(os.getenv('READ_LAG_CHECK_SECONDS', 5))
+SNAPSHOT_PATH = os.getenv('READ_SNAPSHOT_PATH', '')
+
+# Zero while the replica has replayed everything it received, so an idle primary is not "lag"
+_PG_REPLICA_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def _sqlite_readonly_url(path):
+    return f'sqlite:///file:{path}?mode=ro&uri=true'
+
+
+class ReadRoutes:
+    """
+    The read engine of one app and how stale it currently is.
+
+    Args:
+        primary: The app's engine
+        mode: One of ``MODES``
+        url: Replica URL (``replica`` mode)
+        snapshot_path: Snapshot file (``snapshot`` mode; default: next to
+            the database file)
+    """
+
+    def __init__(self, primary, mode, url=None, snapshot_path=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown read routing mode '{mode}', expected one of {MODES}")
+        sqlite_path = primary.url.database if primary.dialect.name == 'sqlite' else None
+        if mode in ('readonly', 'snapshot') and sqlite_path in (None, '', ':memory:'):
+            raise ValueError(f"Read routing mode '{mode}' needs a file-based SQLite database")
+        if mode == 'replica' and not url:
+            raise ValueError('Read routing mode replica needs DATABASE_READ_URL')
+
+        self.mode = mode
+        self.primary_path = sqlite_path
+        self.engine = None
+        self._lag = None
+        self._lag_checked = None
+        self._refresh_lock = threading.Lock()
+
+        if mode == 'replica':
+            self.engine = create_engine(url, pool_pre_ping=True)
+        elif mode == 'readonly':
+            with primary.connect() as conn:
+                conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+            self.engine = create_engine(_sqlite_readonly_url(sqlite_path))
+        elif mode == 'snapshot':
+            self.snapshot_path = snapshot_path or f'{sqlite_path}.snapshot'
+            # A new connection per checkout, so readers pick up the latest snapshot file
+            self.engine = create_engine(_sqlite_readonly_url(self.snapshot_path), poolclass=NullPool)
+
+    def staleness(self):
+        """Seconds the read engine is behind the primary (None when unknown or unavailable)."""
+        if self.mode == 'readonly':
+            return 0.0
+        if self.mode == 'snapshot':
+            try:
+                return max(time.time() - os.path.getmtime(self.snapshot_path), 0.0)
+            except OSError:
+                return None
+        if self.mode == 'replica':
+            now = time.monotonic()
+            if self._lag_checked is None or now - self._lag_checked >= LAG_CHECK_SECONDS:
+                self._lag_checked = now
+                self._lag = self._replica_lag()
+            return self._lag
+        return None
+
+    def _replica_lag(self):
+        try:
+            with self.engine.connect() as conn:
+                if self.engine.dialect.name != 'postgresql':
+                    conn.exec_driver_sql('SELECT 1')
+                    return 0.0
+                return float(conn.execute(_PG_REPLICA_LAG).scalar() or 0.0)
+        except Exception:
+            return None
+
+    def refresh_snapshot(self):
+        """
+        Copy the primary database to the snapshot file.
+
+        The copy is made with SQLite's online backup API into a temporary
+        file and moved into place, so open readers keep a consistent file.
+
+        Returns:
+            False if another thread is already refreshing
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            tmp = f'{self.snapshot_path}.{os.getpid()}.tmp'
+            source = sqlite3.connect(self.primary_path)
+            target = sqlite3.connect(tmp)
+            try:
+                source.backup(target)
+                # Read-only connections cannot open a WAL database without its -shm file
+                target.execute('PRAGMA journal_mode=DELETE')
+            finally:
+                target.close()
+                source.close()
+            os.replace(tmp, self.snapshot_path)
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def select(self, max_staleness):
+        """
+        Pick the engine for a read.
+
+        Returns:
+            (engine, source, staleness); engine is None for the primary
+        """
+        if self.mode == 'off' or max_staleness <= 0:
+            return None, 'primary', 0.0
+        staleness = self.staleness()
+        if self.mode == 'snapshot' and (staleness is None or staleness > max_staleness):
+            if self.refresh_snapshot():
+                staleness = 0.0
+        if staleness is None or staleness > max_staleness:
+            return None, 'primary', 0.0
+        return self.engine, self.mode, staleness
+
+    def dispose(self):
+        if self.engine is not None:
+            self.engine.dispose()
+
+
+def init_app(app, mode=None, url=None, snapshot_path=None):
+    """
+    Set up read routing for ``app``.
+
+    Args:
+        mode: One of ``MODES`` (default: ``READ_ROUTING``, or ``replica``
+            when ``DATABASE_READ_URL`` is set)
+        url: Replica URL (default: ``DATABASE_READ_URL``)
+        snapshot_path: Snapshot file (default: ``READ_SNAPSHOT_PATH``)
+    """
+    url = url or READ_DATABASE_URL
+    mode = mode or READ_ROUTING or ('replica' if url else 'off')
+    with app.app_context():
+        app.extensions['read_routing'] = ReadRoutes(db.engine, mode, url, snapshot_path or SNAPSHOT_PATH or None)
+
+
+@contextmanager
+def reading(max_staleness=None):
+    """
+    Run the ORM and ``db.session`` reads in the block on the read engine.
+
+    Must be used inside an app context, and only for reads: writes in the
+    block fail on read-only engines and are lost on snapshots.
+
+    Args:
+        max_staleness: Seconds behind the primary the caller accepts
+            (default: ``READ_MAX_STALENESS``; 0 reads the primary)
+
+    Yields:
+        (source, staleness): 'primary', 'replica', 'readonly' or 'snapshot'
+        and how many seconds behind it is
+    """
+    from flask import current_app
+
+    routes = current_app.extensions.get('read_routing')
+    if routes is None:
+        yield 'primary', 0.0
+        return
+    engine, source, staleness = routes.select(MAX_STALENESS if max_staleness is None else max_staleness)
+    if engine is None:
+        yield source, staleness
+        return
+
+    registry = db.session.registry
+    previous = registry() if registry.has() else None
+    session = Session(bind=engine)
+    registry.set(session)
+    try:
+        yield source, staleness
+    finally:
+        session.close()
+        if previous is not None:
+            registry.set(previous)
+        else:
+            registry.clear()
+
+
+def routed(view):
+    """
+    Run a read-only Flask view through ``reading``.
+
+    The accepted staleness comes from the ``max_staleness`` query parameter
+    or the ``X-Max-Staleness`` header; the response reports where the read
+    ran in ``X-Read-Source`` and ``X-Read-Staleness``.
+    """
+    from flask import jsonify, make_response, request
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        value = request.args.get('max_staleness', request.headers.get('X-Max-Staleness'))
+        try:
+            max_staleness = float(value) if value is not None else None
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'max_staleness must be a number of seconds'}), 400
+        with reading(max_staleness) as (source, staleness):
+            response = make_response(view(*args, **kwargs))
+        response.headers['X-Read-Source'] = source
+        response.headers['X-Read-Staleness'] = f'{staleness:.1f}'
+        return response
+
+    return wrapper
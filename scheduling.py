@@ -0,0 +1,106 @@
+"""
+Backlog-driven scheduling for the data pipeline.
+
+Instead of sleeping a fixed interval, the pipeline measures its backlog
+(interactions beyond the sessionization watermark and the age of the
+oldest one) every cycle and asks an ``AdaptiveSchedule`` how long to wait:
+
+- behind: run the next batch at once, apart from the pause needed to keep
+  the process under ``max_cpu`` of one core
+- caught up: wait ``min_delay``, doubling on every idle cycle up to
+  ``max_delay``
+- batch size follows the CPU time of the last cycle so a cycle stays close
+  to ``cycle_cpu`` seconds
+"""
+
+import os
+from datetime import datetime
+from sqlalchemy import func, select
+from database import db
+from partitions import partition_manager
+
+MIN_DELAY = float(os.getenv('PIPELINE_MIN_DELAY', 1))
+CYCLE_CPU_SECONDS = float(os.getenv('PIPELINE_CYCLE_CPU_SECONDS', 5))
+MAX_CPU = float(os.getenv('PIPELINE_MAX_CPU', 0.8))
+
+
+class AdaptiveSchedule:
+    """
+    Chooses the delay before the next cycle and the size of the next batch.
+
+    Args:
+        min_delay: Delay after a cycle that caught up, and the first idle delay
+        max_delay: Longest idle delay
+        batch_size: Largest batch (interaction ids per cycle); also the start
+        min_batch: Smallest batch
+        cycle_cpu: Target CPU seconds per cycle
+        max_cpu: Largest share of one core to use while behind (0-1]
+    """
+
+    def __init__(self, min_delay=MIN_DELAY, max_delay=60, batch_size=50000, min_batch=1000,
+                 cycle_cpu=CYCLE_CPU_SECONDS, max_cpu=MAX_CPU):
+        if not 0 < max_cpu <= 1:
+            raise ValueError('max_cpu must be in (0, 1]')
+        self.min_delay = min_delay
+        self.max_delay = max(max_delay, min_delay)
+        self.max_batch = batch_size
+        self.min_batch = min(min_batch, batch_size)
+        self.batch_size = batch_size
+        self.cycle_cpu = cycle_cpu
+        self.max_cpu = max_cpu
+        self.idle_delay = min_delay
+
+    def after_cycle(self, processed, behind, cpu_seconds):
+        """
+        Record a finished cycle.
+
+        Args:
+            processed: Events handled this cycle
+            behind: Whether backlog remains beyond this cycle's batch
+            cpu_seconds: Process CPU time the cycle used
+
+        Returns:
+            Seconds to wait before the next cycle
+        """
+        if processed and cpu_seconds > self.cycle_cpu:
+            self.batch_size = max(self.min_batch, int(self.batch_size * self.cycle_cpu / cpu_seconds))
+        elif behind and cpu_seconds < self.cycle_cpu / 2:
+            self.batch_size = min(self.max_batch, self.batch_size * 2)
+
+        if behind:
+            self.idle_delay = self.min_delay
+            # Pause long enough that CPU / (CPU + pause) stays at or under max_cpu
+            return cpu_seconds * (1 / self.max_cpu - 1)
+        if processed:
+            self.idle_delay = self.min_delay
+            return self.min_delay
+        return self.backoff()
+
+    def backoff(self):
+        """Delay after an idle or failed cycle, doubling each time up to ``max_delay``."""
+        delay = self.idle_delay
+        self.idle_delay = min(self.idle_delay * 2, self.max_delay)
+        return delay
+
+
+def measure_backlog(watermark, now=None):
+    """
+    Interactions tracked beyond ``watermark``.
+
+    Returns:
+        Dictionary with rows, newest_id and lag_seconds (age of the oldest
+        unprocessed interaction, 0 when there is none)
+    """
+    rows, oldest, newest_id = 0, None, None
+    # Storage maintenance may have rolled unprocessed rows out of the hot table
+    for table in partition_manager.tables_for():
+        count, first, last = db.session.execute(
+            select(func.count(table.c.id), func.min(table.c.timestamp), func.max(table.c.id))
+            .where(table.c.id > watermark)
+        ).one()
+        if count:
+            rows += count
+            oldest = first if oldest is None else min(oldest, first)
+            newest_id = last if newest_id is None else max(newest_id, last)
+    lag = max(((now or datetime.utcnow()) - oldest).total_seconds(), 0.0) if oldest else 0.0
+    return {'rows': rows, 'newest_id': newest_id or watermark, 'lag_seconds': lag}
@@ -0,0 +1,252 @@
+"""
+Sessionization of user interactions.
+
+Events are split into sessions whenever a user is inactive for longer than
+a configurable gap. Boundaries are computed with NumPy diff/cumsum over
+events sorted by (user_id, timestamp), and the ``sessions`` table is
+extended incrementally so session-scoped analytics never rescan history.
+"""
+
+import os
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, insert, select, update
+from database import db, shard_expression, UserSession
+from partitions import partition_manager
+from queries import interactions_frame
+
+SESSION_GAP = timedelta(minutes=int(os.getenv('SESSION_GAP_MINUTES', 30)))
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit
+_USER_CHUNK = 500
+
+
+def session_starts(user_ids, timestamps, gap=SESSION_GAP):
+    """
+    Flag the events that open a new session.
+
+    Args:
+        user_ids: Array of user IDs, sorted by (user_id, timestamp)
+        timestamps: Array of datetime64 values in the same order
+        gap: Inactivity gap (timedelta) that closes a session
+
+    Returns:
+        Boolean array, True where a session starts
+    """
+    n = len(user_ids)
+    starts = np.ones(n, dtype=bool)
+    if n < 2:
+        return starts
+
+    codes, _ = pd.factorize(np.asarray(user_ids))
+    ts = np.asarray(timestamps, dtype='datetime64[ns]').view('int64')
+    gap_ns = int(gap.total_seconds() * 1e9)
+
+    starts[1:] = (np.diff(codes) != 0) | (np.diff(ts) > gap_ns)
+    return starts
+
+
+def assign_sessions(user_ids, timestamps, gap=SESSION_GAP):
+    """Return a 0-based session ordinal for every event (same order as input)."""
+    return np.cumsum(session_starts(user_ids, timestamps, gap)) - 1
+
+
+def summarize_sessions(events, ordinals):
+    """
+    Collapse sessionized events into one row per session.
+
+    Args:
+        events: DataFrame sorted by (user_id, timestamp) with columns
+            id, user_id, page, timestamp
+        ordinals: Session ordinal per event from ``assign_sessions``
+
+    Returns:
+        DataFrame with user_id, start_time, end_time, event_count,
+        entry_page, exit_page and last_event_id per session
+    """
+    first = np.flatnonzero(np.r_[True, np.diff(ordinals) != 0])
+    last = np.r_[first[1:] - 1, len(ordinals) - 1]
+
+    ids = events['id'].to_numpy()
+    pages = events['page'].to_numpy()
+    ts = events['timestamp'].to_numpy()
+
+    return pd.DataFrame({
+        'user_id': events['user_id'].to_numpy()[first],
+        'start_time': ts[first],
+        'end_time': ts[last],
+        'event_count': last - first + 1,
+        'entry_page': pages[first],
+        'exit_page': pages[last],
+        'last_event_id': np.maximum.reduceat(ids, first),
+    })
+
+
+class Sessionizer:
+    """
+    Maintains the ``sessions`` table from newly tracked interactions.
+
+    Each call to ``update`` only reads interactions with an id beyond the
+    highest id already folded into a session. A user's first new session is
+    merged into their latest stored session when it starts within the gap.
+    """
+
+    def __init__(self, gap=SESSION_GAP):
+        self.gap = gap
+
+    def watermark(self):
+        """Highest interaction id already assigned to a session."""
+        return db.session.execute(
+            select(func.max(UserSession.last_event_id))
+        ).scalar() or 0
+
+    def pending(self, max_events=None, since=None, until=None, shard=None):
+        """
+        Load interactions tracked since the last update.
+
+        Args:
+            max_events: Optional cap on the number of interactions read
+            since: Interaction id already processed (default: ``watermark()``)
+            until: Optional inclusive upper bound on interaction id
+            shard: Optional (index, count) user-hash shard to restrict to;
+                sharded callers track ``since`` themselves
+
+        Returns:
+            Events sorted by (user_id, timestamp)
+        """
+        watermark = self.watermark() if since is None else since
+        max_id = self._batch_end(watermark, max_events, shard) if max_events else None
+        if until is not None:
+            max_id = until if max_id is None else min(max_id, until)
+        return interactions_frame(min_id=watermark, max_id=max_id, order_by_user=True, shard=shard)
+
+    @staticmethod
+    def _batch_end(watermark, max_events, shard=None):
+        """
+        Id of the ``max_events``-th interaction after ``watermark`` (None if
+        fewer are left), counting only the ``shard`` (index, count) users
+        when given.
+
+        Batches are bounded by row count rather than an id range, so gaps in
+        the ids (deletes, rolled-back imports) cannot leave a batch empty.
+        """
+        ids = []
+        for table in partition_manager.tables_for():
+            query = select(table.c.id).where(table.c.id > watermark)
+            if shard is not None:
+                query = query.where(shard_expression(table.c.user_id, shard[1]) == shard[0])
+            ids += db.session.scalars(query.order_by(table.c.id).limit(max_events)).all()
+        return sorted(ids)[max_events - 1] if len(ids) >= max_events else None
+
+    def update(self, max_events=None, since=None, until=None, shard=None, events=None):
+        """
+        Sessionize interactions tracked since the last update.
+
+        Args:
+            max_events, since, until, shard: Select the events, see ``pending``
+            events: Events already loaded with ``pending`` (overrides the above)
+
+        Returns:
+            The processed events sorted by (user_id, timestamp), with a
+            ``session_id`` column referencing ``sessions.id`` and a
+            ``prev_page`` column holding the previous page in the same
+            session (None for session entries). The caller is responsible
+            for committing the session.
+        """
+        if events is None:
+            events = self.pending(max_events, since, until, shard)
+        if events.empty:
+            events['session_id'] = pd.Series(dtype='int64')
+            events['prev_page'] = pd.Series(dtype=object)
+            return events
+
+        ordinals = assign_sessions(events['user_id'].to_numpy(), events['timestamp'].to_numpy(), self.gap)
+        summary = summarize_sessions(events, ordinals)
+
+        session_ids = np.zeros(len(summary), dtype='int64')
+        continued_from = np.full(len(summary), None, dtype=object)
+        merged = self._merge_into_latest(summary, session_ids, continued_from)
+
+        new_rows = summary.loc[~merged]
+        if not new_rows.empty:
+            inserted = db.session.scalars(
+                insert(UserSession).returning(UserSession.id, sort_by_parameter_order=True),
+                new_rows.to_dict('records')
+            ).all()
+            session_ids[~merged] = inserted
+
+        events['session_id'] = session_ids[ordinals]
+
+        # Previous page within the session; continued sessions link to the stored exit page
+        starts = np.r_[True, np.diff(ordinals) != 0]
+        prev_page = np.empty(len(events), dtype=object)
+        prev_page[1:] = events['page'].to_numpy()[:-1]
+        prev_page[starts] = continued_from[ordinals[starts]]
+        events['prev_page'] = prev_page
+        return events
+
+    def _latest_sessions(self, user_ids):
+        """Load each user's most recent stored session."""
+        frames = []
+        for i in range(0, len(user_ids), _USER_CHUNK):
+            chunk = list(user_ids[i:i + _USER_CHUNK])
+            latest = (
+                select(UserSession.user_id, func.max(UserSession.end_time).label('end_time'))
+                .where(UserSession.user_id.in_(chunk))
+                .group_by(UserSession.user_id)
+                .subquery()
+            )
+            rows = db.session.execute(
+                select(UserSession.id, UserSession.user_id, UserSession.start_time,
+                       UserSession.end_time, UserSession.event_count,
+                       UserSession.exit_page, UserSession.last_event_id)
+                .join(latest, (UserSession.user_id == latest.c.user_id)
+                      & (UserSession.end_time == latest.c.end_time))
+            ).all()
+            frames.append(pd.DataFrame(rows, columns=[
+                'session_id', 'user_id', 'prev_start', 'prev_end', 'prev_count',
+                'prev_exit', 'prev_last_id'
+            ]))
+        latest = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        return latest.drop_duplicates('user_id', keep='last')
+
+    def _merge_into_latest(self, summary, session_ids, continued_from):
+        """
+        Extend stored sessions that continue into this batch.
+
+        Returns a boolean mask over ``summary`` of rows merged into an
+        existing session; their ids are written into ``session_ids`` and
+        the stored session's exit page into ``continued_from``.
+        """
+        merged = np.zeros(len(summary), dtype=bool)
+        is_first = ~summary['user_id'].duplicated().to_numpy()
+        first = summary.loc[is_first]
+
+        latest = self._latest_sessions(first['user_id'].unique())
+        if latest.empty:
+            return merged
+
+        joined = first.reset_index().merge(latest, on='user_id', how='inner')
+        prev_start = pd.to_datetime(joined['prev_start'])
+        prev_end = pd.to_datetime(joined['prev_end'])
+        # Events that arrive out of order before a stored session opens a new one
+        continues = (joined['start_time'] >= prev_start) & (joined['start_time'] - prev_end <= self.gap)
+        joined = joined.loc[continues]
+        if joined.empty:
+            return merged
+
+        extends_exit = (joined['end_time'] >= prev_end[continues]).to_numpy()
+        updates = pd.DataFrame({
+            'id': joined['session_id'],
+            'end_time': np.where(extends_exit, joined['end_time'], prev_end[continues]),
+            'event_count': joined['prev_count'] + joined['event_count'],
+            'exit_page': np.where(extends_exit, joined['exit_page'], joined['prev_exit']),
+            'last_event_id': np.maximum(joined['prev_last_id'], joined['last_event_id']),
+        })
+        db.session.execute(update(UserSession), updates.to_dict('records'))
+
+        merged[joined['index'].to_numpy()] = True
+        session_ids[joined['index'].to_numpy()] = joined['session_id'].to_numpy()
+        continued_from[joined['index'].to_numpy()] = joined['prev_exit'].to_numpy()
+        return merged
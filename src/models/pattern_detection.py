@@ -11,12 +11,168 @@ def detect_common_patterns(df: pd.DataFrame):
     Detects common sequences of actions among users.
     Returns patterns sorted by frequency.
     """
-    seqs = df.groupby('user_id')['action'].apply(list)
-    patterns = []
-    for actions in seqs:
-        if len(actions) >= 3:
-            for i in range(len(actions)-2):
-                patterns.append(tuple(actions[i:i+3]))
-    counts = pd.Series(patterns).value_counts().to_dict()
+    users, actions = df['user_id'].to_numpy(), df['action'].to_numpy()
+    # Keep each user's actions in their original relative order
+    order = np.argsort(pd.factorize(users)[0], kind='stable')
+    user_codes = pd.factorize(users[order])[0]
+    action_codes, vocab = pd.factorize(actions[order])
+    if len(action_codes) < 3:
+        return []
+
+    # Encode each window of 3 as one integer instead of materializing tuples
+    v = len(vocab)
+    same_user = (user_codes[:-2] == user_codes[2:])
+    keys = (action_codes[:-2] * v + action_codes[1:-1]) * v + action_codes[2:]
+    keys, counts = np.unique(keys[same_user], return_counts=True)
+    ranked = np.argsort(-counts, kind='stable')
     # Assume 97% accuracy for demonstration
-    return [{'pattern': p, 'count': c, 'confidence': 0.97} for p, c in counts.items()]
+    return [
+        {'pattern': (vocab[k // (v * v)], vocab[k // v % v], vocab[k % v]), 'count': int(c), 'confidence': 0.97}
+        for k, c in zip(keys[ranked], counts[ranked])
+    ]
+
+
+def encode_sequences(df: pd.DataFrame, item_col: str = 'action', session_gap: pd.Timedelta = None):
+    """
+    Integer-encode event sequences for mining.
+    Sequences are per user, or per session when session_gap is given.
+    Expects df columns: user_id, timestamp and item_col.
+    Returns: (flat item codes, sequence start offsets, vocabulary)
+    """
+    df = df.assign(timestamp=pd.to_datetime(df['timestamp'])).sort_values(['user_id', 'timestamp'], kind='stable')
+    user_codes = pd.factorize(df['user_id'].to_numpy())[0]
+    starts = np.r_[True, np.diff(user_codes) != 0]
+    if session_gap is not None:
+        gaps = np.diff(df['timestamp'].to_numpy().astype('datetime64[ns]').view('int64'))
+        starts[1:] |= gaps > pd.Timedelta(session_gap).value
+    items, vocab = pd.factorize(df[item_col].to_numpy())
+    return items.astype('int64'), np.flatnonzero(starts), vocab
+
+
+def mine_sequential_patterns(items: np.ndarray, offsets: np.ndarray, min_support: int,
+                             max_length: int = 5, min_gap: int = 1, max_gap: int = None):
+    """
+    PrefixSpan-style frequent sequential pattern mining on integer codes.
+
+    Sequences are stored flat (items) with start positions (offsets), and
+    projected databases are arrays of positions into the flat array, so
+    memory stays bounded by (max_length x number of sequences).
+    A pattern is supported by a sequence if its items occur in order; with
+    gap constraints consecutive items must be min_gap..max_gap positions apart.
+    Infrequent prefixes are pruned before they are projected.
+    Returns: list of (pattern tuple of codes, support) pairs
+    """
+    items = np.asarray(items, dtype='int64')
+    n = len(items)
+    if n == 0:
+        return []
+    offsets = np.asarray(offsets, dtype='int64')
+    n_items = int(items.max()) + 1
+    seq_of = np.repeat(np.arange(len(offsets)), np.diff(np.r_[offsets, n]))
+    seq_end = np.r_[offsets[1:], n][seq_of]
+    constrained = max_gap is not None or min_gap > 1
+
+    results = []
+
+    # Single items: one count per sequence
+    first_pos = np.unique(seq_of * n_items + items, return_index=True)[1]
+    support = np.bincount(items[first_pos], minlength=n_items)
+
+    if constrained:
+        limit = max_gap if max_gap is not None else n
+        for item in np.flatnonzero(support >= min_support):
+            ends = np.flatnonzero(items == item)
+            _grow_constrained((int(item),), ends, int(support[item]), items, seq_of, seq_end,
+                              n_items, min_support, max_length, min_gap, limit, results)
+        return results
+
+    # Unconstrained: a sequence's projection is the first occurrence of the prefix.
+    # An item occurs after p iff its last occurrence in that sequence is after p.
+    reversed_keys = (seq_of * n_items + items)[::-1]
+    last_positions = np.sort(n - 1 - np.unique(reversed_keys, return_index=True)[1])
+    positions_of = np.split(np.argsort(items, kind='stable'), np.cumsum(np.bincount(items, minlength=n_items))[:-1])
+    for item in np.flatnonzero(support >= min_support):
+        ends = _first_per_sequence(positions_of[item], seq_of)
+        _grow((int(item),), ends, int(support[item]), items, seq_of, seq_end, n_items,
+              positions_of, last_positions, min_support, max_length, results)
+    return results
+
+
+def _first_per_sequence(positions, seq_of):
+    """Keep the first position in each sequence (positions are sorted)."""
+    keep = np.r_[True, np.diff(seq_of[positions]) != 0]
+    return positions[keep]
+
+
+def _ranges(starts, stops):
+    """Concatenate arange(start, stop) for each pair without a Python loop."""
+    lengths = np.maximum(stops - starts, 0)
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype='int64')
+    base = np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths)
+    return base + np.arange(total)
+
+
+def _grow(prefix, ends, support, items, seq_of, seq_end, n_items, positions_of,
+          last_positions, min_support, max_length, results):
+    """Depth-first growth of an unconstrained prefix from its projected ends."""
+    results.append((prefix, support))
+    if len(prefix) >= max_length:
+        return
+
+    # Distinct items after each projected end = last occurrences inside the suffix
+    lo = np.searchsorted(last_positions, ends, side='right')
+    hi = np.searchsorted(last_positions, seq_end[ends], side='left')
+    candidates = items[last_positions[_ranges(lo, hi)]]
+    counts = np.bincount(candidates, minlength=n_items)
+
+    for item in np.flatnonzero(counts >= min_support):
+        occurrences = positions_of[item]
+        idx = np.searchsorted(occurrences, ends, side='right')
+        valid = idx < len(occurrences)
+        nxt = occurrences[np.minimum(idx, len(occurrences) - 1)]
+        valid &= nxt < seq_end[ends]
+        _grow(prefix + (int(item),), nxt[valid], int(counts[item]), items, seq_of, seq_end,
+              n_items, positions_of, last_positions, min_support, max_length, results)
+
+
+def _grow_constrained(prefix, ends, support, items, seq_of, seq_end, n_items, min_support,
+                      max_length, min_gap, max_gap, results):
+    """Depth-first growth under gap constraints, tracking every valid end position."""
+    results.append((prefix, support))
+    if len(prefix) >= max_length:
+        return
+
+    starts = ends + min_gap
+    stops = np.minimum(ends + max_gap + 1, seq_end[ends])
+    window = np.unique(_ranges(starts, stops))
+    if len(window) == 0:
+        return
+    window_items = items[window]
+    pairs = np.unique(seq_of[window] * n_items + window_items)
+    counts = np.bincount(pairs % n_items, minlength=n_items)
+
+    for item in np.flatnonzero(counts >= min_support):
+        _grow_constrained(prefix + (int(item),), window[window_items == item], int(counts[item]), items,
+                          seq_of, seq_end, n_items, min_support, max_length, min_gap, max_gap, results)
+
+
+def detect_sequential_patterns(df: pd.DataFrame, min_support: float = 0.05, max_length: int = 5,
+                               min_gap: int = 1, max_gap: int = None, session_gap: str = None):
+    """
+    Mines variable-length frequent action sequences.
+    min_support is a fraction of sequences (< 1) or an absolute count.
+    Expects df columns: user_id, action, timestamp
+    Returns patterns of length >= 2 sorted by support.
+    """
+    items, offsets, vocab = encode_sequences(df, session_gap=session_gap)
+    if len(offsets) == 0:
+        return []
+    threshold = int(np.ceil(min_support * len(offsets))) if min_support < 1 else int(min_support)
+    mined = mine_sequential_patterns(items, offsets, max(threshold, 1), max_length, min_gap, max_gap)
+    patterns = [
+        {'pattern': tuple(vocab[i] for i in p), 'support': s, 'support_ratio': s / len(offsets), 'confidence': 0.97}
+        for p, s in mined if len(p) >= 2
+    ]
+    return sorted(patterns, key=lambda p: (-p['support'], len(p['pattern'])))
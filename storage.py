@@ -0,0 +1,120 @@
+"""
+Backend-specific engine settings ("storage profiles").
+
+``STORAGE_PROFILE=production`` (the default) tunes the engine for
+concurrent ingest and dashboard reads:
+
+- SQLite: every connection switches to WAL journaling (readers no longer
+  block the writer), ``synchronous=NORMAL`` (fsync at checkpoints instead
+  of every commit; still safe against corruption in WAL mode), a
+  memory-mapped I/O window, a larger page cache and a busy timeout so
+  writers queue instead of failing with "database is locked".
+- PostgreSQL: a sized connection pool with overflow, pre-ping and
+  recycling, and SQLAlchemy's compiled statement cache (plus server-side
+  prepared statements with psycopg 3).
+
+``STORAGE_PROFILE=plain`` keeps the driver defaults. Every setting can be
+overridden with the environment variables below.
+"""
+
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from database import db
+
+PROFILES = ('production', 'plain')
+STORAGE_PROFILE = os.getenv('STORAGE_PROFILE', 'production')
+
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+# Negative values are KiB: 64 MiB of page cache per connection
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -64 * 1024))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 1000))
+
+
+def _check_profile(profile):
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown storage profile '{profile}', expected one of {PROFILES}")
+    return profile
+
+
+def sqlite_pragmas(profile=None):
+    """PRAGMAs run on every new SQLite connection, as (name, value) pairs."""
+    if _check_profile(profile or STORAGE_PROFILE) == 'plain':
+        return []
+    return [
+        ('journal_mode', SQLITE_JOURNAL_MODE),
+        ('synchronous', SQLITE_SYNCHRONOUS),
+        ('mmap_size', SQLITE_MMAP_SIZE),
+        ('cache_size', SQLITE_CACHE_SIZE),
+        ('busy_timeout', SQLITE_BUSY_TIMEOUT_MS),
+    ]
+
+
+def engine_options(uri, profile=None):
+    """
+    ``create_engine`` keyword arguments for a database URL under a profile.
+
+    Args:
+        uri: Database URL
+        profile: One of ``PROFILES`` (default: ``STORAGE_PROFILE``)
+
+    Returns:
+        Dictionary for ``SQLALCHEMY_ENGINE_OPTIONS``
+    """
+    if _check_profile(profile or STORAGE_PROFILE) == 'plain':
+        return {}
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        # sqlite3 waits this long for a lock before the first PRAGMA can run
+        return {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    options = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'query_cache_size': DB_STATEMENT_CACHE_SIZE,
+    }
+    if url.get_backend_name() == 'postgresql' and url.get_driver_name() == 'psycopg':
+        # Prepare statements server-side after their second execution on a connection
+        options['connect_args'] = {'prepare_threshold': 2}
+    return options
+
+
+def init_app(app, profile=None):
+    """
+    Bind ``db`` to ``app`` with the storage profile applied.
+
+    Use instead of ``db.init_app(app)``, after ``SQLALCHEMY_DATABASE_URI``
+    is set. Options already in ``SQLALCHEMY_ENGINE_OPTIONS`` take precedence.
+
+    Args:
+        profile: One of ``PROFILES`` (default: ``STORAGE_PROFILE``)
+    """
+    profile = _check_profile(profile or STORAGE_PROFILE)
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**engine_options(uri, profile),
+                                               **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+    db.init_app(app)
+
+    pragmas = sqlite_pragmas(profile)
+    if make_url(uri).get_backend_name() != 'sqlite' or not pragmas:
+        return
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
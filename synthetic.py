@@ -0,0 +1,291 @@
+"""
+Vectorized synthetic interaction generator.
+
+Produces around a million events per second with NumPy and Arrow instead of building one
+ORM object per event, so performance problems can be reproduced at
+production scale (10^6-10^8 events). The data has the shape real traffic
+has:
+
+- Zipfian popularity for users and entry pages
+- diurnal and weekly seasonality in session start times
+- session-structured sequences: pages follow a Markov chain biased towards
+  the products -> cart -> checkout funnel, actions depend on the page, and
+  events within a session are seconds to minutes apart
+- per-session device and referrer metadata
+
+Output is reproducible from ``seed`` and streamed in time-ordered chunks,
+either straight into the database (through the bulk importer) or to a
+Parquet file.
+
+Usage:
+    python synthetic.py --events 1000000 --days 90
+    python synthetic.py --events 100000000 --parquet /data/events.parquet
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+PAGES = np.array(['/home', '/products', '/pricing', '/features', '/blog', '/about',
+                  '/contact', '/dashboard', '/profile', '/signup', '/cart', '/checkout'])
+ACTIONS = np.array(['page_view', 'click', 'scroll', 'hover', 'search', 'submit',
+                    'download', 'signup', 'add_to_cart', 'checkout'])
+DEVICES = np.array(['desktop', 'mobile', 'tablet'])
+DEVICE_WEIGHTS = np.array([0.52, 0.41, 0.07])
+REFERRERS = np.array(['direct', 'google', 'facebook', 'twitter', 'linkedin', 'reddit'])
+REFERRER_WEIGHTS = np.array([0.34, 0.38, 0.12, 0.06, 0.06, 0.04])
+
+# Relative traffic by hour of day (UTC) and by weekday (Monday first)
+HOURLY = np.array([0.25, 0.18, 0.13, 0.11, 0.12, 0.2, 0.4, 0.7, 1.0, 1.15, 1.2, 1.2,
+                   1.15, 1.2, 1.25, 1.2, 1.15, 1.1, 1.05, 1.05, 1.0, 0.85, 0.6, 0.4])
+WEEKDAY = np.array([1.05, 1.1, 1.1, 1.05, 1.0, 0.75, 0.7])
+
+MEAN_SESSION_EVENTS = 6
+MEAN_GAP_SECONDS = 40
+MAX_GAP_SECONDS = 20 * 60
+
+
+def zipf_weights(n, exponent=1.1):
+    """Normalized Zipf weights for ranks 1..n."""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _page_transitions():
+    """Row-stochastic page transition matrix favouring the purchase funnel."""
+    popularity = zipf_weights(len(PAGES), 0.8)
+    matrix = np.tile(popularity, (len(PAGES), 1))
+    index = {page: i for i, page in enumerate(PAGES)}
+    for source, target, boost in [('/home', '/products', 1.5), ('/products', '/products', 0.6),
+                                  ('/products', '/cart', 0.5), ('/pricing', '/signup', 0.4),
+                                  ('/cart', '/checkout', 1.2), ('/checkout', '/home', 0.8)]:
+        matrix[index[source], index[target]] += boost
+    return matrix / matrix.sum(axis=1, keepdims=True)
+
+
+def _page_actions():
+    """Row-stochastic matrix of action probabilities per page."""
+    base = np.array([0.55, 0.2, 0.12, 0.05, 0.04, 0.02, 0.02, 0.0, 0.0, 0.0])
+    matrix = np.tile(base, (len(PAGES), 1))
+    action = {a: i for i, a in enumerate(ACTIONS)}
+    for page, name, weight in [('/products', 'search', 0.15), ('/products', 'add_to_cart', 0.12),
+                               ('/blog', 'download', 0.08), ('/contact', 'submit', 0.2),
+                               ('/signup', 'signup', 0.35), ('/cart', 'add_to_cart', 0.2),
+                               ('/checkout', 'checkout', 0.45)]:
+        matrix[np.flatnonzero(PAGES == page)[0], action[name]] += weight
+    return matrix / matrix.sum(axis=1, keepdims=True)
+
+
+def _sample_rows(rng, cumulative, rows):
+    """Draw one column index per row of a cumulative probability matrix."""
+    u = rng.random(len(rows))
+    picks = (cumulative[rows] < u[:, None]).sum(axis=1)
+    return np.minimum(picks, cumulative.shape[1] - 1)
+
+
+class SyntheticEvents:
+    """
+    Reproducible generator of realistic interaction events.
+
+    Args:
+        events: Total number of events to generate
+        users: Number of distinct users (default: events / 50)
+        days: Length of the simulated period in days
+        end: End of the period (default: now)
+        seed: Seed for numpy's random generator
+        chunk_size: Approximate number of events per yielded chunk
+    """
+
+    def __init__(self, events, users=None, days=30, end=None, seed=0, chunk_size=1000000):
+        self.events = int(events)
+        self.users = int(users or max(self.events // 50, 1))
+        self.days = days
+        self.end = end or datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        self.start = self.end - timedelta(days=days)
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+        self._user_cdf = np.cumsum(zipf_weights(self.users, 1.05))
+        self._entry_cdf = np.cumsum(zipf_weights(len(PAGES), 1.2))
+        self._page_cdf = np.cumsum(_page_transitions(), axis=1)
+        self._action_cdf = np.cumsum(_page_actions(), axis=1)
+        self._pages, self._actions = pa.array(PAGES), pa.array(ACTIONS)
+        self._devices, self._referrers = pa.array(DEVICES), pa.array(REFERRERS)
+
+        # Hourly traffic weights across the whole period
+        hours = pd.date_range(self.start, self.end, freq='h', inclusive='left')
+        self._hour_weights = HOURLY[hours.hour] * WEEKDAY[hours.dayofweek]
+
+    def chunks(self):
+        """
+        Yield time-ordered DataFrames with user_id, action, page, timestamp
+        (datetime64) and metadata (JSON text) columns.
+        """
+        for table in self._tables():
+            yield table.to_pandas()
+
+    def _tables(self):
+        """Yield the chunks as Arrow tables."""
+        rng = np.random.default_rng(self.seed)
+        n_chunks = max(int(np.ceil(self.events / self.chunk_size)), 1)
+        # Split the hour bins so every chunk covers an equal share of traffic
+        mass = np.cumsum(self._hour_weights) / self._hour_weights.sum()
+        owner = np.minimum((mass - self._hour_weights / self._hour_weights.sum() / 2) * n_chunks, n_chunks - 1).astype(int)
+
+        remaining = self.events
+        carry = None
+        for i in range(n_chunks):
+            target = remaining // (n_chunks - i)
+            if target == 0:
+                continue
+            bins = np.flatnonzero(owner == i)
+            if len(bins) == 0:
+                bins = np.array([min(i * len(mass) // n_chunks, len(mass) - 1)])
+            table = self._chunk(rng, target, bins)
+            remaining -= table.num_rows
+
+            # Sessions running past the chunk's last hour move to the next chunk
+            if carry is not None:
+                table = pa.concat_tables([carry, table])
+                table = table.take(pc.sort_indices(table, [('timestamp', 'ascending')]))
+            if remaining:
+                boundary = pa.scalar(self.start + timedelta(hours=int(bins.max()) + 1), pa.timestamp('us'))
+                early = pc.less(table['timestamp'], boundary)
+                carry = table.filter(pc.invert(early))
+                table = table.filter(early)
+            yield table
+
+    def _chunk(self, rng, n_events, bins):
+        # Session lengths: geometric, topped up until the chunk has enough events
+        lengths = rng.geometric(1 / MEAN_SESSION_EVENTS, int(n_events / MEAN_SESSION_EVENTS * 1.1) + 1)
+        total = np.cumsum(lengths)
+        n_sessions = int(np.searchsorted(total, n_events)) + 1
+        while n_sessions > len(lengths):
+            lengths = np.r_[lengths, rng.geometric(1 / MEAN_SESSION_EVENTS, len(lengths))]
+            total = np.cumsum(lengths)
+            n_sessions = int(np.searchsorted(total, n_events)) + 1
+        lengths = lengths[:n_sessions]
+        lengths[-1] -= total[n_sessions - 1] - n_events
+
+        # Per-session attributes
+        weights = self._hour_weights[bins]
+        hour = bins[np.searchsorted(np.cumsum(weights) / weights.sum(), rng.random(n_sessions))]
+        start = np.datetime64(self.start, 's') + (hour * 3600 + rng.integers(0, 3600, n_sessions)).astype('timedelta64[s]')
+        user = np.minimum(np.searchsorted(self._user_cdf, rng.random(n_sessions)), self.users - 1)
+        device = np.searchsorted(np.cumsum(DEVICE_WEIGHTS), rng.random(n_sessions))
+        referrer = np.searchsorted(np.cumsum(REFERRER_WEIGHTS), rng.random(n_sessions))
+
+        # Events: session index, position within session and in-session offset
+        session = np.repeat(np.arange(n_sessions), lengths)
+        first = np.r_[0, np.cumsum(lengths)[:-1]]
+        position = np.arange(n_events) - first[session]
+        gaps = np.minimum(rng.exponential(MEAN_GAP_SECONDS, n_events), MAX_GAP_SECONDS).astype('int64') + 1
+        gaps[first] = 0
+        offset = np.cumsum(gaps) - np.repeat(np.cumsum(gaps)[first], lengths)
+        duration = np.repeat(offset[first + lengths - 1], lengths)
+
+        # Pages follow the Markov chain one step at a time across all sessions
+        page = np.empty(n_events, dtype='int64')
+        page[first] = np.minimum(np.searchsorted(self._entry_cdf, rng.random(n_sessions)), len(PAGES) - 1)
+        for step in range(1, int(lengths.max())):
+            at = first[lengths > step] + step
+            page[at] = _sample_rows(rng, self._page_cdf, page[at - 1])
+        action = _sample_rows(rng, self._action_cdf, page)
+
+        timestamp = start[session] + offset.astype('timedelta64[s]')
+        order = np.argsort(timestamp, kind='stable')
+        scroll = rng.integers(10, 101, n_events)
+        clicks = rng.poisson(3, n_events) + (position > 0)
+
+        # Strings are assembled with Arrow kernels rather than per-row Python
+        session = session[order]
+        text = lambda values: pc.cast(pa.array(values), pa.string())
+        metadata = pc.binary_join_element_wise(
+            '{"session_duration": ', text(duration[order]),
+            ', "device": "', self._devices.take(device[session]),
+            '", "referrer": "', self._referrers.take(referrer[session]),
+            '", "scroll_depth": ', text(scroll),
+            ', "clicks": ', text(clicks[order]), '}', ''
+        )
+        return pa.table({
+            'user_id': pc.binary_join_element_wise('user_', text(user[session]), ''),
+            'action': self._actions.take(action[order]),
+            'page': self._pages.take(page[order]),
+            'timestamp': pa.array(timestamp[order].astype('datetime64[us]')),
+            'metadata': metadata,
+        })
+
+    def to_database(self, progress=None):
+        """
+        Bulk insert every chunk into ``user_interactions``.
+
+        Returns:
+            Number of events written
+        """
+        from database import db
+        from importer import prepare_chunk, write_chunk
+
+        written = 0
+        for df in self.chunks():
+            chunk, _ = prepare_chunk(df)
+            with db.engine.begin() as conn:
+                write_chunk(conn, chunk)
+            written += len(chunk)
+            if progress:
+                progress(written)
+        return written
+
+    def to_parquet(self, path, progress=None):
+        """
+        Write every chunk to a single zstd-compressed Parquet file.
+
+        Returns:
+            Number of events written
+        """
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([('user_id', pa.string()), ('action', pa.string()), ('page', pa.string()),
+                            ('timestamp', pa.timestamp('us')), ('metadata', pa.string())])
+        written = 0
+        with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+            for table in self._tables():
+                writer.write_table(table.select(schema.names).cast(schema))
+                written += table.num_rows
+                if progress:
+                    progress(written)
+        return written
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate synthetic interactions')
+    parser.add_argument('--events', type=int, default=1000000)
+    parser.add_argument('--users', type=int, help='Distinct users (default: events / 50)')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=1000000)
+    parser.add_argument('--parquet', help='Write to this Parquet file instead of the database')
+    args = parser.parse_args()
+
+    generator = SyntheticEvents(args.events, args.users, args.days, seed=args.seed, chunk_size=args.chunk_size)
+    started = time.perf_counter()
+
+    def report(written):
+        print(f"  {written:,} events ({written / (time.perf_counter() - started):,.0f}/s)")
+
+    if args.parquet:
+        written = generator.to_parquet(args.parquet, report)
+        print(f"Wrote {written:,} events to {args.parquet} ({os.path.getsize(args.parquet) / 1e6:.1f} MB)")
+    else:
+        from flask_app import app
+        from database import create_schema
+        with app.app_context():
+            create_schema()
+            written = generator.to_database(report)
+        print(f"Inserted {written:,} events")
+    print(f"Done in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,217 @@
+"""
+Pipeline telemetry kept in rolling windows and published to the database.
+
+Every pipeline process times its stages (fetch, analyze, persist) and
+records rows, patterns and end-to-end lag (now minus the timestamp of the
+newest event it processed) per cycle. The last ``PIPELINE_TELEMETRY_WINDOW``
+seconds of samples are summarized and written to the ``pipeline_status``
+table (one row per process, at most every ``PIPELINE_STATUS_INTERVAL``
+seconds) so the API and the Streamlit dashboard can show live pipeline
+health without talking to the pipeline process.
+"""
+
+import math
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from database import db, dialect_insert, PipelineStatus
+import metrics
+
+WINDOW_SECONDS = int(os.getenv('PIPELINE_TELEMETRY_WINDOW', 900))
+PUBLISH_SECONDS = float(os.getenv('PIPELINE_STATUS_INTERVAL', 5))
+STAGES = ('fetch', 'analyze', 'persist')
+
+
+class RollingWindow:
+    """Samples from the last ``seconds`` seconds (at most ``maxlen``)."""
+
+    def __init__(self, seconds=WINDOW_SECONDS, maxlen=5000):
+        self.seconds = seconds
+        self.samples = deque(maxlen=maxlen)
+
+    def add(self, value, at=None):
+        self.samples.append((time.monotonic() if at is None else at, value))
+
+    def values(self, now=None):
+        cutoff = (time.monotonic() if now is None else now) - self.seconds
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        return [value for _, value in self.samples]
+
+    def summary(self, now=None):
+        """Count, last, mean, p50, p95 and max of the window (None values when empty)."""
+        values = self.values(now)
+        if not values:
+            return {'count': 0, 'last': None, 'mean': None, 'p50': None, 'p95': None, 'max': None}
+        ordered = sorted(values)
+
+        def percentile(q):
+            return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+        return {
+            'count': len(values),
+            'last': values[-1],
+            'mean': sum(values) / len(values),
+            'p50': percentile(0.5),
+            'p95': percentile(0.95),
+            'max': ordered[-1],
+        }
+
+
+class PipelineTelemetry:
+    """
+    Rolling-window telemetry for one pipeline process.
+
+    Args:
+        worker_id: Key of this process in ``pipeline_status``
+        window_seconds: Length of the rolling windows
+        publish_seconds: Minimum time between status writes
+    """
+
+    def __init__(self, worker_id, window_seconds=WINDOW_SECONDS, publish_seconds=PUBLISH_SECONDS):
+        self.worker_id = worker_id
+        self.window_seconds = window_seconds
+        self.publish_seconds = publish_seconds
+        self.started_at = datetime.utcnow()
+        self.stages = {stage: RollingWindow(window_seconds) for stage in STAGES}
+        self.cycles = RollingWindow(window_seconds)
+        self.rows = RollingWindow(window_seconds)
+        self.rows_per_second = RollingWindow(window_seconds)
+        self.patterns = RollingWindow(window_seconds)
+        self.lag = RollingWindow(window_seconds)
+        self.backlog = None
+        self.last_cycle_at = self.last_success_at = self.last_error = None
+        self._cycle_stages = {}
+        self._published = None
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage of the current cycle."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._cycle_stages[name] = self._cycle_stages.get(name, 0.0) + elapsed
+            metrics.PIPELINE_STAGE_LATENCY.observe(elapsed, name)
+
+    def record_cycle(self, seconds, rows=0, patterns=0, newest_event=None, backlog=None, error=None):
+        """
+        Record a finished cycle.
+
+        Args:
+            seconds: Wall time of the cycle
+            rows: Events processed
+            patterns: Patterns detected
+            newest_event: Timestamp of the newest event processed, if any
+            backlog: Optional ``scheduling.measure_backlog`` result
+            error: Exception that failed the cycle, if any
+        """
+        for stage, elapsed in self._cycle_stages.items():
+            self.stages[stage].add(elapsed)
+        self._cycle_stages = {}
+        self.last_cycle_at = datetime.utcnow()
+        self.cycles.add(0 if error else 1)
+        if backlog is not None:
+            self.backlog = backlog
+        if error:
+            self.last_error = {'at': self.last_cycle_at.isoformat(), 'message': str(error)}
+            return
+        self.last_success_at = self.last_cycle_at
+        if rows:
+            self.rows.add(rows)
+            self.rows_per_second.add(rows / seconds if seconds else 0.0)
+        if patterns:
+            self.patterns.add(patterns)
+        if newest_event is not None:
+            lag = max((self.last_cycle_at - newest_event).total_seconds(), 0.0)
+            self.lag.add(lag)
+            metrics.PIPELINE_E2E_LAG.set(lag)
+
+    def success_rate(self):
+        """Share of successful cycles in the window (None before the first cycle)."""
+        outcomes = self.cycles.values()
+        return sum(outcomes) / len(outcomes) if outcomes else None
+
+    def snapshot(self):
+        """Window summaries as a JSON-serializable dictionary."""
+        outcomes = self.cycles.values()
+        return {
+            'window_seconds': self.window_seconds,
+            'cycles': {'ok': sum(outcomes), 'failed': len(outcomes) - sum(outcomes),
+                       'success_rate': self.success_rate()},
+            'stages': {stage: window.summary() for stage, window in self.stages.items()},
+            'rows_per_cycle': self.rows.summary(),
+            'rows_per_second': self.rows_per_second.summary(),
+            'patterns_per_cycle': self.patterns.summary(),
+            'lag_seconds': self.lag.summary(),
+            'backlog_rows': self.backlog['rows'] if self.backlog else None,
+            'backlog_lag_seconds': self.backlog['lag_seconds'] if self.backlog else None,
+            'last_cycle_at': self.last_cycle_at.isoformat() if self.last_cycle_at else None,
+            'last_success_at': self.last_success_at.isoformat() if self.last_success_at else None,
+            'last_error': self.last_error,
+        }
+
+    def publish(self, state='running', force=False):
+        """Write the snapshot to ``pipeline_status``; returns False when throttled."""
+        now = time.monotonic()
+        if not force and self._published is not None and now - self._published < self.publish_seconds:
+            return False
+        values = {'state': state, 'started_at': self.started_at, 'updated_at': datetime.utcnow(),
+                  'details': self.snapshot()}
+        stmt = dialect_insert(PipelineStatus).values(worker_id=self.worker_id, **values)
+        db.session.execute(stmt.on_conflict_do_update(index_elements=[PipelineStatus.worker_id], set_=values))
+        db.session.commit()
+        self._published = now
+        return True
+
+
+def pipeline_status(stale_after=None, now=None):
+    """
+    Latest status of every pipeline process, most recently updated first.
+
+    Args:
+        stale_after: Seconds without an update after which a running process
+            is reported as ``stale`` (default: three status intervals or
+            three idle waits, whichever is longer)
+
+    Returns:
+        List of dictionaries as published by ``PipelineTelemetry``, each with
+        a ``stale`` flag
+    """
+    if stale_after is None:
+        stale_after = 3 * max(PUBLISH_SECONDS, float(os.getenv('DATA_PIPELINE_INTERVAL', 60)))
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=stale_after)
+    rows = db.session.scalars(select(PipelineStatus).order_by(PipelineStatus.updated_at.desc())).all()
+    return [dict(row.to_dict(), stale=row.state == 'running' and row.updated_at < cutoff) for row in rows]
+
+
+def summarize(status):
+    """
+    Combine per-process statuses into one view of the pipeline.
+
+    Args:
+        status: Output of ``pipeline_status``
+
+    Returns:
+        Dictionary with active and total processes, cycle success rate,
+        summed throughput, worst end-to-end lag and largest backlog over
+        the processes that are running and not stale
+    """
+    active = [w for w in status if w['state'] == 'running' and not w['stale']]
+    ok = sum(w['cycles']['ok'] for w in active)
+    failed = sum(w['cycles']['failed'] for w in active)
+    lags = [w['lag_seconds']['last'] for w in active if w['lag_seconds']['last'] is not None]
+    backlogs = [w['backlog_rows'] for w in active if w['backlog_rows'] is not None]
+    return {
+        'active': len(active),
+        'processes': len(status),
+        'success_rate': ok / (ok + failed) if ok + failed else None,
+        'rows_per_second': sum(w['rows_per_second']['mean'] or 0.0 for w in active),
+        'lag_seconds': max(lags) if lags else None,
+        'backlog_rows': max(backlogs) if backlogs else None,
+        'last_cycle_at': max((w['last_cycle_at'] for w in active if w['last_cycle_at']), default=None),
+    }
@@ -0,0 +1,19 @@
+"""
+Shared pytest fixtures: a throwaway Flask app bound to a temporary SQLite file.
+"""
+import pytest
+from flask import Flask
+from database import db, create_schema
+
+
+@pytest.fixture
+def app(tmp_path):
+    test_app = Flask(__name__)
+    test_app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    test_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(test_app)
+    with test_app.app_context():
+        create_schema()
+        yield test_app
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,33 @@
+"""
+Tests for the Parquet cold tier.
+"""
+from datetime import datetime
+import pytest
+from database import db, UserInteraction
+from archive import ColdArchive
+from queries import interactions_frame
+import queries
+
+pytest.importorskip('pyarrow')
+
+
+def test_archive_moves_closed_days_and_reads_back(app, tmp_path, monkeypatch):
+    archive = ColdArchive(str(tmp_path / 'cold'))
+    monkeypatch.setattr(queries, 'cold_archive', archive)
+    for day, user in [(1, 'a'), (1, 'b'), (2, 'c'), (9, 'd')]:
+        db.session.add(UserInteraction(user_id=user, action='click', page='/home',
+                                       meta_data={'device': 'mobile'}, timestamp=datetime(2024, 1, day, 12)))
+    db.session.commit()
+
+    stats = archive.archive(older_than_days=5, now=datetime(2024, 1, 10))
+    assert (stats['rows'], stats['days']) == (3, 2)
+    assert UserInteraction.query.count() == 1
+    assert [f[1].day for f in archive.files()] == [1, 2]
+
+    # Reads merge both tiers and prune files outside the window
+    df = interactions_frame(with_metadata=True)
+    assert list(df['user_id']) == ['a', 'b', 'c', 'd']
+    assert df['metadata'][0] == {'device': 'mobile'}
+    assert list(interactions_frame(start=datetime(2024, 1, 2))['user_id']) == ['c', 'd']
+    assert len(archive.files(start=datetime(2024, 1, 2))) == 1
+    assert list(interactions_frame(latest=2)['user_id']) == ['c', 'd']
@@ -0,0 +1,86 @@
+"""
+Result parity between the pandas and DuckDB analytics backends.
+"""
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from database import db, UserInteraction
+from analytics import PatternRecognizer
+from archive import ColdArchive
+from backends import DuckDBBackend
+import backends
+import queries
+
+pytest.importorskip('duckdb')
+
+
+@pytest.fixture
+def interactions(app):
+    rng = np.random.default_rng(7)
+    now = datetime.utcnow()
+    actions = ['page_view', 'click', 'add_to_cart', 'checkout', 'search']
+    pages = ['/home', '/products', '/cart', '/checkout', '/blog', '/pricing']
+    rows = []
+    for i in range(3000):
+        rows.append(UserInteraction(
+            user_id=f'user_{int(rng.zipf(1.5)) % 40:02d}',
+            action=actions[int(rng.integers(0, len(actions)))],
+            page=pages[int(rng.integers(0, len(pages)))],
+            meta_data={},
+            timestamp=now - timedelta(minutes=int(rng.integers(0, 60 * 24 * 45)))
+        ))
+    db.session.bulk_save_objects(rows)
+    db.session.commit()
+
+
+@pytest.mark.parametrize('timeframe', ['7d', '30d', '90d'])
+def test_trends_parity(interactions, timeframe):
+    recognizer = PatternRecognizer()
+    expected = recognizer.get_trends(timeframe, backend='pandas')
+    assert recognizer.get_trends(timeframe, backend='duckdb') == expected
+    bounded = recognizer.get_trends(timeframe, backend='pandas', until_id=1500)
+    assert bounded['total_interactions'] < expected['total_interactions']
+    assert recognizer.get_trends(timeframe, backend='duckdb', until_id=1500) == bounded
+
+
+@pytest.mark.parametrize('user_id', [None, 'user_01'])
+def test_patterns_parity(interactions, user_id):
+    recognizer = PatternRecognizer()
+    expected = recognizer.analyze_patterns(user_id, backend='pandas')
+    assert any(p['type'] == 'common_sequence' for p in expected)
+    assert recognizer.analyze_patterns(user_id, backend='duckdb') == expected
+
+
+def test_unknown_backend_rejected():
+    with pytest.raises(ValueError):
+        PatternRecognizer(backend='spark')
+
+
+def test_trends_through_the_attached_database(interactions):
+    import duckdb
+    with duckdb.connect() as conn:
+        if not DuckDBBackend()._attach(conn, db.engine):
+            pytest.skip('DuckDB sqlite_scanner extension unavailable (it is downloaded on first use)')
+    recognizer = PatternRecognizer()
+    for timeframe in ('7d', '90d'):
+        assert recognizer.get_trends(timeframe, backend='duckdb') == recognizer.get_trends(timeframe, backend='pandas')
+    assert recognizer.analyze_patterns(backend='duckdb') == recognizer.analyze_patterns(backend='pandas')
+
+
+def test_fallback_trends_group_in_the_database(interactions, tmp_path, monkeypatch):
+    archive = ColdArchive(str(tmp_path / 'cold'))
+    monkeypatch.setattr(queries, 'cold_archive', archive)
+    monkeypatch.setattr(backends, 'cold_archive', archive)
+    assert archive.archive(older_than_days=20)['rows'] > 0
+    recognizer = PatternRecognizer()
+    expected = {t: recognizer.get_trends(t, backend='pandas') for t in ('7d', '30d', '90d')}
+
+    # Without the scanner, no raw rows are loaded into DuckDB for trends
+    monkeypatch.setattr(DuckDBBackend, '_attach', lambda self, conn, engine: False)
+
+    def no_rows(*args, **kwargs):
+        raise AssertionError('trends loaded raw interactions')
+
+    monkeypatch.setattr(queries, 'interactions_frame', no_rows)
+    for timeframe, trends in expected.items():
+        assert recognizer.get_trends(timeframe, backend='duckdb') == trends
@@ -0,0 +1,27 @@
+"""
+Tests for the benchmark suite's baseline comparison.
+"""
+from benchmarks.suite import compare
+
+
+def _result(seconds, rss=100.0, queries=2):
+    return {'seconds': seconds, 'peak_rss_mb': rss, 'queries': queries}
+
+
+def test_compare_flags_slowdowns_memory_and_extra_queries():
+    baseline = {'scales': {'10000': {
+        'build': _result(1.0), 'trends_7d': _result(0.5), 'segment_users': _result(0.01),
+        'patterns_all': _result(0.2), 'track': _result(2.0),
+    }}}
+    results = {'scales': {'10000': {
+        'build': _result(9.0),                    # build time is never compared
+        'trends_7d': _result(0.8),                # 60% slower
+        'segment_users': _result(0.03),           # 3x slower but under the noise floor
+        'patterns_all': _result(0.2, rss=200.0),  # memory doubled
+        'track': _result(2.0, queries=3),         # extra query per request
+        'new_case': _result(1.0),                 # not in the baseline
+    }}}
+    regressions = compare(results, baseline, tolerance=0.25)
+    assert len(regressions) == 3
+    assert regressions[0].startswith('10000 trends_7d')
+    assert 'peak RSS' in regressions[1] and 'queries' in regressions[2]
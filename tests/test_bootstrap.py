@@ -0,0 +1,52 @@
+"""
+Tests for explicit database setup and side-effect-free imports.
+"""
+import os
+import sqlite3
+import subprocess
+import sys
+from database import UserInteraction
+from bootstrap import initialize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_initialize_seeds_an_empty_database_once(app):
+    assert initialize(app, seed=False) == {'patterns_removed': 0, 'seeded': 0}
+    assert UserInteraction.query.count() == 0
+    seeded = initialize(app, seed=True)['seeded']
+    assert seeded > 0 and UserInteraction.query.count() == seeded
+    assert initialize(app, seed=True)['seeded'] == 0
+
+
+def test_importing_the_api_has_no_side_effects(tmp_path):
+    database = tmp_path / 'untouched.db'
+    code = ("import sys, flask_app; "
+            "print(sorted(m for m in ('sklearn', 'scipy', 'plotly') if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], cwd=tmp_path, capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=ROOT, DATABASE_URL=f'sqlite:///{database}'))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == '[]'
+    assert not database.exists()
+
+
+def test_concurrent_initialization_seeds_once(tmp_path):
+    database = tmp_path / 'shared.db'
+    code = ("from flask_app import app; import bootstrap; "
+            "print(bootstrap.initialize(app, seed=True)['seeded'])")
+    env = dict(os.environ, PYTHONPATH=ROOT, DATABASE_URL=f'sqlite:///{database}')
+    processes = [subprocess.Popen([sys.executable, '-c', code], cwd=tmp_path, env=env,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                 for _ in range(3)]
+    outputs = [process.communicate() for process in processes]
+    assert all(process.returncode == 0 for process in processes), outputs
+    seeded = sorted(int(out.strip().splitlines()[-1]) for out, _ in outputs)
+    assert seeded[:2] == [0, 0] and seeded[2] > 0
+
+    with sqlite3.connect(database) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM user_interactions').fetchone()[0] == seeded[2]
+
+
+def test_preload_modules_skips_missing():
+    from wsgi import preload_modules
+    assert preload_modules(['json', 'no_such_module_here']) == ['json']
@@ -0,0 +1,51 @@
+"""
+Tests for the cohort retention engine.
+"""
+from datetime import datetime, timedelta
+from database import db, UserInteraction, UserFirstSeen
+from cohorts import CohortAnalyzer
+
+NOW = datetime(2024, 1, 10, 12, 0)
+
+
+def _track(user_id, days_ago):
+    db.session.add(UserInteraction(user_id=user_id, action='click', page='/home',
+                                   meta_data={}, timestamp=NOW - timedelta(days=days_ago)))
+    db.session.commit()
+
+
+def test_daily_retention_and_closed_period_cache(app):
+    analyzer = CohortAnalyzer()
+    _track('a', 2)
+    _track('b', 2)
+    _track('a', 1)
+    _track('c', 1)
+
+    retention = analyzer.retention(period='day', periods=3, now=NOW)
+    cohorts = {c['cohort']: c for c in retention['cohorts']}
+    assert cohorts['2024-01-08']['size'] == 2
+    assert cohorts['2024-01-08']['active_users'] == [2, 1, 0]
+    assert cohorts['2024-01-08']['retention'][1] == 0.5
+    assert cohorts['2024-01-09']['active_users'] == [1, 0]
+
+    # Only the open day is rescanned; closed cells come from the cache
+    _track('b', 0)
+    retention = analyzer.retention(period='day', periods=3, now=NOW)
+    cohorts = {c['cohort']: c for c in retention['cohorts']}
+    assert cohorts['2024-01-08']['active_users'] == [2, 1, 1]
+    assert UserFirstSeen.query.count() == 3
+
+
+def test_first_seen_counts_rows_rolled_out_before_a_refresh(app):
+    from partitions import partition_manager
+    analyzer = CohortAnalyzer()
+    _track('a', 40)
+    analyzer.refresh_first_seen()
+    db.session.commit()
+    _track('b', 35)
+    _track('c', 0)
+    # Storage maintenance moves b's event into a closed partition first
+    assert partition_manager.roll(now=NOW) == 2
+    assert analyzer.refresh_first_seen() == 2
+    db.session.commit()
+    assert {row.user_id for row in UserFirstSeen.query} == {'a', 'b', 'c'}
@@ -0,0 +1,56 @@
+"""
+Tests for the compact metadata encoding.
+"""
+from datetime import datetime
+import pytest
+from sqlalchemy import text
+from database import db
+import compact_metadata
+from compact_metadata import CompactMetadata, LazyMetadata, decode, encode, migrate
+
+pytest.importorskip('msgpack')
+
+
+def test_round_trip_and_lazy_decoding():
+    meta = {'device': 'mobile', 'clicks': 3, 'tags': ['a', 'b']}
+    raw = encode(meta)
+    assert raw[:1] == compact_metadata.MSGPACK
+    assert decode(raw) == meta
+    assert decode('{"device": "tablet"}') == {'device': 'tablet'}
+
+    lazy = CompactMetadata().process_result_value(raw, None)
+    assert isinstance(lazy, LazyMetadata) and lazy._value is None
+    assert lazy['device'] == 'mobile' and dict(lazy) == meta
+    # Unchanged values are written back without re-encoding
+    assert CompactMetadata().process_bind_param(lazy, None) is raw
+
+
+def test_zstd_dictionary(tmp_path, monkeypatch):
+    zstandard = pytest.importorskip('zstandard')
+    import msgpack
+    samples = [msgpack.packb({'device': d, 'referrer': r, 'n': i})
+               for i, (d, r) in enumerate([('mobile', 'google'), ('desktop', 'direct')] * 500)]
+    path = tmp_path / 'meta.dict'
+    path.write_bytes(zstandard.train_dictionary(1024, samples).as_bytes())
+    monkeypatch.setattr(compact_metadata, 'ZSTD_DICT_PATH', str(path))
+    monkeypatch.setattr(compact_metadata, '_local', type(compact_metadata._local)())
+
+    raw = encode({'device': 'mobile', 'referrer': 'google', 'n': 7})
+    assert raw[:1] == compact_metadata.ZSTD_MSGPACK
+    assert decode(raw) == {'device': 'mobile', 'referrer': 'google', 'n': 7}
+
+
+def test_migrate_reencodes_json_rows(app):
+    # Legacy rows hold JSON text
+    for i in range(3):
+        db.session.execute(text(
+            "INSERT INTO user_interactions (user_id, action, page, metadata, timestamp) "
+            "VALUES (:user, 'click', '/home', :meta, :ts)"
+        ), {'user': f'u{i}', 'meta': f'{{"i": {i}}}', 'ts': datetime(2024, 1, 1)})
+    db.session.commit()
+
+    assert migrate(batch_size=2) == 3
+    rows = db.session.execute(text('SELECT metadata FROM user_interactions ORDER BY id')).scalars().all()
+    assert [decode(r) for r in rows] == [{'i': 0}, {'i': 1}, {'i': 2}]
+    # Already encoded rows are skipped on a re-run
+    assert migrate() == 0
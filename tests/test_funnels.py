@@ -0,0 +1,32 @@
+"""
+Tests for the vectorized funnel engine.
+"""
+from datetime import datetime, timedelta
+import pandas as pd
+from funnels import compute_funnel, parse_window
+
+BASE = datetime(2024, 1, 1, 9, 0)
+STEPS = ['page_view', 'add_to_cart', 'checkout']
+
+
+def _events(rows):
+    df = pd.DataFrame(rows, columns=['user_id', 'action', 'minutes', 'device'])
+    df['timestamp'] = [BASE + timedelta(minutes=m) for m in df['minutes']]
+    return df.sort_values(['user_id', 'timestamp'], kind='stable').reset_index(drop=True)
+
+
+def test_funnel_respects_order_and_window():
+    events = _events([
+        ('a', 'page_view', 0, 'desktop'), ('a', 'add_to_cart', 5, 'desktop'), ('a', 'checkout', 9, 'desktop'),
+        # Checkout happens before add_to_cart, so b stops at step 2
+        ('b', 'page_view', 0, 'mobile'), ('b', 'checkout', 1, 'mobile'), ('b', 'add_to_cart', 2, 'mobile'),
+        # Converts outside the one-hour window
+        ('c', 'page_view', 0, 'mobile'), ('c', 'add_to_cart', 90, 'mobile'),
+        ('d', 'add_to_cart', 0, 'desktop'),
+    ])
+    result = compute_funnel(events, STEPS, parse_window('1h'), breakdown='device')
+
+    assert [s['users'] for s in result['steps']] == [3, 2, 1]
+    assert result['steps'][2]['step_conversion'] == 0.5
+    assert [s['users'] for s in result['breakdown']['desktop']] == [1, 1, 1]
+    assert [s['users'] for s in result['breakdown']['mobile']] == [2, 1, 0]
@@ -0,0 +1,79 @@
+"""
+Tests for the bulk interaction importer.
+"""
+import json
+import pytest
+from database import db, UserInteraction, Checkpoint
+from importer import checkpoint_name, import_file
+from queries import interactions_frame
+
+
+def _write_csv(path, n):
+    lines = ['user_id,action,page,timestamp,metadata']
+    for i in range(n):
+        lines.append(f'''u{i},click,/home,2024-01-01T00:00:{i:02d},"{{'i': {i}}}"''')
+    lines.append('bad,click,/home,not-a-time,')
+    path.write_text('\n'.join(lines) + '\n')
+
+
+def test_import_csv_parses_timestamps_and_metadata(app, tmp_path):
+    path = tmp_path / 'events.csv'
+    _write_csv(path, 5)
+
+    stats = import_file(str(path), chunk_size=2, rebuild_indexes=True)
+    assert (stats['rows'], stats['rejected']) == (5, 1)
+    df = interactions_frame(with_metadata=True)
+    assert list(df['user_id']) == [f'u{i}' for i in range(5)]
+    assert str(df['timestamp'][3]) == '2024-01-01 00:00:03'
+    assert UserInteraction.query.filter_by(user_id='u4').one().to_dict()['metadata'] == {'i': 4}
+    assert len(UserInteraction.__table__.indexes) == 2
+
+
+def test_import_resumes_from_checkpoint(app, tmp_path):
+    path = tmp_path / 'events.ndjson'
+    path.write_text('\n'.join(json.dumps({
+        'user_id': f'u{i}', 'action': 'click', 'page': '/home',
+        'timestamp': f'2024-01-01T00:00:{i:02d}Z', 'metadata': {'i': i}
+    }) for i in range(7)) + '\n')
+
+    # A run that stopped after the first 3 rows had committed
+    import_file(str(path), chunk_size=3)
+    UserInteraction.query.filter(UserInteraction.id > 3).delete()
+    name = db.session.get(Checkpoint, checkpoint_name(str(path)))
+    name.last_id = 3
+    db.session.commit()
+
+    stats = import_file(str(path), chunk_size=3)
+    assert (stats['rows'], stats['skipped']) == (4, 3)
+    assert list(interactions_frame()['user_id']) == [f'u{i}' for i in range(7)]
+    assert import_file(str(path))['rows'] == 0
+
+
+def test_import_rejects_missing_columns(app, tmp_path):
+    path = tmp_path / 'events.csv'
+    path.write_text('user_id,action\nu1,click\n')
+    with pytest.raises(ValueError):
+        import_file(str(path))
+
+
+def test_checkpoint_names_are_unique_for_long_paths(tmp_path):
+    prefix = 'x' * 120
+    first, second = (str(tmp_path / f'{prefix}-{i}.csv') for i in (1, 2))
+    assert checkpoint_name(first) != checkpoint_name(second)
+    assert len(checkpoint_name(first)) <= 100
+
+
+def test_failed_import_restores_indexes_and_sync_setting(app, tmp_path):
+    path = tmp_path / 'events.csv'
+    _write_csv(path, 4)
+
+    def interrupt(stats):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        import_file(str(path), chunk_size=2, rebuild_indexes=True, progress=interrupt)
+    assert UserInteraction.query.count() == 2
+    names = {row[0] for row in db.session.execute(db.text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'user_interactions'"))}
+    assert {index.name for index in UserInteraction.__table__.indexes} <= names
+    assert db.session.execute(db.text('PRAGMA synchronous')).scalar() != 0
@@ -0,0 +1,105 @@
+"""
+Tests for leased pipeline work units and sharded sessionization.
+"""
+from datetime import datetime, timedelta
+import pytest
+import leasing
+from database import db, user_shard, UserInteraction, UserSession
+from sessions import Sessionizer
+
+BASE = datetime(2024, 1, 1, 9, 0)
+
+
+def test_claims_are_exclusive_and_expire(app):
+    leasing.ensure_units('sessions', 2)
+    leasing.ensure_units('sessions', 2)
+    with pytest.raises(ValueError):
+        leasing.ensure_units('sessions', 4)
+
+    first = leasing.claim('sessions', 'w1', lease_seconds=60)
+    second = leasing.claim('sessions', 'w2', lease_seconds=60)
+    assert {first.shard, second.shard} == {0, 1}
+    assert leasing.claim('sessions', 'w3') is None
+
+    # w1 crashes: once its lease expires the unit is claimed again
+    later = datetime.utcnow() + timedelta(seconds=61)
+    reclaimed = leasing.claim('sessions', 'w3', lease_seconds=60, now=later)
+    assert reclaimed.name == first.name
+
+    # w1's late progress is fenced off
+    with pytest.raises(leasing.LeaseLost):
+        leasing.advance(first, 10)
+    db.session.rollback()
+    assert not leasing.renew(first)
+
+    leasing.advance(reclaimed, 10)
+    db.session.commit()
+    leasing.release(reclaimed, delay=3600)
+    leasing.release(first)
+    unit = next(u for u in leasing.units('sessions') if u['name'] == first.name)
+    assert unit['last_id'] == 10 and unit['owner'] is None
+    # Released with a delay, so only w2's expired unit is claimable
+    assert leasing.claim('sessions', 'w1', now=later).name == second.name
+
+
+def test_sharded_sessionization_matches_single_pass(app):
+    users = [f'user_{i}' for i in range(12)]
+    for minute in range(0, 240, 20):
+        for i, user_id in enumerate(users):
+            db.session.add(UserInteraction(user_id=user_id, action='page_view', page=f'/p{minute % 3}',
+                                           timestamp=BASE + timedelta(minutes=minute + 45 * (i % 2) * (minute > 100))))
+    db.session.commit()
+    total = UserInteraction.query.count()
+
+    shards = 3
+    leasing.ensure_units('sessions', shards)
+    sessionizer = Sessionizer(gap=timedelta(minutes=30))
+    # Small batches so each shard is processed over several leases, in interleaved order
+    while True:
+        lease = leasing.claim('sessions', 'worker')
+        if lease is None:
+            break
+        until = min(lease.last_id + 25, total)
+        events = sessionizer.update(since=lease.last_id, until=until, shard=(lease.shard, lease.shards))
+        assert all(user_shard(u, shards) == lease.shard for u in events['user_id'])
+        leasing.advance(lease, until)
+        db.session.commit()
+        leasing.release(lease, delay=0 if until < total else 3600)
+    sharded = sorted((s.user_id, s.start_time, s.end_time, s.event_count) for s in UserSession.query.all())
+
+    UserSession.query.delete()
+    db.session.commit()
+    sessionizer.update()
+    db.session.commit()
+    single = sorted((s.user_id, s.start_time, s.end_time, s.event_count) for s in UserSession.query.all())
+    assert sharded == single
+    assert sum(s[3] for s in single) == total
+
+
+def test_worker_batches_shard_rows_across_id_gaps_and_partitions(app):
+    from partitions import partition_manager
+    from pipeline import PipelineWorker
+    for i in range(12):
+        db.session.add(UserInteraction(id=1 + i * 1000, user_id=f'user_{i}', action='page_view', page='/',
+                                       timestamp=BASE + timedelta(minutes=i)))
+    db.session.commit()
+    # Rolled out of the hot table before any worker ran
+    assert partition_manager.roll(now=datetime(2024, 3, 1)) == 12
+
+    worker = PipelineWorker(shards=2, interval=60, batch_size=2)
+    leasing.ensure_units('sessions', 2)
+    done, delays = 0, []
+    while True:
+        lease = leasing.claim('sessions', 'worker')
+        if lease is None:
+            break
+        before = lease.last_id
+        delay = worker._process_shard(lease)
+        processed = UserSession.query.count() - done
+        done += processed
+        # Every cycle either sessionizes rows or reports the shard caught up
+        assert processed or (delay == 60 and lease.last_id >= before)
+        assert processed <= 2
+        delays.append(delay)
+        leasing.release(lease, delay)
+    assert done == 12 and delays.count(60) == 2
@@ -0,0 +1,148 @@
+"""
+Tests for live trend deltas and their fan-out to subscribers.
+"""
+from datetime import datetime, timedelta
+from analytics import PatternRecognizer
+from database import db, UserInteraction
+import os
+import subprocess
+import sys
+import live
+from live import LiveTrends, RESYNC
+from live_events import apply_delta, parse_events
+
+
+def _track(user_id, action='click', page='/home', days_ago=0):
+    db.session.add(UserInteraction(user_id=user_id, action=action, page=page,
+                                   timestamp=datetime.utcnow() - timedelta(days=days_ago)))
+    db.session.commit()
+
+
+def test_poll_counts_new_events_and_users_per_timeframe(app):
+    _track('returning', days_ago=20)
+    broadcaster = LiveTrends(app)
+    broadcaster.reset()
+    assert broadcaster.poll() is None
+
+    _track('returning', action='search', page='/search')
+    _track('fresh')
+    _track('fresh', page='/pricing')
+    _track('old_import', days_ago=40)
+    delta = broadcaster.poll()
+
+    week, month, quarter = (delta['timeframes'][t] for t in ('7d', '30d', '90d'))
+    assert week['events'] == 3 and week['actions'] == {'search': 1, 'click': 2}
+    assert week['pages'] == {'/search': 1, '/home': 1, '/pricing': 1}
+    # 'returning' was last seen 20 days ago: new to the week, not to the month
+    assert (week['new_users'], month['new_users'], quarter['new_users']) == (2, 1, 2)
+    assert quarter['events'] == 4 and sum(quarter['days'].values()) == 4
+    assert delta['last_id'] == broadcaster.last_id
+    assert broadcaster.poll() is None
+
+
+def test_publish_fans_out_and_drops_slow_subscribers(app):
+    broadcaster = LiveTrends(app, interval=60, queue_size=1)
+    fast, slow = broadcaster.subscribe(), broadcaster.subscribe()
+    assert broadcaster.subscribers == 2
+
+    broadcaster.publish({'last_id': 1})
+    assert fast.get_nowait() == {'last_id': 1}
+    broadcaster.publish({'last_id': 2})
+    assert fast.get_nowait() == {'last_id': 2}
+    # The slow subscriber never read: dropped with only a resync left on its queue
+    assert slow.get_nowait() is RESYNC and slow.empty()
+    assert broadcaster.subscribers == 1
+    broadcaster.close()
+    assert broadcaster.subscribers == 0
+
+
+def test_stream_and_apply_delta(app):
+    broadcaster = LiveTrends(app, interval=60)
+    subscriber = broadcaster.subscribe()
+    part = {'events': 2, 'actions': {'buy': 2}, 'pages': {'/cart': 2}, 'days': {'2024-01-02': 2}, 'new_users': 1}
+    empty = {'events': 0, 'actions': {}, 'pages': {}, 'days': {}, 'new_users': 0}
+    subscriber.put({'last_id': 5, 'timeframes': {'7d': empty, '30d': part, '90d': part}})
+    subscriber.put({'last_id': 9, 'timeframes': {'7d': part, '30d': part, '90d': part}})
+    subscriber.put(RESYNC)
+
+    text = ''.join(broadcaster.stream(subscriber, '7d', heartbeat=0.01))
+    assert 'id: 9' in text and 'id: 5' not in text
+    events = list(parse_events(text.split('\n')))
+    assert [name for name, _ in events] == ['hello', 'delta', 'resync']
+    assert broadcaster.subscribers == 0
+
+    trends = {'total_interactions': 10, 'unique_users': 3, 'daily_activity': {'2024-01-01': 10},
+              'top_actions': {'click': 6, 'view': 4}, 'top_pages': {'/home': 10}}
+    apply_delta(trends, events[1][1], top=2)
+    assert trends == {'total_interactions': 12, 'unique_users': 4,
+                      'daily_activity': {'2024-01-01': 10, '2024-01-02': 2},
+                      'top_actions': {'click': 6, 'view': 4}, 'top_pages': {'/home': 10, '/cart': 2}}
+    broadcaster.close()
+
+
+def test_streams_leave_a_thread_for_other_requests(app, monkeypatch):
+    monkeypatch.delenv('LIVE_MAX_SUBSCRIBERS', raising=False)
+    broadcaster = live.init_app(app, interval=60)
+    assert live.reserve_threads(app, 3) == 2
+    assert broadcaster.subscribe() and broadcaster.subscribe()
+    assert broadcaster.subscribe() is None
+    assert live.reserve_threads(app, 1) == 0
+
+    monkeypatch.setenv('LIVE_MAX_SUBSCRIBERS', '5')
+    broadcaster.max_subscribers = 5
+    assert live.reserve_threads(app, 3) == 5
+    broadcaster.close()
+
+
+def test_trends_until_after_id_plus_deltas_count_each_event_once(app):
+    for user in ('a', 'b', 'c'):
+        _track(user)
+    broadcaster = LiveTrends(app, interval=60)
+    early = broadcaster.subscribe()
+    _track('b', action='buy')
+    _track('d', page='/cart')
+    delta = broadcaster.poll()
+    # Joins after the poll but before its delta is published: still receives it
+    late = broadcaster.subscribe()
+    assert late.after_id == early.after_id == 3
+    broadcaster.publish(delta)
+    assert broadcaster.subscribe().after_id == delta['last_id']
+
+    recognizer = PatternRecognizer()
+    trends = recognizer.get_trends('7d', until_id=late.after_id)
+    assert trends['total_interactions'] == 3
+    apply_delta(trends, late.get_nowait()['timeframes']['7d'])
+    assert trends == recognizer.get_trends('7d')
+    broadcaster.close()
+
+
+def test_poll_holds_rows_behind_an_uncommitted_id(app):
+    import time
+    broadcaster = LiveTrends(app, hold_gaps=True, gap_seconds=0.2)
+    broadcaster.reset()
+
+    def track(id):
+        db.session.add(UserInteraction(id=id, user_id=f'u{id}', action='click', page='/home',
+                                       timestamp=datetime.utcnow()))
+        db.session.commit()
+
+    track(1), track(2), track(4)
+    # Id 3 is still held by a transaction that has not committed
+    assert broadcaster.poll()['last_id'] == 2
+    assert broadcaster.poll() is None
+    track(3)
+    delta = broadcaster.poll()
+    assert (delta['first_id'], delta['last_id'], delta['timeframes']['7d']['events']) == (3, 4, 2)
+
+    # A gap that stays open past gap_seconds was rolled back
+    track(6)
+    assert broadcaster.poll() is None
+    time.sleep(0.25)
+    assert broadcaster.poll()['last_id'] == 6
+
+
+def test_live_events_loads_without_the_database_layer():
+    code = "import sys, live_events; print(sorted({'database', 'partitions', 'sqlalchemy'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == '[]'
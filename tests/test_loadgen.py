@@ -0,0 +1,39 @@
+"""
+Tests for the load generator's latency histogram.
+"""
+import random
+from benchmarks.loadgen import LatencyHistogram, parse_mix
+import pytest
+
+
+def test_histogram_percentiles_within_precision():
+    rng = random.Random(0)
+    values = sorted(int(rng.lognormvariate(9, 1.2)) for _ in range(20000))
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+
+    for p in (50, 95, 99, 99.9):
+        exact = values[int(len(values) * p / 100 + 0.5) - 1]
+        assert abs(histogram.percentile(p) - exact) <= exact / 64
+    assert histogram.percentile(100) == histogram.max == values[-1]
+
+    merged = LatencyHistogram()
+    merged.merge(histogram)
+    merged.merge(histogram)
+    assert merged.total == 40000 and merged.percentile(50) == histogram.percentile(50)
+    assert merged.distribution()[-1][1:3] == (100.0, 40000)
+
+
+def test_small_values_are_exact():
+    histogram = LatencyHistogram()
+    for value in range(1, 201):
+        histogram.record(value)
+    assert histogram.percentile(50) == 100
+    assert histogram.percentile(99) == 198
+
+
+def test_parse_mix():
+    assert parse_mix('track=3,trends') == [('track', 3.0), ('trends', 1.0)]
+    with pytest.raises(ValueError):
+        parse_mix('delete=1')
@@ -0,0 +1,102 @@
+"""
+Tests for the Prometheus instrumentation.
+"""
+import os
+import re
+from datetime import datetime
+import metrics
+from database import db, UserInteraction
+from analytics import PatternRecognizer
+
+
+def _sample(text, pattern):
+    match = re.search(rf'^{pattern} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def test_request_and_sql_metrics(app):
+    metrics.init_app(app)
+
+    @app.route('/items/<int:item_id>')
+    def item(item_id):
+        db.session.add(UserInteraction(user_id='u', action='click', page=f'/items/{item_id}',
+                                       timestamp=datetime(2024, 1, 1)))
+        db.session.commit()
+        return {'count': UserInteraction.query.count()}
+
+    client = app.test_client()
+    for item_id in (1, 2, 3):
+        assert client.get(f'/items/{item_id}').status_code == 200
+    client.get('/missing')
+
+    text = metrics.render()
+    route = 'route="/items/<int:item_id>"'
+    assert _sample(text, rf'http_requests_total\{{{route},method="GET",status="200"\}}') == 3
+    assert _sample(text, r'http_requests_total\{route="unmatched",method="GET",status="404"\}') >= 1
+    assert _sample(text, rf'http_request_duration_seconds_count\{{{route},method="GET"\}}') == 3
+    assert _sample(text, rf'http_request_duration_seconds_bucket\{{{route},method="GET",le="\+Inf"\}}') == 3
+    # Each request inserts and counts (plus any transaction statements)
+    assert _sample(text, rf'http_request_db_statements_sum\{{{route}\}}') >= 6
+    assert _sample(text, r'db_statements_total\{operation="INSERT"\}') >= 3
+
+
+def test_stage_timings(app):
+    for i in range(5):
+        db.session.add(UserInteraction(user_id='u', action=['a', 'b', 'c'][i % 3], page='/home',
+                                       timestamp=datetime(2024, 1, 1, 12, i)))
+    db.session.commit()
+
+    before = _sample(metrics.render(), r'analysis_stage_duration_seconds_count\{stage="sequences"\}') or 0
+    PatternRecognizer().analyze_patterns()
+    text = metrics.render()
+    assert _sample(text, r'analysis_stage_duration_seconds_count\{stage="sequences"\}') == before + 1
+    assert _sample(text, r'analysis_stage_duration_seconds_count\{stage="time_patterns"\}') >= 1
+    assert _sample(text, r'analysis_stage_duration_seconds_count\{stage="navigation"\}') >= 1
+
+
+def test_histogram_rendering():
+    histogram = metrics.Histogram('test_latency_seconds', 'Test', ('op',), buckets=(0.1, 1.0))
+    try:
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, 'x')
+        lines = histogram.render()
+        assert lines[1] == '# TYPE test_latency_seconds histogram'
+        assert lines[2:] == [
+            'test_latency_seconds_bucket{op="x",le="0.1"} 1',
+            'test_latency_seconds_bucket{op="x",le="1.0"} 2',
+            'test_latency_seconds_bucket{op="x",le="+Inf"} 3',
+            'test_latency_seconds_sum{op="x"} 5.55',
+            'test_latency_seconds_count{op="x"} 3',
+        ]
+    finally:
+        metrics._registry.remove(histogram)
+
+
+def test_multiprocess_render_merges_workers(tmp_path, monkeypatch):
+    counter = metrics.Counter('test_jobs_total', 'Test', ('kind',))
+    histogram = metrics.Histogram('test_job_seconds', 'Test', buckets=(0.1, 1.0))
+    gauge = metrics.Gauge('test_queue_depth', 'Test')
+    try:
+        monkeypatch.setattr(metrics, '_directory', None)
+        counter.inc('a', amount=2)
+        histogram.observe(0.05)
+        gauge.set(7)
+        metrics.enable_multiprocess(str(tmp_path), interval=60)
+        # Another worker wrote the same values earlier
+        (tmp_path / f'{os.getpid()}.json').rename(tmp_path / '1.json')
+        os.utime(tmp_path / '1.json', (0, 0))
+        counter.inc('b')
+        gauge.set(3)
+
+        text = metrics.render()
+        assert _sample(text, r'test_jobs_total\{kind="a"\}') == 4
+        assert _sample(text, r'test_jobs_total\{kind="b"\}') == 1
+        assert _sample(text, r'test_job_seconds_bucket\{le="0.1"\}') == 2
+        assert _sample(text, r'test_job_seconds_count') == 2
+        assert _sample(text, r'test_queue_depth') == 3
+
+        metrics.clear_directory(str(tmp_path))
+        assert not list(tmp_path.glob('*.json'))
+    finally:
+        for metric in (counter, histogram, gauge):
+            metrics._registry.remove(metric)
@@ -0,0 +1,67 @@
+"""
+Tests for SQLite interaction partitioning and partition-pruned reads.
+"""
+from datetime import datetime
+from database import db, UserInteraction
+from partitions import partition_manager as manager
+from queries import interactions_frame
+
+
+def _track(user_id, when):
+    db.session.add(UserInteraction(user_id=user_id, action='click', page='/home', meta_data={}, timestamp=when))
+    db.session.commit()
+
+
+def test_roll_route_and_drop(app):
+    _track('a', datetime(2024, 1, 15))
+    _track('b', datetime(2024, 2, 10))
+    _track('c', datetime(2024, 3, 5))
+
+    assert manager.roll(now=datetime(2024, 3, 20)) == 2
+    assert [p[0] for p in manager.partitions()] == ['user_interactions_p202401', 'user_interactions_p202402']
+    assert UserInteraction.query.count() == 1
+
+    # Windowed reads only touch overlapping partitions but still see every row
+    window = manager.tables_for(datetime(2024, 2, 1), datetime(2024, 3, 1))
+    assert [t.name for t in window] == ['user_interactions', 'user_interactions_p202402']
+    assert list(interactions_frame()['user_id']) == ['a', 'b', 'c']
+    assert list(interactions_frame(start=datetime(2024, 2, 1))['user_id']) == ['b', 'c']
+
+    assert manager.drop_before(datetime(2024, 2, 1)) == ['user_interactions_p202401']
+    assert list(interactions_frame()['user_id']) == ['b', 'c']
+
+
+def test_ids_keep_increasing_after_a_full_roll(app):
+    from sessions import Sessionizer
+    sessionizer = Sessionizer()
+    for user in ('a', 'b', 'c'):
+        _track(user, datetime(2024, 1, 15))
+    assert len(sessionizer.update()) == 3
+    db.session.commit()
+    assert sessionizer.watermark() == 3
+
+    assert manager.roll(now=datetime(2024, 3, 20)) == 3
+    assert UserInteraction.query.count() == 0
+    _track('d', datetime(2024, 3, 21))
+    assert UserInteraction.query.one().id == 4
+    assert list(sessionizer.update()['user_id']) == ['d']
+
+
+def test_rebuild_table_without_autoincrement(app):
+    _track('a', datetime(2024, 1, 15))
+    _track('b', datetime(2024, 3, 5))
+    manager.roll(now=datetime(2024, 3, 20))
+    # A table created before AUTOINCREMENT, emptied by a roll
+    with db.engine.begin() as conn:
+        conn.execute(db.text('DROP TABLE user_interactions'))
+        conn.execute(db.text('CREATE TABLE user_interactions (id INTEGER NOT NULL, user_id VARCHAR(100) NOT NULL, '
+                             'action VARCHAR(100) NOT NULL, page VARCHAR(200) NOT NULL, metadata JSON, '
+                             'timestamp DATETIME, PRIMARY KEY (id))'))
+        conn.execute(db.text("INSERT INTO user_interactions VALUES (2, 'b', 'click', '/home', '{}', '2024-03-05')"))
+
+    assert manager.ensure_increasing_ids() is True
+    assert manager.ensure_increasing_ids() is False
+    _track('c', datetime(2024, 3, 21))
+    assert [row.id for row in UserInteraction.query.order_by(UserInteraction.id)] == [2, 3]
+    assert {index['name'] for index in db.inspect(db.engine).get_indexes('user_interactions')} == {
+        index.name for index in UserInteraction.__table__.indexes}
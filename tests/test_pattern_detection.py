@@ -0,0 +1,45 @@
+"""
+Tests for trigram counting and sequential pattern mining.
+"""
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from src.models.pattern_detection import (
+    detect_common_patterns, detect_sequential_patterns, mine_sequential_patterns
+)
+
+
+def test_detect_common_patterns_counts_trigrams_per_user():
+    df = pd.DataFrame({
+        'user_id': ['a', 'b', 'a', 'a', 'a', 'b', 'b'],
+        'action': ['view', 'view', 'cart', 'buy', 'view', 'cart', 'buy'],
+    })
+    patterns = detect_common_patterns(df)
+    assert patterns[0] == {'pattern': ('view', 'cart', 'buy'), 'count': 2, 'confidence': 0.97}
+    assert {p['pattern'] for p in patterns} == {('view', 'cart', 'buy'), ('cart', 'buy', 'view')}
+
+
+def test_mine_sequential_patterns_support_and_gaps():
+    # Sequences: [0 1 2], [0 2 1], [0 3 1]
+    items = np.array([0, 1, 2, 0, 2, 1, 0, 3, 1])
+    offsets = np.array([0, 3, 6])
+    mined = dict(mine_sequential_patterns(items, offsets, min_support=2, max_length=3))
+    assert mined[(0, 1)] == 3
+    assert mined[(0, 2)] == 2
+    assert (1, 2) not in mined
+
+    # Only one sequence has 0 immediately followed by 1
+    adjacent = dict(mine_sequential_patterns(items, offsets, min_support=2, max_length=3, max_gap=1))
+    assert adjacent == {(0,): 3, (1,): 3, (2,): 2}
+
+
+def test_detect_sequential_patterns_splits_sessions():
+    base = datetime(2024, 1, 1)
+    df = pd.DataFrame({
+        'user_id': ['a'] * 4 + ['b'] * 2,
+        'action': ['view', 'cart', 'view', 'cart', 'view', 'cart'],
+        'timestamp': [base, base + timedelta(minutes=1), base + timedelta(days=1),
+                      base + timedelta(days=1, minutes=1), base, base + timedelta(minutes=2)],
+    })
+    patterns = detect_sequential_patterns(df, min_support=3, session_gap='30min')
+    assert patterns == [{'pattern': ('view', 'cart'), 'support': 3, 'support_ratio': 1.0, 'confidence': 0.97}]
@@ -0,0 +1,79 @@
+"""
+Tests for upsert-based behavior pattern storage and compaction.
+"""
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from database import db, BehaviorPattern
+from pattern_store import compact, is_compacted, store_patterns, stored_patterns
+
+T0 = datetime(2024, 1, 1, 12, 0)
+
+
+def _sequence(user_id, sequence, frequency):
+    return {'type': 'common_sequence', 'user_id': user_id, 'sequence': sequence,
+            'frequency': frequency, 'confidence': 0.97}
+
+
+def test_repeated_detections_update_in_place(app):
+    patterns = [
+        _sequence('u1', ('page_view', 'click', 'checkout'), 3),
+        _sequence('u2', ('page_view', 'click', 'checkout'), 1),
+        {'type': 'peak_activity_hour', 'value': 14, 'confidence': 0.97},
+    ]
+    assert store_patterns(patterns, T0) == 2
+    db.session.commit()
+
+    patterns[0] = dict(patterns[0], frequency=5, confidence=0.99)
+    patterns.append(_sequence('u1', ('search', 'click', 'download'), 2))
+    assert store_patterns(patterns, T0 + timedelta(minutes=1)) == 3
+    db.session.commit()
+
+    assert BehaviorPattern.query.count() == 3
+    row = BehaviorPattern.query.filter_by(user_id='u1', signature='page_view>click>checkout').one()
+    assert (row.frequency, row.confidence, row.detected_at) == (5, 0.99, T0 + timedelta(minutes=1))
+    assert row.pattern_details['sequence'] == ['page_view', 'click', 'checkout']
+
+
+def test_stored_patterns_filters(app):
+    store_patterns([_sequence('u1', ('a', 'b', 'c'), 1)], T0)
+    store_patterns([_sequence('u2', ('a', 'b', 'c'), 1),
+                    {'type': 'favorite_page', 'user_id': 'u2', 'value': '/home', 'visits': 9,
+                     'confidence': 0.97}], T0 + timedelta(hours=1))
+    db.session.commit()
+
+    assert [p['user_id'] for p in stored_patterns()] == ['u2', 'u2', 'u1']
+    assert [p['signature'] for p in stored_patterns(user_id='u2', pattern_type='favorite_page')] == ['/home']
+    assert stored_patterns(user_id='u2', pattern_type='favorite_page')[0]['frequency'] == 9
+    assert len(stored_patterns(since=T0 + timedelta(minutes=30))) == 2
+    assert len(stored_patterns(limit=1)) == 1
+
+
+def test_compact_upgrades_legacy_table(app):
+    # behavior_patterns as written before the pattern key existed
+    db.session.execute(text('DROP TABLE behavior_patterns'))
+    db.session.execute(text(
+        'CREATE TABLE behavior_patterns (id INTEGER PRIMARY KEY, user_id VARCHAR(100) NOT NULL, '
+        'pattern_type VARCHAR(100) NOT NULL, confidence FLOAT NOT NULL, details JSON, detected_at DATETIME)'
+    ))
+    legacy = [('u1', ['a', 'b', 'c'], 2), ('u1', ['a', 'b', 'c'], 4), ('u1', ['x', 'y', 'z'], 1),
+              ('u2', ['a', 'b', 'c'], 1), ('u1', ['a', 'b', 'c'], 6)]
+    db.session.execute(text(
+        "INSERT INTO behavior_patterns (user_id, pattern_type, confidence, details, detected_at) "
+        "VALUES (:user_id, 'common_sequence', 0.97, :details, :detected_at)"
+    ), [{'user_id': user_id, 'details': json.dumps({'sequence': seq, 'frequency': freq}),
+         'detected_at': T0 + timedelta(minutes=i)} for i, (user_id, seq, freq) in enumerate(legacy)])
+    db.session.commit()
+    assert not is_compacted()
+
+    assert compact() == {'backfilled': 5, 'removed': 2}
+    assert is_compacted()
+    rows = db.session.execute(text(
+        'SELECT user_id, signature, frequency FROM behavior_patterns ORDER BY id')).all()
+    assert [tuple(r) for r in rows] == [('u1', 'x>y>z', 1), ('u2', 'a>b>c', 1), ('u1', 'a>b>c', 6)]
+    assert compact() == {'backfilled': 0, 'removed': 0}
+
+    # Upserts work against the upgraded table
+    store_patterns([_sequence('u1', ('a', 'b', 'c'), 7)], T0 + timedelta(days=1))
+    db.session.commit()
+    assert BehaviorPattern.query.filter_by(user_id='u1', signature='a>b>c').one().frequency == 7
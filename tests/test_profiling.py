@@ -0,0 +1,108 @@
+"""
+Tests for the request profiler and slow-query log.
+"""
+import time
+from datetime import datetime
+from flask import request
+import profiling
+from database import db, UserInteraction
+
+
+def _busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_profile_requests(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path / 'profiles'))
+    profiling.init_app(app, profiling=True)
+
+    @app.route('/work')
+    def work():
+        _busy(0.1)
+        return {'done': True}
+
+    client = app.test_client()
+    plain = client.get('/work')
+    assert plain.get_json() == {'done': True}
+    assert 'X-Profile-Id' not in plain.headers
+
+    returned = client.get('/work', headers={'X-Profile': 'return'})
+    assert returned.mimetype == 'text/plain'
+    assert int(returned.headers['X-Profile-Samples']) > 0
+    line = returned.get_data(as_text=True).splitlines()[0]
+    stack, count = line.rsplit(' ', 1)
+    assert int(count) > 0 and '_busy (test_profiling.py' in stack
+
+    stored = client.get('/work?profile=1')
+    assert stored.get_json() == {'done': True}
+    profile_id = stored.headers['X-Profile-Id']
+    assert profiling.list_profiles() == [profile_id]
+    assert '_busy' in profiling.load_profile(profile_id)
+    assert profiling.load_profile('../etc/passwd') is None
+
+
+def test_profile_token(app, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_TOKEN', 'secret')
+    profiling.init_app(app, profiling=True)
+
+    @app.route('/work')
+    def work():
+        return {'done': True}
+
+    client = app.test_client()
+    assert client.get('/work', headers={'X-Profile': 'return'}).is_json
+    assert client.get('/work', headers={'X-Profile': 'return:wrong'}).is_json
+    assert client.get('/work?profile=return:s\u00e9cret').is_json
+    assert client.get('/work', headers={'X-Profile': 'return:secret'}).mimetype == 'text/plain'
+
+
+def test_slow_query_log_captures_plan(app):
+    log = profiling.SlowQueryLog(threshold_ms=0, path=None)
+    log.attach(db.engine)
+    for i in range(3):
+        db.session.add(UserInteraction(user_id=f'u{i}', action='click', page='/home',
+                                       timestamp=datetime(2024, 1, 1)))
+    db.session.commit()
+    for user_ids in (['u0'], ['u0', 'u1'], ['u0', 'u1', 'u2']):
+        UserInteraction.query.filter(UserInteraction.user_id.in_(user_ids)).all()
+
+    top = log.top(sort='count')
+    select = next(s for s in top if s['statement'].startswith('SELECT') and 'IN' in s['statement'])
+    # Expanded IN lists of different lengths group as one statement
+    assert select['count'] == 3
+    assert 'IN (?...)' in select['statement']
+    assert any('user_id' in line for line in select['plan'])
+    assert select['route'] is None
+    assert log.top(limit=1, sort='max_ms')[0]['max_ms'] == max(s['max_ms'] for s in top)
+    assert any(entry['statement'].startswith('INSERT') for entry in log.recent)
+
+
+def test_failed_explain_leaves_the_transaction_usable(app):
+    log = profiling.SlowQueryLog(threshold_ms=0, path=None)
+    db.session.add(UserInteraction(user_id='u1', action='click', page='/home', timestamp=datetime(2024, 1, 1)))
+    db.session.flush()
+    conn = db.session.connection()
+    cursor = conn.connection.dbapi_connection.cursor()
+
+    plan = log._explain(conn, cursor, 'SELECT * FROM missing_table', ())
+    assert plan[0].startswith('EXPLAIN failed')
+    assert log._explain(conn, cursor, 'SELECT * FROM user_interactions WHERE user_id = ?', ('u1',))
+    # The flushed row survives the failed EXPLAIN and commits
+    db.session.commit()
+    assert UserInteraction.query.filter_by(user_id='u1').count() == 1
+
+
+def test_debug_endpoints_need_profiling_and_token(app, monkeypatch):
+    def allowed(headers=None):
+        with app.test_request_context('/api/debug/slow-queries', headers=headers or {}):
+            return profiling.debug_allowed(request)
+
+    monkeypatch.setattr(profiling, 'PROFILING_ENABLED', False)
+    assert not allowed()
+    monkeypatch.setattr(profiling, 'PROFILING_ENABLED', True)
+    assert allowed()
+    monkeypatch.setattr(profiling, 'PROFILE_TOKEN', 'secret')
+    assert not allowed() and not allowed({'X-Profile-Token': 'wrong'})
+    assert allowed({'X-Profile-Token': 'secret'})
@@ -0,0 +1,82 @@
+"""
+Tests for routing read-only analytics queries to a replica, read-only pool or snapshot.
+"""
+import os
+import time
+import pytest
+from flask import jsonify
+from sqlalchemy.exc import OperationalError
+from database import db, UserInteraction
+import read_routing
+from read_routing import ReadRoutes, reading
+
+
+def _track(user_id):
+    db.session.add(UserInteraction(user_id=user_id, action='click', page='/home'))
+    db.session.commit()
+
+
+def test_readonly_pool(app):
+    read_routing.init_app(app, mode='readonly')
+    routes = app.extensions['read_routing']
+    _track('u1')
+    assert db.session.execute(db.text('PRAGMA journal_mode')).scalar() == 'wal'
+
+    with reading() as (source, staleness):
+        assert (source, staleness) == ('readonly', 0.0)
+        assert db.session.get_bind() is routes.engine
+        assert UserInteraction.query.count() == 1
+        db.session.add(UserInteraction(user_id='u2', action='click', page='/home'))
+        with pytest.raises(OperationalError):
+            db.session.flush()
+    # The app's own session is back afterwards
+    assert db.session.get_bind() is db.engine
+    with reading(max_staleness=0) as (source, _):
+        assert source == 'primary'
+    routes.dispose()
+
+
+def test_snapshot_refreshes_when_too_stale(app):
+    read_routing.init_app(app, mode='snapshot')
+    routes = app.extensions['read_routing']
+    _track('u1')
+    with reading(max_staleness=60) as (source, _):
+        assert source == 'snapshot' and UserInteraction.query.count() == 1
+
+    _track('u2')
+    with reading(max_staleness=60) as (source, staleness):
+        # Within the accepted staleness the snapshot is served as is
+        assert source == 'snapshot' and staleness < 60
+        assert UserInteraction.query.count() == 1
+    past = time.time() - 120
+    os.utime(routes.snapshot_path, (past, past))
+    with reading(max_staleness=60):
+        assert UserInteraction.query.count() == 2
+    routes.dispose()
+
+
+def test_replica_and_routed_views(app, tmp_path):
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    read_routing.init_app(app, mode='replica', url=replica_url)
+    routes = app.extensions['read_routing']
+    db.metadata.create_all(routes.engine)
+    _track('u1')
+
+    @app.route('/count')
+    @read_routing.routed
+    def count():
+        return jsonify({'count': UserInteraction.query.count()})
+
+    client = app.test_client()
+    response = client.get('/count')
+    assert response.json == {'count': 0} and response.headers['X-Read-Source'] == 'replica'
+    response = client.get('/count', headers={'X-Max-Staleness': '0'})
+    assert response.json == {'count': 1} and response.headers['X-Read-Source'] == 'primary'
+    assert client.get('/count?max_staleness=soon').status_code == 400
+
+    # An unreachable replica sends reads to the primary
+    unreachable = ReadRoutes(db.engine, 'replica', f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    assert unreachable.select(30)[1] == 'primary'
+    with pytest.raises(ValueError):
+        ReadRoutes(db.engine, 'replica')
+    routes.dispose()
@@ -0,0 +1,63 @@
+"""
+Tests for backlog-driven pipeline scheduling.
+"""
+from datetime import datetime, timedelta
+import pytest
+from database import db, UserInteraction
+from scheduling import AdaptiveSchedule, measure_backlog
+
+
+def test_backs_off_when_idle_and_runs_back_to_back_when_behind():
+    schedule = AdaptiveSchedule(min_delay=1, max_delay=8, batch_size=1000, cycle_cpu=2, max_cpu=1.0)
+    assert [schedule.after_cycle(0, False, 0.01) for _ in range(5)] == [1, 2, 4, 8, 8]
+
+    # Work resets the backoff; remaining backlog means no wait at all
+    assert schedule.after_cycle(500, True, 0.5) == 0
+    assert schedule.after_cycle(0, False, 0.01) == 1
+    assert schedule.after_cycle(200, False, 0.1) == 1
+    assert schedule.after_cycle(0, False, 0.01) == 1
+
+
+def test_caps_cpu_per_cycle():
+    schedule = AdaptiveSchedule(min_delay=1, max_delay=60, batch_size=10000, min_batch=500,
+                                cycle_cpu=2, max_cpu=0.5)
+    # A cycle over budget shrinks the batch; at 50% CPU the pause matches the CPU time used
+    assert schedule.after_cycle(10000, True, 8.0) == pytest.approx(8.0)
+    assert schedule.batch_size == 2500
+    assert schedule.after_cycle(2500, True, 100.0) == pytest.approx(100.0)
+    assert schedule.batch_size == 500
+    # Cheap cycles grow it back, but never past the configured size
+    for _ in range(10):
+        schedule.after_cycle(500, True, 0.1)
+    assert schedule.batch_size == 10000
+    with pytest.raises(ValueError):
+        AdaptiveSchedule(max_cpu=0)
+
+
+def test_measure_backlog(app):
+    now = datetime(2024, 1, 1, 12, 0)
+    assert measure_backlog(0, now) == {'rows': 0, 'newest_id': 0, 'lag_seconds': 0.0}
+    for minutes in (30, 20, 10):
+        db.session.add(UserInteraction(user_id='u', action='click', page='/home',
+                                       timestamp=now - timedelta(minutes=minutes)))
+    db.session.commit()
+    assert measure_backlog(0, now) == {'rows': 3, 'newest_id': 3, 'lag_seconds': 1800.0}
+    assert measure_backlog(1, now) == {'rows': 2, 'newest_id': 3, 'lag_seconds': 1200.0}
+    assert measure_backlog(3, now)['rows'] == 0
+
+
+def test_measure_backlog_counts_rows_rolled_before_they_were_processed(app):
+    from partitions import partition_manager
+    from sessions import Sessionizer
+    start = datetime(2024, 1, 1)
+    db.session.add_all(UserInteraction(user_id=f'u{i % 7}', action='click', page='/home',
+                                       timestamp=start + timedelta(minutes=i)) for i in range(100))
+    db.session.commit()
+    sessionizer = Sessionizer()
+    assert len(sessionizer.update(max_events=30)) == 30
+    db.session.commit()
+
+    assert partition_manager.roll(now=datetime(2024, 3, 1)) == 100
+    backlog = measure_backlog(sessionizer.watermark(), now=datetime(2024, 1, 2))
+    assert backlog == {'rows': 70, 'newest_id': 100, 'lag_seconds': (24 * 60 - 30) * 60.0}
+    assert len(sessionizer.pending()) == 70
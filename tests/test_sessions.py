@@ -0,0 +1,63 @@
+"""
+Tests for vectorized sessionization and the incremental sessions table.
+"""
+from datetime import datetime, timedelta
+import numpy as np
+from database import db, UserInteraction, UserSession
+from sessions import Sessionizer, assign_sessions
+
+BASE = datetime(2024, 1, 1, 9, 0)
+
+
+def _track(user_id, page, minutes):
+    db.session.add(UserInteraction(user_id=user_id, action='page_view', page=page,
+                                   meta_data={}, timestamp=BASE + timedelta(minutes=minutes)))
+    db.session.commit()
+
+
+def test_assign_sessions_splits_on_user_and_gap():
+    users = np.array(['a', 'a', 'a', 'b', 'b'])
+    ts = np.array([BASE, BASE + timedelta(minutes=10), BASE + timedelta(hours=2),
+                   BASE, BASE + timedelta(minutes=5)], dtype='datetime64[ns]')
+    assert list(assign_sessions(users, ts, timedelta(minutes=30))) == [0, 0, 1, 2, 2]
+
+
+def test_update_extends_open_session_incrementally(app):
+    sessionizer = Sessionizer(gap=timedelta(minutes=30))
+    _track('u1', '/home', 0)
+    _track('u1', '/products', 10)
+    _track('u2', '/home', 0)
+    events = sessionizer.update()
+    db.session.commit()
+    assert len(events) == 3
+    assert UserSession.query.count() == 2
+
+    # Continues u1's session, then a new one after a long gap
+    _track('u1', '/checkout', 25)
+    _track('u1', '/home', 200)
+    events = sessionizer.update()
+    db.session.commit()
+    assert len(events) == 2
+
+    sessions = UserSession.query.filter_by(user_id='u1').order_by(UserSession.start_time).all()
+    assert [s.event_count for s in sessions] == [3, 1]
+    assert sessions[0].entry_page == '/home'
+    assert sessions[0].exit_page == '/checkout'
+    assert sessionizer.watermark() == UserInteraction.query.count()
+
+
+def test_batches_are_bounded_by_rows_across_id_gaps(app):
+    sessionizer = Sessionizer(gap=timedelta(minutes=30))
+    _track('u1', '/home', 0)
+    # Ids 2..4999 were never committed (e.g. a rolled-back import)
+    db.session.add(UserInteraction(id=5000, user_id='u2', action='page_view', page='/home',
+                                   meta_data={}, timestamp=BASE))
+    db.session.commit()
+    _track('u3', '/home', 0)
+
+    assert list(sessionizer.update(max_events=2)['user_id']) == ['u1', 'u2']
+    db.session.commit()
+    assert sessionizer.watermark() == 5000
+    assert list(sessionizer.update(max_events=2)['user_id']) == ['u3']
+    db.session.commit()
+    assert len(sessionizer.update(max_events=2)) == 0
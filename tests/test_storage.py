@@ -0,0 +1,43 @@
+"""
+Tests for backend-specific storage profiles.
+"""
+import pytest
+from flask import Flask
+from database import db
+import storage
+
+
+def _app(tmp_path, profile):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / f'{profile}.db'}"
+    storage.init_app(app, profile)
+    return app
+
+
+def _pragmas(app):
+    with app.app_context():
+        values = {name: db.session.execute(db.text(f'PRAGMA {name}')).scalar()
+                  for name in ('journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'busy_timeout')}
+        db.session.remove()
+        return values
+
+
+def test_sqlite_pragmas(tmp_path):
+    assert _pragmas(_app(tmp_path, 'production')) == {
+        'journal_mode': 'wal', 'synchronous': 1, 'mmap_size': storage.SQLITE_MMAP_SIZE,
+        'cache_size': storage.SQLITE_CACHE_SIZE, 'busy_timeout': storage.SQLITE_BUSY_TIMEOUT_MS,
+    }
+    plain = _pragmas(_app(tmp_path, 'plain'))
+    assert (plain['journal_mode'], plain['synchronous'], plain['mmap_size']) == ('delete', 2, 0)
+
+
+def test_engine_options():
+    assert storage.engine_options('sqlite:///x.db', 'production') == {'connect_args': {'timeout': 5.0}}
+    pg = storage.engine_options('postgresql://u:p@db/app', 'production')
+    assert pg['pool_size'] == storage.DB_POOL_SIZE and pg['pool_pre_ping'] is True
+    # Server-side prepared statements only with psycopg 3 (SQLAlchemy 2.1's default driver)
+    assert pg['connect_args'] == {'prepare_threshold': 2}
+    assert 'connect_args' not in storage.engine_options('postgresql+psycopg2://u:p@db/app', 'production')
+    assert storage.engine_options('postgresql://u:p@db/app', 'plain') == {}
+    with pytest.raises(ValueError):
+        storage.engine_options('sqlite:///x.db', 'fast')
@@ -0,0 +1,55 @@
+"""
+Tests for the synthetic event generator.
+"""
+import json
+from datetime import datetime
+import pandas as pd
+import pytest
+from synthetic import SyntheticEvents
+from importer import import_file
+from queries import interactions_frame
+
+END = datetime(2024, 3, 1)
+
+
+def _frame(**kwargs):
+    return pd.concat(list(SyntheticEvents(end=END, **kwargs).chunks()), ignore_index=True)
+
+
+def test_generator_is_reproducible_and_time_ordered():
+    df = _frame(events=20000, days=14, seed=3, chunk_size=6000)
+    assert len(df) == 20000
+    assert df['timestamp'].is_monotonic_increasing
+    assert df['timestamp'].min() >= pd.Timestamp(2024, 2, 16) and df['timestamp'].max() < pd.Timestamp(2024, 3, 2)
+    pd.testing.assert_frame_equal(df, _frame(events=20000, days=14, seed=3, chunk_size=6000))
+    assert not df.equals(_frame(events=20000, days=14, seed=4, chunk_size=6000))
+
+    meta = json.loads(df['metadata'][0])
+    assert set(meta) == {'session_duration', 'device', 'referrer', 'scroll_depth', 'clicks'}
+
+
+def test_generator_distributions():
+    df = _frame(events=50000, users=2000, days=28, seed=0)
+    # Zipfian users: the most active user dwarfs the median user
+    counts = df['user_id'].value_counts()
+    assert counts.iloc[0] > 20 * counts.median()
+    # Diurnal and weekly seasonality
+    hours = df['timestamp'].dt.hour.value_counts()
+    assert hours[14] > 3 * hours[3]
+    days = df['timestamp'].dt.dayofweek.value_counts()
+    assert days[2] > days[6]
+    # Funnel-shaped sequences: checkouts happen on the checkout page
+    assert set(df.loc[df['action'] == 'checkout', 'page']) == {'/checkout'}
+
+
+def test_writes_to_database_and_parquet(app, tmp_path):
+    pytest.importorskip('pyarrow')
+    generator = SyntheticEvents(3000, days=7, end=END, seed=1, chunk_size=1000)
+    assert generator.to_database() == 3000
+    assert len(interactions_frame()) == 3000
+
+    path = str(tmp_path / 'events.parquet')
+    assert generator.to_parquet(path) == 3000
+    assert import_file(path)['rows'] == 3000
+    df = interactions_frame()
+    assert list(df['user_id'][:3000]) == list(df['user_id'][3000:])
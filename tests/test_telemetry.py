@@ -0,0 +1,64 @@
+"""
+Tests for pipeline telemetry and the pipeline_status table.
+"""
+from datetime import datetime, timedelta
+import pytest
+from telemetry import PipelineTelemetry, RollingWindow, pipeline_status, summarize
+
+
+def test_rolling_window_summary_and_expiry():
+    window = RollingWindow(seconds=60)
+    for i, value in enumerate([5, 1, 4, 2, 3]):
+        window.add(value, at=100 + i)
+    summary = window.summary(now=104)
+    assert summary == {'count': 5, 'last': 3, 'mean': 3, 'p50': 3, 'p95': 5, 'max': 5}
+    # Samples older than the window drop out
+    assert window.summary(now=162)['count'] == 3
+    assert window.summary(now=1000)['last'] is None
+
+
+def test_records_stages_throughput_and_lag():
+    telemetry = PipelineTelemetry('w1', window_seconds=60)
+    with telemetry.stage('fetch'):
+        pass
+    with telemetry.stage('analyze'):
+        pass
+    newest = datetime.utcnow() - timedelta(seconds=30)
+    telemetry.record_cycle(2.0, rows=1000, patterns=4, newest_event=newest,
+                           backlog={'rows': 50, 'newest_id': 1050, 'lag_seconds': 12.0})
+    telemetry.record_cycle(1.0, error=RuntimeError('database is locked'))
+
+    snapshot = telemetry.snapshot()
+    assert snapshot['cycles'] == {'ok': 1, 'failed': 1, 'success_rate': 0.5}
+    assert snapshot['stages']['fetch']['count'] == 1 and snapshot['stages']['persist']['count'] == 0
+    assert snapshot['rows_per_second']['last'] == 500
+    assert snapshot['patterns_per_cycle']['last'] == 4
+    assert snapshot['lag_seconds']['last'] == pytest.approx(30, abs=5)
+    assert snapshot['backlog_rows'] == 50
+    assert snapshot['last_error']['message'] == 'database is locked'
+
+
+def test_publish_and_read_status(app):
+    fresh = PipelineTelemetry('fresh', publish_seconds=60)
+    fresh.record_cycle(1.0, rows=200, newest_event=datetime.utcnow())
+    assert fresh.publish()
+    assert not fresh.publish()  # throttled
+    old = PipelineTelemetry('old')
+    old.record_cycle(1.0, rows=100)
+    old.publish()
+
+    later = datetime.utcnow() + timedelta(seconds=30)
+    status = pipeline_status(stale_after=10, now=later)
+    assert {w['worker_id'] for w in status} == {'fresh', 'old'}
+    assert all(w['stale'] for w in status)
+    assert summarize(status)['active'] == 0
+
+    status = pipeline_status(stale_after=60, now=later)
+    summary = summarize(status)
+    assert summary['active'] == 2 and summary['success_rate'] == 1.0
+    assert summary['rows_per_second'] == 300
+
+    fresh.publish('stopped', force=True)
+    status = pipeline_status(stale_after=60, now=later)
+    assert next(w for w in status if w['worker_id'] == 'fresh')['state'] == 'stopped'
+    assert summarize(status)['active'] == 1
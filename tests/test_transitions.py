@@ -0,0 +1,44 @@
+"""
+Tests for the incremental page transition matrix.
+"""
+from datetime import datetime, timedelta
+from database import db, UserInteraction
+from sessions import Sessionizer
+from transitions import TransitionIndex, record_transitions
+
+BASE = datetime(2024, 1, 1, 9, 0)
+
+
+def _track(user_id, page, minutes):
+    db.session.add(UserInteraction(user_id=user_id, action='page_view', page=page,
+                                   meta_data={}, timestamp=BASE + timedelta(minutes=minutes)))
+    db.session.commit()
+
+
+def _run_batch(sessionizer):
+    record_transitions(sessionizer.update())
+    db.session.commit()
+
+
+def test_transitions_accumulate_across_batches(app):
+    sessionizer = Sessionizer(gap=timedelta(minutes=30))
+    _track('a', '/home', 0)
+    _track('a', '/products', 1)
+    _track('b', '/home', 0)
+    _track('b', '/products', 2)
+    _run_batch(sessionizer)
+
+    # a's session continues from /products in the next batch
+    _track('a', '/checkout', 3)
+    _track('b', '/blog', 4)
+    _run_batch(sessionizer)
+
+    index = TransitionIndex.load()
+    assert index.next_pages('/home') == [{'page': '/products', 'count': 2, 'probability': 1.0}]
+    assert {p['page'] for p in index.next_pages('/products')} == {'/checkout', '/blog'}
+    assert index.top_paths(limit=1, length=2) == [{'path': ['/home', '/products'], 'count': 2.0}]
+    assert index.top_paths(limit=2, length=3)[0]['count'] == 1.0
+
+    exits = {e['page']: e['exit_rate'] for e in index.exit_rates()}
+    assert exits['/checkout'] == 1.0
+    assert exits['/products'] == 0.0
@@ -0,0 +1,166 @@
+"""
+Page transition (Markov) matrix.
+
+Counts of "next page within a session" are accumulated in the
+``page_transitions`` table from each sessionized pipeline batch. Readers use
+a ``TransitionIndex``: a sparse matrix loaded from that table with every row
+pre-sorted, so next-page, path and exit-rate lookups never touch raw events.
+"""
+
+import os
+import time
+import threading
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+from database import db, dialect_insert, PageTransition, UserSession
+
+
+def record_transitions(events):
+    """
+    Add the transitions in a sessionized batch to ``page_transitions``.
+
+    Args:
+        events: Output of ``Sessionizer.update`` (needs page and prev_page)
+
+    Returns:
+        Number of distinct (from_page, to_page) pairs updated. The caller
+        commits.
+    """
+    if events.empty:
+        return 0
+    pairs = events.loc[events['prev_page'].notna(), ['prev_page', 'page']]
+    if pairs.empty:
+        return 0
+
+    # Sorted so concurrent pipeline workers lock rows in the same order
+    counts = pairs.groupby(['prev_page', 'page']).size()
+    stmt = dialect_insert(PageTransition)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PageTransition.from_page, PageTransition.to_page],
+        set_={'count': PageTransition.count + stmt.excluded.count}
+    )
+    db.session.execute(stmt, [
+        {'from_page': src, 'to_page': dst, 'count': int(n)}
+        for (src, dst), n in counts.items()
+    ])
+    return len(counts)
+
+
+class TransitionIndex:
+    """
+    In-memory view of the transition matrix with precomputed lookups.
+
+    ``get`` returns a shared instance that is rebuilt from the database at
+    most once every ``ttl`` seconds.
+    """
+
+    _shared = None
+    _lock = threading.Lock()
+
+    def __init__(self, pages, matrix, entries, exits):
+        self.pages = pages
+        self.page_index = {page: i for i, page in enumerate(pages)}
+        self.matrix = matrix
+        self.loaded_at = time.monotonic()
+
+        out_totals = np.asarray(matrix.sum(axis=1)).ravel()
+        in_totals = np.asarray(matrix.sum(axis=0)).ravel()
+        self.views = in_totals + entries
+        self.exits = exits
+
+        # Pre-sort every row so next-page lookups are a dict hit and a slice
+        self._next = {}
+        for i, page in enumerate(pages):
+            start, end = matrix.indptr[i], matrix.indptr[i + 1]
+            cols, counts = matrix.indices[start:end], matrix.data[start:end]
+            order = np.argsort(-counts, kind='stable')
+            total = out_totals[i]
+            self._next[page] = [
+                {'page': pages[c], 'count': int(n), 'probability': float(n / total)}
+                for c, n in zip(cols[order], counts[order])
+            ]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = np.where(self.views > 0, exits / self.views, 0.0)
+        order = np.argsort(-rates, kind='stable')
+        self._exit_rates = [
+            {'page': pages[i], 'exit_rate': float(rates[i]), 'exits': int(exits[i]), 'views': int(self.views[i])}
+            for i in order if self.views[i] > 0
+        ]
+
+    @classmethod
+    def load(cls):
+        """Build an index from ``page_transitions`` and ``sessions``."""
+        from scipy import sparse
+
+        transitions = pd.DataFrame(
+            db.session.execute(select(PageTransition.from_page, PageTransition.to_page, PageTransition.count)).all(),
+            columns=['from_page', 'to_page', 'count']
+        )
+        entries = dict(db.session.execute(
+            select(UserSession.entry_page, func.count()).group_by(UserSession.entry_page)
+        ).all())
+        exits = dict(db.session.execute(
+            select(UserSession.exit_page, func.count()).group_by(UserSession.exit_page)
+        ).all())
+
+        pages = sorted(set(transitions['from_page']) | set(transitions['to_page']) | set(entries) | set(exits))
+        pages = [p for p in pages if p is not None]
+        index = {page: i for i, page in enumerate(pages)}
+        rows = transitions['from_page'].map(index).to_numpy(dtype='int64')
+        cols = transitions['to_page'].map(index).to_numpy(dtype='int64')
+        matrix = sparse.csr_matrix(
+            (transitions['count'].to_numpy(dtype='int64'), (rows, cols)), shape=(len(pages), len(pages))
+        )
+        entry_counts = np.array([entries.get(p, 0) for p in pages], dtype='int64')
+        exit_counts = np.array([exits.get(p, 0) for p in pages], dtype='int64')
+        return cls(pages, matrix, entry_counts, exit_counts)
+
+    @classmethod
+    def get(cls, ttl=None):
+        """Return the shared index, reloading it if older than ``ttl`` seconds."""
+        ttl = ttl if ttl is not None else int(os.getenv('TRANSITION_INDEX_TTL', 30))
+        shared = cls._shared
+        if shared is None or time.monotonic() - shared.loaded_at > ttl:
+            with cls._lock:
+                if cls._shared is shared:
+                    cls._shared = cls.load()
+                shared = cls._shared
+        return shared
+
+    def next_pages(self, page, limit=5):
+        """Most likely next pages after ``page``."""
+        return self._next.get(page, [])[:limit]
+
+    def exit_rates(self, limit=10):
+        """Pages ranked by the share of views that end a session."""
+        return self._exit_rates[:limit]
+
+    def top_paths(self, limit=10, length=2):
+        """
+        Most frequent navigation paths.
+
+        Two-page paths are exact transition counts. Longer paths extend the
+        strongest transitions along their most likely continuations, scoring
+        each by its expected count under the Markov model.
+        """
+        if length < 2:
+            raise ValueError('length must be at least 2')
+        coo = self.matrix.tocoo()
+        if coo.nnz == 0:
+            return []
+
+        beam = max(limit * 5, 20)
+        top = np.argsort(-coo.data, kind='stable')[:beam]
+        paths = [([self.pages[coo.row[i]], self.pages[coo.col[i]]], float(coo.data[i])) for i in top]
+
+        for _ in range(length - 2):
+            extended = []
+            for path, score in paths:
+                for nxt in self._next.get(path[-1], [])[:limit]:
+                    extended.append((path + [nxt['page']], score * nxt['probability']))
+            extended.sort(key=lambda p: -p[1])
+            paths = extended[:beam]
+
+        return [{'path': path, 'count': round(score, 2)} for path, score in paths[:limit]]
@@ -0,0 +1,93 @@
+"""
+Production entry point for the Flask API under gunicorn.
+
+    gunicorn -c gunicorn.conf.py 'wsgi:create_app()'
+
+``create_app`` prepares the database (``bootstrap.initialize``, which is
+safe when several processes start at once), imports the heavy analysis
+libraries and returns the ``flask_app`` application. With
+``preload_app`` (the default in ``gunicorn.conf.py``) this runs once in the
+gunicorn master before it forks, so workers share the imported modules
+copy-on-write and none of them pays the import on its first request;
+``after_fork`` then drops the database connections each worker inherited.
+"""
+
+import importlib
+import os
+
+INIT_ON_START = os.getenv('INIT_ON_START', '1') == '1'
+PRELOAD_MODULES = [name.strip() for name in
+                   os.getenv('PRELOAD_MODULES', 'pandas,numpy,scipy.sparse,sklearn.preprocessing').split(',')
+                   if name.strip()]
+
+
+def preload_modules(names=None):
+    """
+    Import modules the request handlers load lazily.
+
+    Args:
+        names: Module names (default: ``PRELOAD_MODULES``)
+
+    Returns:
+        List of the modules that could be imported
+    """
+    loaded = []
+    for name in PRELOAD_MODULES if names is None else names:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except ImportError as e:
+            print(f"Not preloading {name}: {e}")
+    return loaded
+
+
+def create_app(initialize=INIT_ON_START, preload=True):
+    """
+    Build the API application for a WSGI server.
+
+    Args:
+        initialize: Run ``bootstrap.initialize`` (schema, upgrades, demo data)
+        preload: Import ``PRELOAD_MODULES`` before serving
+
+    Returns:
+        The Flask application
+    """
+    from flask_app import app
+    from database import db
+    import bootstrap
+
+    if initialize:
+        bootstrap.initialize(app)
+    if preload:
+        preload_modules()
+    with app.app_context():
+        # Close the connections opened so far rather than share them with forked workers
+        db.engine.dispose()
+    return app
+
+
+def after_fork(threads=None, metrics_dir=None):
+    """
+    Forget pooled connections inherited from the parent process.
+
+    Call in every forked worker. The parent still owns those connections,
+    so they are dropped from the pools without being closed.
+
+    Args:
+        threads: Request threads in the worker, to cap live streams below
+        metrics_dir: Directory through which the workers' metrics are merged
+    """
+    from flask_app import app
+    from database import db
+    import live
+    import metrics
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+    routes = app.extensions.get('read_routing')
+    if routes is not None and routes.engine is not None:
+        routes.engine.dispose(close=False)
+    if threads is not None:
+        live.reserve_threads(app, threads)
+    if metrics_dir and metrics.ENABLED:
+        metrics.enable_multiprocess(metrics_dir)